@@ -0,0 +1,324 @@
+__title__ = "benchmark"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import NoReturn, Any, Dict, List, Optional, Tuple
+
+from synthetic import generate_dataset, write_daily_files
+
+
+# Stages of main() to benchmark, in the order they are run, with the flags of config to set, the
+# function of main to call and the rows read by the stage to compute rows/s: 'flukso' (all files
+# of CDB and ECH), 'homes' (files of homes, without aggregations and communal files), 'rtu' or
+# None when the stage reads only a part of the files or of the days.
+STAGES: Dict[str, Tuple[Dict[str, Any], str, Optional[str]]] = {
+    'concat_data': ({'FLUKSO': True}, 'manage_concat', 'flukso'),
+    'resample_dataset': ({'FLUKSO': True, 'RESAMPLE': True}, 'manage_flukso_data', 'flukso'),
+    'compute_alert_reaction': ({}, 'compute_alert_reaction', 'homes'),
+    'auto_consumption': ({}, 'auto_consumption', 'flukso'),
+    'check_empty_date': ({}, 'check_empty_date', 'flukso'),
+    'plot_median_quantile': (
+        {'FLUKSO': True, 'PLOT_MEDIAN_QUANTILE_FLUKSO': True}, 'all_plots', None
+    ),
+    'plot_average': (
+        {'FLUKSO': True, 'PLOT_AVERAGE': True, 'AVERAGE_COMMUNITY': True,
+         'AVERAGE_COMMUNITIES': True},
+        'all_plots',
+        None
+    ),
+    'plot_mean_wednesday': ({'FLUKSO': True, 'MEAN_WED_FLUKSO': True}, 'all_plots', None),
+    'plot_rtu': ({'RTU': True, 'PLOT_MEDIAN_QUANTILE_RTU': True}, 'all_plots', 'rtu')
+}
+
+# Sizes of the datasets as (number of homes, number of months). Larger sizes (e.g. 500 homes
+# and 36 months) can be given on the command line.
+SIZES: List[Tuple[int, int]] = [(10, 1), (64, 1), (64, 12)]
+
+# First month of the synthetic datasets. It contains the day of plot_average (2022-08-23).
+START: str = '2022-08'
+
+# Relative slowdown (or growth of memory) above which a stage is flagged
+TOLERANCE: float = 0.2
+
+
+# --------------------------------------- #
+# ----------BENCHMARK FUNCTIONS---------- #
+# --------------------------------------- #
+
+
+def peak_rss(who: int) -> float:
+    """
+    Give the peak resident set size of the process or of its largest child in MB.
+
+    :param who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN.
+
+    :return:    Return the peak RSS.
+    """
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    scale: int = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(who).ru_maxrss / scale
+
+
+def run_stage(stage: str, result_path: str) -> NoReturn:
+    """
+    Run a stage in the current process and save its measures in a JSON file. config is imported
+    and its flags are set before main, so every module sees them. This function is called in a
+    new process for each stage, so the peak RSS only belongs to the stage.
+
+    :param stage:       Name of the stage.
+    :param result_path: Path of the JSON file of the measures.
+    """
+    import config
+    flags, function, _ = STAGES[stage]
+    for flag, value in flags.items():
+        setattr(config, flag, value)
+    os.makedirs(config.PLOT_PATH, exist_ok=True)
+    import main
+    wall: float = time.perf_counter()
+    cpu: float = time.process_time()
+    getattr(main, function)()
+    measures: Dict[str, float] = {
+        'wall': time.perf_counter() - wall,
+        'cpu': time.process_time() - cpu,
+        'peak_rss_mb': peak_rss(resource.RUSAGE_SELF),
+        'peak_rss_workers_mb': peak_rss(resource.RUSAGE_CHILDREN)
+    }
+    with open(result_path, 'w') as f:
+        json.dump(measures, f)
+
+
+def count_rows(dataset: str) -> Dict[str, int]:
+    """
+    Count the rows of the files of a dataset, as read by the stages.
+
+    :param dataset: Folder of the dataset.
+
+    :return:        Return the number of rows of all files of CDB and ECH ('flukso'), of the
+                    files of homes ('homes') and of the RTU file ('rtu').
+    """
+    rows: Dict[str, int] = {'flukso': 0, 'homes': 0, 'rtu': 0}
+    for community in ['CDB', 'ECH', 'RTU']:
+        for file in os.listdir(f"{dataset}/{community}"):
+            with open(f"{dataset}/{community}/{file}", 'rb') as f:
+                nb_rows: int = sum(1 for _ in f) - 1
+            if community == 'RTU':
+                rows['rtu'] += nb_rows
+                continue
+            rows['flukso'] += nb_rows
+            # Same homes as ALL_HOMES_CDB and ALL_ECH of config
+            if (file[:3] == 'CDB' and file[:4] != 'CDBA') or file[:4] == 'ECHL':
+                rows['homes'] += nb_rows
+    return rows
+
+
+def prepare_dataset(
+    work: str, nb_homes: int, nb_months: int, seed: int
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Generate the synthetic dataset of a size, unless the same one is already in the folder. About
+    70% of homes are in CDB and the others in ECH. The number of rows is counted once and saved
+    with the parameters of the dataset.
+
+    :param work:        Folder of the benchmarks.
+    :param nb_homes:    Number of homes.
+    :param nb_months:   Number of months.
+    :param seed:        Seed of the generator.
+
+    :return:            Return the path used as NEXT_CLOUD and the number of rows given by
+                        count_rows.
+    """
+    root: str = f"{work}/{nb_homes}x{nb_months}"
+    dataset: str = f"{root}/datasets/dataset"
+    parameters: Dict[str, Any] = {
+        'cdb': round(nb_homes * 0.7), 'ech': nb_homes - round(nb_homes * 0.7),
+        'start': START, 'months': nb_months, 'fmt': '8S', 'seed': seed
+    }
+    saved: Dict[str, Any] = {}
+    if os.path.isfile(f"{root}/parameters.json"):
+        with open(f"{root}/parameters.json") as f:
+            saved: Dict[str, Any] = json.load(f)
+    rows: Optional[Dict[str, int]] = saved.pop('rows', None)
+    if saved != parameters:
+        print(f"--------------------Generating {nb_homes}x{nb_months}--------------------")
+        generate_dataset(
+            dataset, parameters['cdb'], parameters['ech'], START, nb_months, '8S', seed
+        )
+        write_daily_files(dataset, f"{root}/download_data")
+        rows: Optional[Dict[str, int]] = None
+    if rows is None:
+        rows: Dict[str, int] = count_rows(dataset)
+        with open(f"{root}/parameters.json", 'w') as f:
+            json.dump({**parameters, 'rows': rows}, f)
+    return root, rows
+
+
+def run_benchmarks(
+    work: str, sizes: List[Tuple[int, int]], stages: List[str], seed: int
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Run each stage on each size. Each stage is run in a new process, with NEXT_CLOUD pointing to
+    the synthetic dataset and the planning of alerts of the dataset. A failed stage is recorded
+    with its return code and does not stop the others.
+
+    :param work:    Folder of the benchmarks.
+    :param sizes:   List of (number of homes, number of months).
+    :param stages:  List of stages.
+    :param seed:    Seed of the generator.
+
+    :return:        Return the measures of each stage for each size.
+    """
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for nb_homes, nb_months in sizes:
+        size: str = f"{nb_homes}x{nb_months}"
+        root, rows = prepare_dataset(work, nb_homes, nb_months, seed)
+        results[size]: Dict[str, Dict[str, float]] = {}
+        for stage in stages:
+            print(f"--------------------{size} {stage}--------------------")
+            result_path: str = f"{root}/{stage}.json"
+            if os.path.isfile(result_path):
+                os.remove(result_path)
+            process: subprocess.CompletedProcess = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--stage', stage,
+                 '--result', result_path],
+                cwd=f"{root}/datasets/dataset",
+                env={**os.environ, 'VDE_NEXT_CLOUD': root},
+                stdout=subprocess.DEVNULL
+            )
+            if process.returncode != 0 or not os.path.isfile(result_path):
+                print(f"--------------------{stage} failed--------------------")
+                results[size][stage]: Dict[str, float] = {'error': process.returncode}
+                continue
+            with open(result_path) as f:
+                measures: Dict[str, float] = json.load(f)
+            read: Optional[str] = STAGES[stage][2]
+            if read is not None:
+                measures['rows']: int = rows[read]
+                measures['rows_per_s']: float = rows[read] / max(measures['wall'], 1e-9)
+            results[size][stage]: Dict[str, float] = measures
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, Dict[str, float]]],
+    baseline: Dict[str, Dict[str, Dict[str, float]]],
+    tolerance: float
+) -> List[str]:
+    """
+    Compare measures to the baseline and print a table. A stage is flagged when its wall time or
+    its peak RSS grows more than the tolerance, or when it fails. Stages reading only a part of
+    the data have no rows/s.
+
+    :param results:     Measures of each stage for each size.
+    :param baseline:    Measures of the baseline, with the same structure.
+    :param tolerance:   Relative growth allowed (e.g. 0.2 for 20%).
+
+    :return:            Return the list of flagged stages.
+    """
+    flagged: List[str] = []
+    print(f"{'size':>8} {'stage':>24} {'wall (s)':>10} {'base (s)':>10} {'rows/s':>12} "
+          f"{'RSS (MB)':>10} {'base (MB)':>10}")
+    for size, stages in results.items():
+        for stage, measures in stages.items():
+            reference: Dict[str, float] = baseline.get(size, {}).get(stage, {})
+            if 'error' in measures:
+                print(f"{size:>8} {stage:>24} {'failed':>10}")
+                flagged.append(f"{size} {stage}: failed")
+                continue
+            rss: float = max(measures['peak_rss_mb'], measures['peak_rss_workers_mb'])
+            rows_per_s: str = (
+                f"{measures['rows_per_s']:.0f}" if 'rows_per_s' in measures else '-'
+            )
+            if 'wall' in reference:
+                base_rss: float = max(
+                    reference['peak_rss_mb'], reference['peak_rss_workers_mb']
+                )
+                print(f"{size:>8} {stage:>24} {measures['wall']:>10.2f} "
+                      f"{reference['wall']:>10.2f} {rows_per_s:>12} "
+                      f"{rss:>10.0f} {base_rss:>10.0f}")
+                if measures['wall'] > reference['wall'] * (1 + tolerance):
+                    flagged.append(
+                        f"{size} {stage}: wall time {reference['wall']:.2f}s -> "
+                        f"{measures['wall']:.2f}s"
+                    )
+                if rss > base_rss * (1 + tolerance):
+                    flagged.append(f"{size} {stage}: peak RSS {base_rss:.0f}MB -> {rss:.0f}MB")
+            else:
+                print(f"{size:>8} {stage:>24} {measures['wall']:>10.2f} {'-':>10} "
+                      f"{rows_per_s:>12} {rss:>10.0f} {'-':>10}")
+    for line in flagged:
+        print(f"--------------------Regression {line}--------------------")
+    return flagged
+
+
+def parse_sizes(sizes: str) -> List[Tuple[int, int]]:
+    """
+    Parse sizes given as 'HOMESxMONTHS' separated by commas (e.g. '10x1,64x12,500x36').
+
+    :param sizes:   String of sizes.
+
+    :return:        Return the list of (number of homes, number of months).
+    """
+    return [tuple(int(n) for n in size.split('x')) for size in sizes.split(',')]
+
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Benchmark the stages of main() on synthetic datasets of increasing size."
+    )
+    parser.add_argument(
+        '--sizes', default=','.join(f"{h}x{m}" for h, m in SIZES),
+        help="Sizes as HOMESxMONTHS separated by commas (e.g. 10x1,64x12,500x36)."
+    )
+    parser.add_argument(
+        '--stages', default=','.join(STAGES), help="Stages separated by commas."
+    )
+    parser.add_argument(
+        '--work', default=f"{tempfile.gettempdir()}/vde_benchmark",
+        help="Folder of the synthetic datasets, reused between runs."
+    )
+    parser.add_argument('--output', default='benchmark_results.json', help="File of results.")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="Baseline file.")
+    parser.add_argument(
+        '--save-baseline', action='store_true', help="Save the results as the new baseline."
+    )
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Allowed slowdown.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the generator.")
+    # Used by the process running a single stage.
+    parser.add_argument('--stage', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args: argparse.Namespace = parser.parse_args()
+    if args.stage is not None:
+        run_stage(args.stage, args.result)
+        sys.exit(0)
+    results: Dict[str, Dict[str, Dict[str, float]]] = run_benchmarks(
+        args.work, parse_sizes(args.sizes), args.stages.split(','), args.seed
+    )
+    report: Dict[str, Any] = {
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"--------------------Baseline saved in {args.baseline}--------------------")
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline: Dict[str, Any] = json.load(f)
+        sys.exit(1 if compare(results, baseline['results'], args.tolerance) else 0)
+    else:
+        compare(results, {}, args.tolerance)
@@ -10,7 +10,7 @@ import os
 import pandas as pd
 import pytz
 
-from typing import List
+from typing import Dict, List
 
 
 # ------------------------------------ #
@@ -22,6 +22,9 @@ TZ = pytz.timezone('Europe/Brussels')
 # Number of workers to parallelize jobs.
 NB_SLAVES: int = 8
 
+# Maximum number of jobs submitted to the workers and not finished yet.
+MAX_IN_FLIGHT: int = 2 * NB_SLAVES
+
 # True if we want to manage flukso data
 FLUKSO: bool = False
 
@@ -31,8 +34,9 @@ RTU: bool = False
 # Set to true if you want to use basic data and False to use resampled data.
 BASIC_DATA: bool = True
 
-# Path where we save data
-NEXT_CLOUD: str = '/Users/bricepetitulb/Nextcloud/VdE'
+# Path where we save data. The environment variable VDE_NEXT_CLOUD replaces it (e.g. for the
+# benchmarks on a synthetic dataset).
+NEXT_CLOUD: str = os.environ.get('VDE_NEXT_CLOUD', '/Users/bricepetitulb/Nextcloud/VdE')
 
 # Name of the folder where the dataset is located
 DATASET_FOLDER: str = f"{NEXT_CLOUD}/datasets/dataset"
@@ -40,6 +44,15 @@ DATASET_FOLDER: str = f"{NEXT_CLOUD}/datasets/dataset"
 # Name of the folder where the resampled dataset is located
 RESAMPLED_FOLDER: str = f"{NEXT_CLOUD}/datasets/resampled_data"
 
+# Name of the folder where the pyramid of resampled datasets is located
+PYRAMID_FOLDER: str = f"{NEXT_CLOUD}/datasets/pyramid"
+
+# Name of the folder where the coverage index of each community is located
+COVERAGE_FOLDER: str = f"{NEXT_CLOUD}/datasets/coverage"
+
+# Name of the folder where the cube of all homes of each resolution is located
+CUBE_FOLDER: str = f"{NEXT_CLOUD}/datasets/cube"
+
 # Selected folder to work with
 CURRENT_FOLDER: str = DATASET_FOLDER if BASIC_DATA else RESAMPLED_FOLDER
 
@@ -49,24 +62,105 @@ FMT: str = '8S' if BASIC_DATA else '15min'
 # Path to plot data
 PLOT_PATH: str = f"{NEXT_CLOUD}/plots"
 
+# Set to True if you want to read data from the Parquet storage instead of the CSV files.
+PARQUET_DATA: bool = False
+
+# Name of the folder where the Parquet version of the selected folder is located
+PARQUET_FOLDER: str = f"{CURRENT_FOLDER}_parquet"
+
+# Set to True if you want to keep the parsed timestamps of CSV files in a cache
+TS_CACHE: bool = False
+
+# Name of the folder where the cache of parsed timestamps is located
+TS_CACHE_FOLDER: str = f"{NEXT_CLOUD}/datasets/ts_cache"
+
+# True if we want to build the cube of all homes at the format of the selected folder
+BUILD_CUBE: bool = False
+
+# Set to True if you want community aggregations to use the cube instead of reading each home
+CUBE_DATA: bool = False
+
+# Set to True if you want to read a period of a CSV file thanks to an index of its days
+DAY_INDEX: bool = False
+
+# Name of the folder where the index of days of each CSV file is located
+DAY_INDEX_FOLDER: str = f"{NEXT_CLOUD}/datasets/day_index"
+
+# Memory budget in bytes of the cache of frames read by the main process (e.g. 2 * 1024 ** 3).
+# 0 to disable the cache.
+FRAME_CACHE_BUDGET: int = 0
+
 # True if we want to manage the data
 MANAGE_DATA: bool = False
 
 # True if you want to concat data that are recorded in multiple file
 CONCAT_DATA: bool = False
 
-# True if we want to verify if there are negative consumptions
+# True if you want to concat data by appending files in parallel instead of growing a DataFrame
+STREAM_CONCAT: bool = False
+
+# True if we want to verify if there are anomalies (negative consumptions, gaps, etc.)
 VERIFY_CONSUMPTION: bool = False
 
+# Tolerance in Watt between p_tot and p_cons + p_prod
+VALIDATION_TOLERANCE: float = 1.0
+
 # True if we want to resample the dataset
 RESAMPLE: bool = False
 
+# True if we want to convert the CSV files of the selected folder into the Parquet storage
+CONVERT_PARQUET: bool = False
+
 # True if we want to resample the dataset
 RESAMPLE_RTU: bool = False
 
+# True if we want to resample only files that changed since the last resampling
+INCREMENTAL_RESAMPLE: bool = False
+
+# True if we want to resample files by chunks to keep a constant memory
+STREAM_RESAMPLE: bool = False
+
+# True if we want to resample the dataset into all levels of the pyramid
+RESAMPLE_PYRAMID: bool = False
+
+# Set to True if you want to read resampled data from the pyramid instead of raw data
+PYRAMID_DATA: bool = False
+
+# Levels of the pyramid, from the finest to the coarsest. Each level divides the next one.
+PYRAMID_LEVELS: List[str] = ['1min', '15min', '1h', '1D']
+
+# Aggregation used to resample flukso data
+FLUKSO_AGG: Dict[str, str] = {
+    'home_id': 'first',
+    'day': 'first',
+    'p_cons': 'mean',
+    'p_prod': 'mean',
+    'p_tot': 'mean'
+}
+
+# Aggregation used to resample rtu data
+RTU_AGG: Dict[str, str] = {
+    'ip': 'first', 'day': 'first', 'active': 'mean',
+    'apparent': 'mean', 'cos_phi': 'mean', 'reactive': 'mean',
+    'tension1_2': 'mean', 'tension2_3': 'mean', 'tension3_1': 'mean'
+}
+
 # Set to True if you want to enter in the function to plot
 PLOT: bool = False
 
+# Set to True if you want to reduce the curves of plot_data to the width of the figure in pixels
+# and to limit the width of the figure to MAX_FIGURE_WIDTH
+PLOT_DECIMATION: bool = False
+
+# Maximum width of the figures of plot_data in inches when PLOT_DECIMATION is True
+MAX_FIGURE_WIDTH: int = 40
+
+# Maximum number of ticks of the hours on the x-axis of plot_data (one tick per hour up to 2 days)
+MAX_HOUR_TICKS: int = 48
+
+# Maximum number of ticks of the days on the x-axis of plot_data
+MAX_DAY_TICKS: int = 31
+
 # Set to True if you want to plot the average over house
 PLOT_AVERAGE: bool = False
 
@@ -76,6 +170,34 @@ PLOT_MEDIAN_QUANTILE_RTU: bool = False
 # Set to True if you want to apply and plot the median, first & third quantile for the flukso
 PLOT_MEDIAN_QUANTILE_FLUKSO: bool = False
 
+# Set to True if you want to compute the median and quantiles of flukso data with a sketch per
+# slot of the day, updated chunk by chunk, instead of the whole history in memory
+STREAM_QUANTILES: bool = False
+
+# Relative accuracy of the quantiles of sketches for values in [SKETCH_MIN_VALUE, SKETCH_MAX_VALUE]
+SKETCH_ACCURACY: float = 0.02
+
+# Absolute values in Watt below which a value is considered as 0 by sketches
+SKETCH_MIN_VALUE: float = 1.0
+
+# Absolute values in Watt beyond which the accuracy of sketches is no longer guaranteed
+SKETCH_MAX_VALUE: float = 100000.0
+
+# True if we want to save the statistics of each slot of the day of each home (count, sum, sum of
+# squares and sketch), so community profiles can be computed without reading data
+BUILD_SLOT_STATS: bool = False
+
+# Set to True if you want to plot the median and quantiles of each community from the statistics
+# of each slot of the day of homes
+COMMUNITY_PROFILE: bool = False
+
+# Name of the folder where the statistics of each slot of the day of each home are located
+SLOT_STATS_FOLDER: str = f"{NEXT_CLOUD}/datasets/slot_stats"
+
+# Duration of a slot of the statistics of each slot of the day. A slot coarser than FMT keeps the
+# sketches small (96 slots instead of 10800 at 8S), so merging homes takes milliseconds.
+SLOT_STATS_STEP: str = '15min'
+
 # Set to True if you want to plot the mean of each wednesday for the flukso
 MEAN_WED_FLUKSO: bool = False
 
@@ -101,15 +223,39 @@ AVERAGE_COMMUNITIES: bool = False
 # True we want to plot the aggregation
 AGGREGATION: bool = False
 
+# True if we want to render figures in parallel with NB_SLAVES workers
+PARALLEL_PLOT: bool = False
+
 # True if we want to verify reactions
 REACTION: bool = False
 
+# True if we want to compute reactions of homes in parallel with NB_SLAVES workers
+PARALLEL_REACTION: bool = False
+
 # True if you want to compute the auto consumption
 AUTO_CONSUMPTION: bool = False
 
-# True if we want to create a file where we describe if we use data for each ts.
+# True if we want to create the coverage index where we describe if we use data for each ts.
 CHECK_DATES: bool = False
 
+# True if we want to skip homes without used data during alerts according to the coverage index
+USE_COVERAGE: bool = False
+
+# True if you want to profile each stage of main() and each home of the loops
+PROFILE: bool = False
+
+# True if you want cProfile statistics (pstats files) when profiling
+PROFILE_CPU: bool = True
+
+# True if you want tracemalloc snapshots when profiling (slower)
+PROFILE_MEMORY: bool = False
+
+# Number of hot spots in the summary of the profiling
+PROFILE_TOP: int = 30
+
+# Path where we save profiles
+PROFILE_FOLDER: str = f"{NEXT_CLOUD}/profiles"
+
 # Name of communities
 COMMUNITY_NAME: List[str] = ["CDB", "ECH"]
 
@@ -153,9 +299,12 @@ with os.scandir(f"{CURRENT_FOLDER}/ECH") as ech:
         [f.name for f in ech if f.name[:3] == 'ECH' and f.name not in ALL_COMMUNAL]
     )
 
+# List of homes of the CDB, without the aggregations of the community
+ALL_HOMES_CDB: List[str] = [f for f in ALL_CDB if f not in ALL_AGG_CDB]
+
 # Matrix containing result of report and reaction
 MATRIX_ALERTS_CDB: np.ndarray[np.float64] = np.zeros((
-    len(ALL_CDB),
+    len(ALL_HOMES_CDB),
     len(ALERTS_CDB) + (2 * len(REPORTS_HOURS) * len(ALERTS_CDB))
 ))
 
@@ -0,0 +1,166 @@
+__title__ = "coverage_index"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import datetime as dt
+import numpy as np
+import os
+import pandas as pd
+from typing import NoReturn, Dict, List, Optional, Tuple
+
+from config import (
+    CURRENT_FOLDER,
+    COVERAGE_FOLDER
+)
+from storage import read_resolution
+
+
+# Duration of a slot of the coverage in nanoseconds (15 minutes)
+SLOT_NS: int = 15 * 60 * 10**9
+
+
+# -------------------------------------- #
+# ----------COVERAGE FUNCTIONS---------- #
+# -------------------------------------- #
+
+
+def coverage_path(community: str) -> str:
+    """
+    Give the path of the coverage index of a community.
+
+    :param community:   The name of the community.
+
+    :return:            Return the path.
+    """
+    return f"{COVERAGE_FOLDER}/{community}_coverage.npz"
+
+
+def build_coverage(community: str) -> NoReturn:
+    """
+    Build the coverage index of a community. For each home, we keep one bit per slot of 15
+    minutes, set if the slot is used, i.e. the mean consumption is positive and the mean
+    production is negative. Slots are counted since epoch, so all homes share the same origin,
+    and bits are packed with np.packbits.
+
+    :param community:   The name of the community.
+    """
+    homes: List[str] = []
+    first_slots: List[int] = []
+    used: List[np.ndarray] = []
+    for home in sorted(os.listdir(f"{CURRENT_FOLDER}/{community}")):
+        if home == '.DS_Store':
+            continue
+        print(f"--------------------{home}--------------------")
+        df: pd.DataFrame = read_resolution(community, home, '15min')
+        if df.empty:
+            continue
+        slots: np.ndarray = df['ts'].to_numpy(dtype='datetime64[ns]').view(np.int64) // SLOT_NS
+        homes.append(home[:6])
+        first_slots.append(int(slots[0]))
+        used.append(((df['p_cons'] >= 0) & (df['p_prod'] <= 0)).to_numpy())
+    origin: int = min(first_slots) if first_slots else 0
+    nb_slots: int = max(
+        [first - origin + len(bits) for first, bits in zip(first_slots, used)], default=0
+    )
+    matrix: np.ndarray = np.zeros((len(homes), nb_slots), dtype=bool)
+    for i, (first, bits) in enumerate(zip(first_slots, used)):
+        matrix[i, first - origin:first - origin + len(bits)] = bits
+    if not os.path.isdir(COVERAGE_FOLDER):
+        os.makedirs(COVERAGE_FOLDER)
+    np.savez_compressed(
+        coverage_path(community),
+        homes=np.array(homes),
+        origin=np.int64(origin),
+        nb_slots=np.int64(nb_slots),
+        bits=np.packbits(matrix, axis=1)
+    )
+
+
+def load_coverage(community: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Load the coverage index of a community.
+
+    :param community:   The name of the community.
+
+    :return:            Return a dictionary with the homes, the origin, the number of slots and
+                        the packed bits, or None if the index does not exist.
+    """
+    if not os.path.isfile(coverage_path(community)):
+        return None
+    with np.load(coverage_path(community)) as index:
+        return {key: index[key] for key in index.files}
+
+
+def slot_range(
+    coverage: Dict[str, np.ndarray], starting: dt.datetime, ending: dt.datetime
+) -> Tuple[int, int]:
+    """
+    Give the slots of the index covering [starting, ending).
+
+    :param coverage:    Coverage index.
+    :param starting:    The starting date (with timezone).
+    :param ending:      The ending date (with timezone), excluded.
+
+    :return:            Return the first slot and the last slot (excluded) relative to the origin.
+    """
+    first: int = pd.Timestamp(starting).value // SLOT_NS - int(coverage['origin'])
+    last: int = -(-pd.Timestamp(ending).value // SLOT_NS) - int(coverage['origin'])
+    return first, last
+
+
+def coverage_bits(
+    coverage: Dict[str, np.ndarray], starting: dt.datetime, ending: dt.datetime
+) -> np.ndarray:
+    """
+    Give the bits of all homes for the slots of [starting, ending). Only the bytes of the
+    window are unpacked. Slots outside of the index are not used.
+
+    :param coverage:    Coverage index.
+    :param starting:    The starting date (with timezone).
+    :param ending:      The ending date (with timezone), excluded.
+
+    :return:            Return a boolean matrix (homes x slots).
+    """
+    first, last = slot_range(coverage, starting, ending)
+    result: np.ndarray = np.zeros((len(coverage['homes']), max(last - first, 0)), dtype=bool)
+    low: int = max(first, 0)
+    high: int = min(last, int(coverage['nb_slots']))
+    if low < high:
+        bits: np.ndarray = np.unpackbits(coverage['bits'][:, low // 8:-(-high // 8)], axis=1)
+        result[:, low - first:high - first] = bits[:, low % 8:low % 8 + high - low]
+    return result
+
+
+def covered_fraction(
+    coverage: Dict[str, np.ndarray], starting: dt.datetime, ending: dt.datetime
+) -> Dict[str, float]:
+    """
+    Give, for each home, the fraction of used slots in [starting, ending).
+
+    :param coverage:    Coverage index.
+    :param starting:    The starting date (with timezone).
+    :param ending:      The ending date (with timezone), excluded.
+
+    :return:            Return a dictionary with the fraction of each home.
+    """
+    bits: np.ndarray = coverage_bits(coverage, starting, ending)
+    fractions: np.ndarray = bits.mean(axis=1) if bits.shape[1] else np.zeros(len(bits))
+    return dict(zip(coverage['homes'].tolist(), fractions.tolist()))
+
+
+def full_coverage_homes(
+    coverage: Dict[str, np.ndarray], starting: dt.datetime, ending: dt.datetime
+) -> List[str]:
+    """
+    Give the homes where all slots of [starting, ending) are used.
+
+    :param coverage:    Coverage index.
+    :param starting:    The starting date (with timezone).
+    :param ending:      The ending date (with timezone), excluded.
+
+    :return:            Return the list of homes.
+    """
+    bits: np.ndarray = coverage_bits(coverage, starting, ending)
+    return coverage['homes'][bits.all(axis=1)].tolist()
@@ -0,0 +1,184 @@
+__title__ = "cube"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import datetime as dt
+import numpy as np
+import os
+import pandas as pd
+from typing import NoReturn, Dict, List, Optional, Tuple
+
+from config import (
+    TZ,
+    CUBE_FOLDER,
+    ALL_CDB,
+    ALL_ECH,
+    ALL_COMMUNAL
+)
+from storage import read_home, read_resolution
+
+
+# Channels of the cube, in the order of the last axis
+CHANNELS: List[str] = ['p_cons', 'p_prod', 'p_tot']
+
+
+# ---------------------------------- #
+# ----------CUBE FUNCTIONS---------- #
+# ---------------------------------- #
+
+
+def cube_path(resolution: str) -> str:
+    """
+    Give the path of the folder containing the cube of a resolution.
+
+    :param resolution:  The resolution of the cube (e.g. '15min').
+
+    :return:            Return the path.
+    """
+    return f"{CUBE_FOLDER}/{resolution}"
+
+
+def build_cube(resolution: str) -> NoReturn:
+    """
+    Build the cube of all homes at a given resolution. The cube is a NumPy array
+    (homes x slots x channels) saved in a .npy file, so it can be memory-mapped, where a missing
+    value is NaN. Slots are counted since epoch, like the coverage index, so the resolution must
+    have a fixed duration dividing one hour (e.g. '8S', '1min', '15min', '1h').
+
+    :param resolution:  The resolution of the cube.
+    """
+    homes: List[Tuple[str, str]] = (
+        [('CDB', file) for file in ALL_CDB]
+        + [('ECH', file) for file in ALL_COMMUNAL + ALL_ECH]
+    )
+    step: int = pd.to_timedelta(resolution).value
+    # First pass to find the grid shared by all homes, only with the first and last timestamps.
+    bounds: List[Tuple[int, int]] = []
+    for community, file in homes:
+        ts: pd.Series = read_home(community, file, columns=['ts'])['ts']
+        if ts.empty:
+            bounds.append((0, 0))
+            continue
+        epochs: np.ndarray = (
+            pd.to_datetime(ts.iloc[[0, -1]], utc=True).to_numpy(dtype='datetime64[ns]')
+            .view(np.int64) // step
+        )
+        bounds.append((int(epochs[0]), int(epochs[1]) + 1))
+    used: List[Tuple[int, int]] = [bound for bound in bounds if bound[1] > bound[0]]
+    origin: int = min([first for first, _ in used], default=0)
+    nb_slots: int = max([last for _, last in used], default=origin) - origin
+    if not os.path.isdir(cube_path(resolution)):
+        os.makedirs(cube_path(resolution))
+    cube: np.memmap = np.lib.format.open_memmap(
+        f"{cube_path(resolution)}/cube.npy", mode='w+', dtype=np.float64,
+        shape=(len(homes), nb_slots, len(CHANNELS))
+    )
+    cube[:] = np.nan
+    # Second pass to fill the row of each home.
+    for i, (community, file) in enumerate(homes):
+        print(f"--------------------{file[:6]}--------------------")
+        df: pd.DataFrame = read_resolution(community, file, resolution)
+        if df.empty:
+            continue
+        slots: np.ndarray = (
+            df['ts'].to_numpy(dtype='datetime64[ns]').view(np.int64) // step - origin
+        )
+        keep: np.ndarray = (slots >= 0) & (slots < nb_slots)
+        cube[i, slots[keep]] = df[CHANNELS].to_numpy(dtype=np.float64)[keep]
+    cube.flush()
+    del cube
+    np.savez(
+        f"{cube_path(resolution)}/index.npz",
+        homes=np.array([file for _, file in homes]),
+        origin=np.int64(origin),
+        step=np.int64(step)
+    )
+
+
+def load_cube(resolution: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Load the cube of a resolution. The data are memory-mapped in read-only mode.
+
+    :param resolution:  The resolution of the cube.
+
+    :return:            Return a dictionary with the homes, the origin, the step (in nanoseconds)
+                        and the data, or None if the cube does not exist.
+    """
+    if not os.path.isfile(f"{cube_path(resolution)}/index.npz"):
+        return None
+    with np.load(f"{cube_path(resolution)}/index.npz") as index:
+        cube: Dict[str, np.ndarray] = {key: index[key] for key in index.files}
+    cube['data']: np.memmap = np.load(f"{cube_path(resolution)}/cube.npy", mmap_mode='r')
+    return cube
+
+
+def cube_slice(
+    cube: Dict[str, np.ndarray],
+    files: List[str],
+    starting: Optional[dt.datetime] = None,
+    ending: Optional[dt.datetime] = None
+) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+    """
+    Give the data of some homes between two dates. Only the slots of the period are read.
+
+    :param cube:            Cube loaded by load_cube.
+    :param files:           List of files of homes (e.g. CDB001.csv).
+    :param starting=None:   The starting date (with timezone). None for the beginning of the cube.
+    :param ending=None:     The ending date (with timezone), included. None for the end of the
+                            cube.
+
+    :return:                Return the timestamps in our timezone and the data
+                            (homes x slots x channels).
+    """
+    step: int = int(cube['step'])
+    nb_slots: int = cube['data'].shape[1]
+    first: int = 0 if starting is None else max(
+        -(-pd.Timestamp(starting).value // step) - int(cube['origin']), 0
+    )
+    last: int = nb_slots if ending is None else min(
+        pd.Timestamp(ending).value // step - int(cube['origin']) + 1, nb_slots
+    )
+    last: int = max(first, last)
+    positions: Dict[str, int] = {home: i for i, home in enumerate(cube['homes'].tolist())}
+    rows: List[int] = [positions[file] for file in files if file in positions]
+    idx: pd.DatetimeIndex = pd.to_datetime(
+        (np.arange(first, last) + int(cube['origin'])) * step, utc=True
+    ).tz_convert(TZ)
+    return idx, cube['data'][rows, first:last]
+
+
+def cube_frame(
+    cube: Dict[str, np.ndarray],
+    files: List[str],
+    how: str,
+    starting: Optional[dt.datetime] = None,
+    ending: Optional[dt.datetime] = None
+) -> pd.DataFrame:
+    """
+    Aggregate some homes of the cube between two dates. Missing values are ignored and slots
+    without any value are removed, as a groupby on the timestamps would do.
+
+    :param cube:            Cube loaded by load_cube.
+    :param files:           List of files of homes (e.g. CDB001.csv).
+    :param how:             'mean' or 'sum'.
+    :param starting=None:   The starting date (with timezone). None for the beginning of the cube.
+    :param ending=None:     The ending date (with timezone), included. None for the end of the
+                            cube.
+
+    :return:                Return a DataFrame with the column 'ts' in our timezone and a column
+                            for each channel.
+    """
+    idx, data = cube_slice(cube, files, starting, ending)
+    counts: np.ndarray = (~np.isnan(data)).sum(axis=0)
+    values: np.ndarray = np.nansum(data, axis=0)
+    if how == 'mean':
+        values: np.ndarray = values / np.where(counts > 0, counts, 1)
+    elif how != 'sum':
+        raise ValueError(f"Unknown aggregation {how}")
+    values[counts == 0] = np.nan
+    keep: np.ndarray = counts.any(axis=1)
+    df: pd.DataFrame = pd.DataFrame(values[keep], columns=CHANNELS)
+    df.insert(0, 'ts', idx[keep])
+    return df
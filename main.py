@@ -5,30 +5,58 @@ __license__ = "MIT"
 
 import datetime as dt
 import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
 import os
 import pandas as pd
 import pytz
-from typing import NoReturn, List, Optional
+from typing import NoReturn, Callable, Dict, Iterator, List, Optional, Tuple
 
 from plot_load_curves import (
     plot_average_community,
     average_through_community,
-    plot_median_quantile_flukso,
     plot_median_quantile_rtu,
-    flukso_plot,
     rtu_plot,
     plot_aggregation,
     plot_data
 )
+from coverage_index import build_coverage, covered_fraction, load_coverage
+from cube import build_cube, cube_frame, load_cube
+from profiles import home_profiles, profile, slot_step
+from profiling import clear_profiles, profile_summary, profiled
+from render import (
+    FigureJob,
+    flukso_plot_job,
+    median_quantile_flukso_jobs,
+    plot_data_job,
+    quantile_flukso_jobs,
+    render_figures
+)
+from sketches import (
+    build_slot_stats,
+    home_sketch,
+    merge_slot_stats,
+    merged_profile,
+    sketch_quantiles
+)
 from sms_reaction import find_reaction_report
+from storage import convert_dataset, load_home, load_home_range, read_home
 from utils import (
-    check_negative_consumption, resample_dataset, export_to_XLSX
+    concat_files,
+    find_anomalies,
+    resample_file,
+    resample_incremental,
+    resample_pyramid,
+    resample_streaming,
+    run_bounded,
+    export_to_XLSX
 )
 
 # Import constants for the configuration of the execution
 from config import (
     TZ,
     NB_SLAVES,
+    MAX_IN_FLIGHT,
     FLUKSO,
     RTU,
     FMT,
@@ -37,18 +65,33 @@ from config import (
     CURRENT_FOLDER,
     DATASET_FOLDER,
     RESAMPLED_FOLDER,
+    PYRAMID_FOLDER,
     PLOT_PATH,
     # Constants for the name of communities
     COMMUNITY_NAME,
     # Constants for the data management
     MANAGE_DATA,
     CONCAT_DATA,
+    STREAM_CONCAT,
     VERIFY_CONSUMPTION,
+    VALIDATION_TOLERANCE,
     RESAMPLE,
     RESAMPLE_RTU,
+    INCREMENTAL_RESAMPLE,
+    STREAM_RESAMPLE,
+    RESAMPLE_PYRAMID,
+    FLUKSO_AGG,
+    RTU_AGG,
+    CONVERT_PARQUET,
+    PARQUET_DATA,
+    BUILD_CUBE,
+    CUBE_DATA,
     CHECK_DATES,
+    PROFILE,
     # Constants for reactions of messages
     REACTION,
+    PARALLEL_REACTION,
+    USE_COVERAGE,
     # Constants for the plotting
     PLOT,
     BASIC_DATA,
@@ -60,6 +103,10 @@ from config import (
     AGGREGATION,
     PLOT_RANGE_RTU,
     PLOT_MEDIAN_QUANTILE_FLUKSO,
+    STREAM_QUANTILES,
+    BUILD_SLOT_STATS,
+    SLOT_STATS_STEP,
+    COMMUNITY_PROFILE,
     PLOT_MEDIAN_QUANTILE_RTU,
     MEAN_WED_FLUKSO,
     MEAN_WED_RTU,
@@ -67,6 +114,7 @@ from config import (
     AUTO_CONSUMPTION,
     # Variables for CDB
     ALL_CDB,
+    ALL_HOMES_CDB,
     ALERTS_CDB,
     MATRIX_ALERTS_CDB,
     SUM_ALERTS_CDB,
@@ -79,6 +127,12 @@ from config import (
 )
 
 
+# Shared memory attached by each worker computing reactions
+REACTION_BLOCKS: Dict[
+    str, Tuple[shared_memory.SharedMemory, shared_memory.SharedMemory, Tuple[int, int]]
+] = {}
+
+
 # ----------------------------- #
 # ----------MAIN CODE---------- #
 # ----------------------------- #
@@ -134,25 +188,104 @@ def concat_data(columns_name: List[str], type_concat: str) -> NoReturn:
             )
 
 
+def stream_concat_data(columns_name: List[str], type_concat: str) -> NoReturn:
+    """
+    Function to concatenate data into one file month by month or per house, without growing a
+    DataFrame. Daily files are grouped by output file and each output file is written by a worker
+    that appends the daily files one by one.
+
+    :param columns_name:    List of string with the name of each column.
+    :param type_concat:     String with the type of the concatenation.
+    """
+    if columns_name == "":
+        print("--------------------Error no columns name--------------------")
+        return
+    print("--------------------Processing concatenation...--------------------")
+    path_to_read: str = f"{NEXT_CLOUD}/download_data"
+    # Daily files of each output file, in order.
+    groups: Dict[str, List[str]] = {}
+    for file in sorted(os.listdir(path_to_read)):
+        if file == '.DS_Store':
+            continue
+        name: str = file[:14] if type_concat == "monthly" else file[:6]
+        output_path: str = f"{DATASET_FOLDER}/{file[:3]}/{name}.csv"
+        groups.setdefault(output_path, []).append(f"{path_to_read}/{file}")
+    for output_path in groups:
+        if not os.path.isdir(os.path.dirname(output_path)):
+            os.makedirs(os.path.dirname(output_path))
+    with multiprocessing.Pool(NB_SLAVES) as p:
+        for _ in run_bounded(
+            p, concat_files,
+            [(files, output_path, columns_name) for output_path, files in groups.items()],
+            MAX_IN_FLIGHT
+        ):
+            pass
+
+
+def validate_home(community: str, file: str) -> pd.DataFrame:
+    """
+    Find the anomalies of a home. It is used by the workers of validate_dataset.
+
+    :param community:   The name of the community.
+    :param file:        The name of the file.
+
+    :return:            Return the intervals of anomalies of the home.
+    """
+    print(f"---------------{file[:6]}---------------")
+    df: pd.DataFrame = read_home(
+        community, file, columns=['ts', 'p_cons', 'p_prod', 'p_tot'], parse_ts=True
+    )
+    report: pd.DataFrame = find_anomalies(df, pd.to_timedelta(FMT), VALIDATION_TOLERANCE)
+    report.insert(0, 'home_id', file[:6])
+    return report
+
+
+def validate_dataset() -> NoReturn:
+    """
+    Validate all homes of all communities with NB_SLAVES workers and write one report with the
+    intervals of anomalies of each home.
+    """
+    print("---------------Validating Data---------------")
+    tasks: List[Tuple[str, str]] = [
+        (community, file)
+        for community in COMMUNITY_NAME
+        for file in sorted(os.listdir(f"{CURRENT_FOLDER}/{community}"))
+        if file != '.DS_Store'
+    ]
+    with multiprocessing.Pool(NB_SLAVES) as p:
+        reports: List[pd.DataFrame] = list(run_bounded(p, validate_home, tasks, MAX_IN_FLIGHT))
+    report: pd.DataFrame = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+    if report.empty:
+        print("---------------No anomaly found---------------")
+        return
+    if not os.path.isdir(PLOT_PATH):
+        os.makedirs(PLOT_PATH)
+    report.to_csv(f"{PLOT_PATH}/validation_report.csv", index=False)
+    print(report.groupby('anomaly')['home_id'].nunique().rename('homes'))
+    print(f"File: {PLOT_PATH}/validation_report.csv")
+
+
+def resample_function() -> Callable:
+    """
+    Give the function used to resample a file according to the configuration.
+
+    :return:    Return a function taking the path of the file, the path to save the file, the
+                filename and the aggregation.
+    """
+    if INCREMENTAL_RESAMPLE:
+        return resample_incremental
+    if STREAM_RESAMPLE:
+        return resample_streaming
+    return resample_file
+
+
 def manage_flukso_data() -> NoReturn:
     """
     Function to manage data.
     """
     # For all communities
     if VERIFY_CONSUMPTION:
-        for community in COMMUNITY_NAME:
-            print("---------------Managing Data---------------")
-            # For all file in the data folder
-            # for file in sorted(os.listdir(community)):
-            folder_path: str = f"{CURRENT_FOLDER}/{community}"
-            for file in sorted(os.listdir(folder_path)):
-                if file == '.DS_Store':
-                    continue
-                filename: str = file[:6]
-                print(f"---------------{filename}---------------")
-                df: pd.DataFrame = pd.read_csv(f"{folder_path}/{file}")
-                # Check if there is a negative consumption
-                check_negative_consumption(df, filename)
+        validate_dataset()
 
     # Run the resample function according to Resample boolean value
     if RESAMPLE:
@@ -164,31 +297,39 @@ def manage_flukso_data() -> NoReturn:
         if ech[0] == '.DS_Store':
             ech.pop(0)
         files: List[str] = (cdb + ech)
+        # Files are read by the workers, the parent only sends their path.
+        tasks: List[Tuple[str, str, str, Dict[str, str]]] = [
+            (
+                f"{DATASET_FOLDER}/{file[:3]}/{file}",
+                f"{RESAMPLED_FOLDER}/{file[:3]}",
+                file[:6],
+                FLUKSO_AGG
+            )
+            for file in files
+            if file == f"{file[:6]}.csv"
+        ]
         # Open a pool of processes to parallelize the resampling.
         with multiprocessing.Pool(NB_SLAVES) as p:
-            # Create a dictionary containing the ID of the home and the process.
-            resample_map = {
-                file[:6]: p.apply_async(
-                    resample_dataset,
-                    (
-                        pd.read_csv(f"{DATASET_FOLDER}/{file[:3]}/{file}"),
-                        f"{RESAMPLED_FOLDER}/{file[:3]}",
-                        file[:6],
-                        {
-                            'home_id': 'first',
-                            'day': 'first',
-                            'p_cons': 'mean',
-                            'p_prod': 'mean',
-                            'p_tot': 'mean'
-                        }
-                    )
-                )
-                for file in files
-                if file == f"{file[:6]}.csv"
-            }
-            # For each process, we wait the end of the execution
-            for _, resample in resample_map.items():
-                resample.wait()
+            # We wait the end of each execution while keeping the pool busy.
+            for _ in run_bounded(p, resample_function(), tasks, MAX_IN_FLIGHT):
+                pass
+
+    # Resample each file into all levels of the pyramid in one pass
+    if RESAMPLE_PYRAMID:
+        tasks: List[Tuple[str, str, str, Dict[str, str]]] = [
+            (
+                f"{DATASET_FOLDER}/{community}/{file}",
+                f"{PYRAMID_FOLDER}/{community}",
+                file[:6],
+                FLUKSO_AGG
+            )
+            for community in COMMUNITY_NAME
+            for file in sorted(os.listdir(f"{DATASET_FOLDER}/{community}"))
+            if file == f"{file[:6]}.csv"
+        ]
+        with multiprocessing.Pool(NB_SLAVES) as p:
+            for _ in run_bounded(p, resample_pyramid, tasks, MAX_IN_FLIGHT):
+                pass
 
 
 def manage_rtu_data() -> NoReturn:
@@ -197,47 +338,211 @@ def manage_rtu_data() -> NoReturn:
     """
     # Resample rtu data
     if RESAMPLE_RTU:
-        df: pd.DataFrame = pd.read_csv(f"{DATASET_FOLDER}/RTU/rtu.csv")
-        resample_dataset(
-            df, f"{RESAMPLED_FOLDER}/RTU", 'rtu',
-            {
-                'ip': 'first', 'day': 'first', 'active': 'mean',
-                'apparent': 'mean', 'cos_phi': 'mean', 'reactive': 'mean',
-                'tension1_2': 'mean', 'tension2_3': 'mean', 'tension3_1': 'mean'
-            }
+        resample_function()(
+            f"{DATASET_FOLDER}/RTU/rtu.csv", f"{RESAMPLED_FOLDER}/RTU", 'rtu', RTU_AGG
+        )
+
+    # Resample rtu data into all levels of the pyramid
+    if RESAMPLE_PYRAMID:
+        resample_pyramid(f"{DATASET_FOLDER}/RTU/rtu.csv", f"{PYRAMID_FOLDER}/RTU", 'rtu', RTU_AGG)
+
+
+def reaction_homes() -> List[Tuple[str, str, int]]:
+    """
+    Give the homes used to compute the reactions with their row in the matrix of alerts. The
+    aggregations of CDB (CDBA*) are not homes: they would count each home twice in the sums.
+
+    :return:    Return a list of tuples (community, file, index of the row).
+    """
+    homes: List[Tuple[str, str, int]] = []
+    for community in COMMUNITY_NAME:
+        all_files: List[str] = ALL_HOMES_CDB if community == "CDB" else ALL_ECH
+        homes += [(community, file, i) for i, file in enumerate(all_files)]
+    return homes
+
+
+def covered_alerts(homes: List[Tuple[str, str, int]]) -> Dict[str, np.ndarray]:
+    """
+    Give, for each home, the alerts with at least one used slot according to the coverage index.
+    The other alerts of the home are not computed and a home without any is not loaded: their
+    cells in the matrix of alerts stay empty. Homes of a community without coverage index are not
+    in the dictionary, so all their alerts are computed.
+
+    :param homes:   List of tuples (community, file, index of the row).
+
+    :return:        Return a dictionary with, for each file, a boolean array with one value per
+                    alert of its community.
+    """
+    masks: Dict[str, np.ndarray] = {}
+    for community, alerts in [("CDB", ALERTS_CDB), ("ECH", ALERTS_ECH)]:
+        coverage: Optional[Dict[str, np.ndarray]] = load_coverage(community)
+        if coverage is None:
+            continue
+        files: List[str] = [file for name, file, _ in homes if name == community]
+        for file in files:
+            masks[file]: np.ndarray = np.zeros(len(alerts.index), dtype=bool)
+        for i in range(len(alerts.index)):
+            start_alert: dt.datetime = (
+                dt.datetime.fromtimestamp(dt.datetime.timestamp(alerts.iloc[i][1])).astimezone()
+            )
+            end_alert: dt.datetime = (
+                dt.datetime.fromtimestamp(dt.datetime.timestamp(alerts.iloc[i][2])).astimezone()
+            )
+            fractions: Dict[str, float] = covered_fraction(coverage, start_alert, end_alert)
+            for file in files:
+                masks[file][i] = fractions.get(file[:6], 0) > 0
+    return masks
+
+
+def load_reaction_home(community: str, file: str) -> pd.DataFrame:
+    """
+    Read the data of a home and prepare it for the computation of the reaction.
+
+    :param community:   The name of the community.
+    :param file:        The name of the file.
+
+    :return:            Return the DataFrame with a positive consumption.
+    """
+    df: pd.DataFrame = load_home(community, file, parse_ts=True)
+    df['day']: pd.TimestampSeries = pd.to_datetime(df['day'])
+    return df[df['p_cons'] > 0]
+
+
+def init_reaction_worker(blocks: Dict[str, Tuple[str, str, Tuple[int, int]]]) -> NoReturn:
+    """
+    Initialize a worker of the pool computing reactions by attaching the shared memory.
+
+    :param blocks:  Dictionary with, for each community, the name of the shared memory of the
+                    matrix, the name of the shared memory of the sums and the shape of both.
+    """
+    for community, (matrix_name, sums_name, shape) in blocks.items():
+        REACTION_BLOCKS[community] = (
+            shared_memory.SharedMemory(name=matrix_name),
+            shared_memory.SharedMemory(name=sums_name),
+            shape
+        )
+
+
+def reaction_worker(
+    community: str, file: str, index: int, alerts_mask: Optional[np.ndarray] = None
+) -> str:
+    """
+    Compute the reaction of a home in a worker. The row of the home is written in the shared
+    matrix and the contribution of the home to the sums is written in its own row of the shared
+    sums, so that the parent can reduce them in the order of the homes.
+
+    :param community:           The name of the community.
+    :param file:                The name of the file.
+    :param index:               The index of the row of the home.
+    :param alerts_mask=None:    Alerts to compute (see covered_alerts). None for all alerts.
+
+    :return:                    Return the name of the file.
+    """
+    print(f"---------------{file[:6]}---------------")
+    matrix_shm, sums_shm, shape = REACTION_BLOCKS[community]
+    matrix: np.ndarray = np.ndarray(shape, dtype=np.float64, buffer=matrix_shm.buf)
+    sums: np.ndarray = np.ndarray(shape, dtype=np.float64, buffer=sums_shm.buf)
+    with profiled('reaction', file[:6]):
+        find_reaction_report(
+            load_reaction_home(community, file),
+            ALERTS_CDB if community == "CDB" else ALERTS_ECH,
+            matrix,
+            sums[index],
+            index,
+            alerts_mask
+        )
+    return file
+
+
+def parallel_alert_reaction(
+    homes: List[Tuple[str, str, int]], alerts_masks: Dict[str, np.ndarray]
+) -> NoReturn:
+    """
+    Compute the reactions of all homes with a pool of NB_SLAVES processes. Results are written
+    in shared memory and copied in MATRIX_ALERTS_* and SUM_ALERTS_* at the end. The sums are
+    reduced home by home in the same order as the serial computation, so results are identical.
+
+    :param homes:           List of tuples (community, file, index of the row).
+    :param alerts_masks:    Alerts to compute for each file (see covered_alerts). All alerts are
+                            computed for a file without mask.
+    """
+    matrices: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+        "CDB": (MATRIX_ALERTS_CDB, SUM_ALERTS_CDB),
+        "ECH": (MATRIX_ALERTS_ECH, SUM_ALERTS_ECH)
+    }
+    shms: Dict[str, Tuple[shared_memory.SharedMemory, shared_memory.SharedMemory]] = {}
+    for community, (matrix, _) in matrices.items():
+        # The size of a shared memory must be strictly positive.
+        shms[community] = (
+            shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1)),
+            shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
         )
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=shms[community][0].buf)[:] = matrix
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=shms[community][1].buf)[:] = 0
+    blocks: Dict[str, Tuple[str, str, Tuple[int, int]]] = {
+        community: (matrix_shm.name, sums_shm.name, matrices[community][0].shape)
+        for community, (matrix_shm, sums_shm) in shms.items()
+    }
+    try:
+        with multiprocessing.Pool(NB_SLAVES, init_reaction_worker, (blocks,)) as p:
+            reaction_map = {
+                file: p.apply_async(
+                    reaction_worker, (community, file, i, alerts_masks.get(file))
+                )
+                for community, file, i in homes
+            }
+            # For each process, we wait the end of the execution
+            for _, reaction in reaction_map.items():
+                reaction.get()
+        for community, (matrix, sum_alerts) in matrices.items():
+            matrix_shm, sums_shm = shms[community]
+            matrix[:] = np.ndarray(matrix.shape, dtype=np.float64, buffer=matrix_shm.buf)
+            contributions: np.ndarray = (
+                np.ndarray(matrix.shape, dtype=np.float64, buffer=sums_shm.buf)
+            )
+            # Deterministic reduction in the order of the homes.
+            for i in range(len(contributions)):
+                sum_alerts += contributions[i]
+            # Release the view before closing the shared memory.
+            del contributions
+    finally:
+        for matrix_shm, sums_shm in shms.values():
+            for shm in [matrix_shm, sums_shm]:
+                shm.close()
+                shm.unlink()
 
 
 def compute_alert_reaction() -> NoReturn:
     """
     Function for reactions.
     """
-    for community in COMMUNITY_NAME:
-        print("--------------Computing Alerts--------------")
-        path: str = f"{CURRENT_FOLDER}/{community}"
-        # For all file in the data folder
-        i: int = 0
-        for file in sorted(os.listdir(path)):
-            if file == '.DS_Store':
-                continue
+    print("--------------Computing Alerts--------------")
+    homes: List[Tuple[str, str, int]] = reaction_homes()
+    alerts_masks: Dict[str, np.ndarray] = covered_alerts(homes) if USE_COVERAGE else {}
+    # Homes without any used slot during the alerts are not loaded
+    homes: List[Tuple[str, str, int]] = [
+        home for home in homes if home[1] not in alerts_masks or alerts_masks[home[1]].any()
+    ]
+    if PARALLEL_REACTION:
+        parallel_alert_reaction(homes, alerts_masks)
+    else:
+        for community, file, i in homes:
             print(f"---------------{file[:6]}---------------")
-            df: pd.DataFrame = pd.read_csv(f"{path}/{file}")
-            df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
-            df['day']: pd.TimestampSeries = pd.to_datetime(df['day'])
-            df: pd.DataFrame = df[df['p_cons'] > 0]
-            # Find if a house reacted to the message
-            if community == "CDB" and file[:6] in ALL_CDB:
-                find_reaction_report(
-                    df, ALERTS_CDB, MATRIX_ALERTS_CDB, SUM_ALERTS_CDB, i
-                )
-                i += 1
-            elif community == "ECH" and file[:6] in ALL_ECH:
-                find_reaction_report(
-                    df, ALERTS_ECH, MATRIX_ALERTS_ECH, SUM_ALERTS_ECH, i
-                )
-                i += 1
+            with profiled('reaction', file[:6]):
+                df: pd.DataFrame = load_reaction_home(community, file)
+                # Find if a house reacted to the message
+                if community == "CDB":
+                    find_reaction_report(
+                        df, ALERTS_CDB, MATRIX_ALERTS_CDB, SUM_ALERTS_CDB, i,
+                        alerts_masks.get(file)
+                    )
+                else:
+                    find_reaction_report(
+                        df, ALERTS_ECH, MATRIX_ALERTS_ECH, SUM_ALERTS_ECH, i,
+                        alerts_masks.get(file)
+                    )
     # Take all home ids and add (%)
-    cdb_home_id: List[str] = [f + ' (%)' for f in ALL_CDB]
+    cdb_home_id: List[str] = [f + ' (%)' for f in ALL_HOMES_CDB]
     ech_home_id: List[str] = [f + ' (%)' for f in ALL_ECH]
 
     # Export MATRIX_ALERTS_CDB or MATRIX_ALERTS_ECH in excel files
@@ -259,15 +564,12 @@ def plot_average() -> NoReturn:
     # Plot an average for a given date for a community
     if AVERAGE_COMMUNITY:
         print("--------------Plotting average--------------")
-        for i in [5, 10, 15, 20, 25, 30]:
-            plot_average_community(starting, ending, i)
+        plot_average_community(starting, ending, [5, 10, 15, 20, 25, 30])
 
     # Plot the average communities together
     if AVERAGE_COMMUNITIES:
         print("--------------Plotting average through communities--------------")
-        for nb_selected_house in [5, 10, 15, 20, 25, 30, 35, 40, 45]:
-            print(f"--------------{nb_selected_house} selected houses--------------")
-            average_through_community(starting, ending, nb_selected_house)
+        average_through_community(starting, ending, [5, 10, 15, 20, 25, 30, 35, 40, 45])
 
     # Plot all aggregation
     if AGGREGATION:
@@ -275,47 +577,62 @@ def plot_average() -> NoReturn:
         plot_aggregation(starting, ending)
 
 
-def plot_flukso() -> NoReturn:
+def flukso_figures() -> Iterator[FigureJob]:
     """
-    Function to plot flukso data.
+    Create the jobs of the basic or area plots of flukso data.
+
+    :return:    Return an iterator over the jobs.
     """
     cdt: bool = True
     # For all communities
-    if BASIC_PLOT or AREA_PLOT:
-        for community in COMMUNITY_NAME:
-            print("--------------Plotting--------------")
-            # For all file in the data folder
-            for file in sorted(os.listdir(f"{CURRENT_FOLDER}/{community}")):
-                print(f"---------------{file[:6]}---------------")
-                df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/{community}/{file}")
-                home_id: str = df.at[0, 'home_id']
-                starting: dt.datetime = dt.datetime(2022, 5, 17, 0, 0, 0).astimezone()
-                ending: dt.datetime = dt.datetime(2022, 5, 17, 23, 59, 59).astimezone()
-                path: str = f"{PLOT_PATH}/{community}/{home_id}/{FMT}"
-                if not BASIC_DATA:
-                    cdt: bool = (
-                        int(file[12:14]) == starting.month and int(file[7:11]) == starting.year
-                    )
-                if cdt and file[:6] not in [
-                    'ECHA01', 'ECHASC', 'ECHBUA', 'ECHCOM', 'ECHL09', 'ECHL17'
-                ]:
+    for community in COMMUNITY_NAME:
+        print("--------------Plotting--------------")
+        # For all file in the data folder
+        for file in sorted(os.listdir(f"{CURRENT_FOLDER}/{community}")):
+            print(f"---------------{file[:6]}---------------")
+            starting: dt.datetime = dt.datetime(2022, 5, 17, 0, 0, 0).astimezone()
+            ending: dt.datetime = dt.datetime(2022, 5, 17, 23, 59, 59).astimezone()
+            df: pd.DataFrame = load_home_range(community, file, starting, ending)
+            if df.empty:
+                continue
+            home_id: str = df.at[0, 'home_id']
+            path: str = f"{PLOT_PATH}/{community}/{home_id}/{FMT}"
+            if not BASIC_DATA:
+                cdt: bool = (
+                    int(file[12:14]) == starting.month and int(file[7:11]) == starting.year
+                )
+            if cdt and file[:6] not in [
+                'ECHA01', 'ECHASC', 'ECHBUA', 'ECHCOM', 'ECHL09', 'ECHL17'
+            ]:
+                if PARQUET_DATA:
+                    # The Parquet storage already gives a datetime in UTC
+                    df['ts']: pd.TimestampSeries = df['ts'].dt.tz_convert(TZ)
+                else:
                     # Change it later because we will receive a correct df with the timezone
                     df['ts']: pd.TimestampSeries = (
                         pd.to_datetime(df['ts'])
                         .dt
                         .tz_localize(pytz.timezone('Europe/Brussels'), ambiguous=True)
                     )
-                    if BASIC_PLOT:
-                        plot_data(
-                            df, path, starting, ending,
-                            f"Home: {home_id}", 'multiple_flukso',
-                            f"{home_id}_{starting}_{ending}_{FMT}"
-                        )
-                    elif AREA_PLOT:
-                        plot_data(
-                            df, path, starting, ending,
-                            f"Home: {home_id}", 'flukso', f"{home_id}_{starting}_{ending}_{FMT}"
-                        )
+                if BASIC_PLOT:
+                    yield plot_data_job(
+                        df, path, starting, ending,
+                        f"Home: {home_id}", 'multiple_flukso',
+                        f"{home_id}_{starting}_{ending}_{FMT}"
+                    )
+                elif AREA_PLOT:
+                    yield plot_data_job(
+                        df, path, starting, ending,
+                        f"Home: {home_id}", 'flukso', f"{home_id}_{starting}_{ending}_{FMT}"
+                    )
+
+
+def plot_flukso() -> NoReturn:
+    """
+    Function to plot flukso data.
+    """
+    if BASIC_PLOT or AREA_PLOT:
+        render_figures(flukso_figures())
     plot_average()
 
 
@@ -342,13 +659,12 @@ def plot_rtu() -> NoReturn:
 
     if PLOT_MEDIAN_QUANTILE_RTU:
         print("--------------Plotting RTU quantile--------------")
-        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/RTU/{file_name}")
-        df['ts']: pd.Series = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
+        df: pd.DataFrame = load_home('RTU', file_name, parse_ts=True)
         plot_median_quantile_rtu(df, f"{PLOT_PATH}/RTU", time_series)
 
     if PLOT_RANGE_RTU:
         print("--------------Plotting RTU range--------------")
-        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/RTU/{file_name}")
+        df: pd.DataFrame = load_home('RTU', file_name)
         starting: dt.datetime = dt.datetime(2022, 12, 21, 0, 0, 0).astimezone()
         ending: dt.datetime = dt.datetime(2022, 12, 21, 23, 59, 59).astimezone()
         plot_data(
@@ -358,14 +674,84 @@ def plot_rtu() -> NoReturn:
 
     if MEAN_WED_RTU:
         print("--------------Plotting RTU mean wednesday--------------")
-        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/RTU/{file_name}")
-        df['ts']: pd.Series = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
-        df: pd.DataFrame = df[(df['ts'].dt.weekday == 2) & (df['ts'].dt.year != 2023)]
-        not_during_light: pd.DataFrame = df[~((df['ts'].dt.day == 21) & (df['ts'].dt.month == 12))]
-        mean: pd.DataFrame = df.groupby(not_during_light['ts'].dt.time).mean(numeric_only=True)
+        df: pd.DataFrame = load_home('RTU', file_name, parse_ts=True)
+        # Typical wednesday without 2023 and without the 21st of December (light)
+        mean: pd.DataFrame = profile(
+            df, ['active'], slot_step(time_series), ['mean'],
+            weekdays=[2], excluded_years=[2023], excluded_days=[(12, 21)]
+        )['mean']
         rtu_plot(mean, time_series, f"{PLOT_PATH}/RTU", 'Mean wednesday RTU')
 
 
+def sketch_quantile_jobs(
+    community: str, file: str, time_series: pd.Series, query: Optional[str] = None
+) -> Iterator[FigureJob]:
+    """
+    Create the jobs of the plots of the median and quantiles of a home from a sketch per slot,
+    built chunk by chunk.
+
+    :param community:   The name of the community.
+    :param file:        The name of the file.
+    :param time_series: Series with the time.
+    :param query=None:  Query to select rows (e.g. 'p_cons > 0').
+
+    :return:            Return an iterator over the jobs.
+    """
+    columns: List[str] = ['p_cons', 'p_prod', 'p_tot']
+    sketch: np.ndarray = home_sketch(community, file, columns, slot_step(time_series), query)
+    if not sketch.any():
+        print(f"----------{file} is empty----------")
+        return
+    median, first_q, third_q = sketch_quantiles(sketch, columns, [0.5, 0.25, 0.75])
+    yield from quantile_flukso_jobs(
+        median, first_q.abs(), third_q.abs(), file[:6],
+        f"{PLOT_PATH}/{community}/{file[:6]}", time_series
+    )
+
+
+def median_quantile_figures(time_series: pd.Series) -> Iterator[FigureJob]:
+    """
+    Create the jobs of the plots of the median and quantiles of flukso data.
+
+    :param time_series: Series with the time.
+
+    :return:            Return an iterator over the jobs.
+    """
+    print("----------CDB----------")
+    for cdb in ALL_CDB:
+        print(f"----------{cdb}----------")
+        # Jobs of a home are created in the profiled block and given after it.
+        with profiled('plot_median_quantile', cdb[:6]):
+            if STREAM_QUANTILES:
+                jobs: List[FigureJob] = list(
+                    sketch_quantile_jobs('CDB', cdb, time_series, 'p_cons > 0')
+                )
+            else:
+                df: pd.DataFrame = load_home('CDB', cdb, parse_ts=True)
+                df: pd.DataFrame = df[df['p_cons'] > 0]
+                if df.empty:
+                    print(f"----------{cdb} is empty----------")
+                    print("----------There is no cons > 0----------")
+                jobs: List[FigureJob] = [] if df.empty else list(
+                    median_quantile_flukso_jobs(df, f"{PLOT_PATH}/CDB/{cdb[:6]}", time_series)
+                )
+        yield from jobs
+    print("----------ECH----------")
+    for ech in ALL_ECH:
+        print(f"----------{ech}----------")
+        with profiled('plot_median_quantile', ech[:6]):
+            if STREAM_QUANTILES:
+                jobs: List[FigureJob] = list(sketch_quantile_jobs('ECH', ech, time_series))
+            else:
+                df: pd.DataFrame = load_home('ECH', ech, parse_ts=True)
+                if df.empty:
+                    print(f"----------{ech} is empty----------")
+                jobs: List[FigureJob] = [] if df.empty else list(
+                    median_quantile_flukso_jobs(df, f"{PLOT_PATH}/ECH/{ech[:6]}", time_series)
+                )
+        yield from jobs
+
+
 def prepare_plot_median_quantile_flukso():
     """
     Function to prepare and apply the plotting of the median and quantiles of flukso data.
@@ -385,31 +771,57 @@ def prepare_plot_median_quantile_flukso():
             .reset_index(drop=True)
         )
     print("----------Ploting quantiles----------")
-    print("----------CDB----------")
-    for cdb in ALL_CDB:
-        print(f"----------{cdb}----------")
-        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/CDB/{cdb}")
-        # Add correct datetime with timezone.
-        df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
-        df: pd.DataFrame = df[df['p_cons'] > 0]
-        if df.empty:
-            print(f"----------{cdb} is empty----------")
-            print("----------There is no cons > 0----------")
-            continue
-        plot_median_quantile_flukso(
-            df, f"{PLOT_PATH}/CDB/{cdb[:6]}", time_series
+    render_figures(median_quantile_figures(time_series))
+
+
+def mean_wednesday_figures() -> Iterator[FigureJob]:
+    """
+    Create the jobs of the plots of the mean for a typical wednesday in CDB.
+
+    :return:    Return an iterator over the jobs.
+    """
+    time_series: pd.Series = (
+        pd.date_range("00:00:00", freq='15min', periods=96)
+        .to_series()
+        .apply(lambda x: x.strftime('%H:%M:%S'))
+        .reset_index(drop=True)
+    )
+    # Typical wednesday without 2023 and without the 21st of December (light)
+    profiles: Dict[str, Dict[str, pd.DataFrame]] = home_profiles(
+        [('CDB', cdb) for cdb in ALL_CDB], ['p_cons', 'p_prod', 'p_tot'],
+        pd.Timedelta('15min'), ['mean'], query='p_cons > 0',
+        weekdays=[2], excluded_years=[2023], excluded_days=[(12, 21)]
+    )
+    for cdb, stats in profiles.items():
+        yield flukso_plot_job(
+            stats['mean'], time_series, f"{PLOT_PATH}/CDB/{cdb[:6]}", f"Mean wednesday {cdb[:6]}"
         )
-    print("----------ECH----------")
-    for ech in ALL_ECH:
-        print(f"----------{ech}----------")
-        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/ECH/{ech}")
-        # Add correct datetime with timezone.
-        df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
-        if df.empty:
-            print(f"----------{ech} is empty----------")
+
+
+def community_profile_figures() -> Iterator[FigureJob]:
+    """
+    Create the jobs of the plots of the median and quantiles of each community, merged from the
+    statistics per slot of its homes.
+
+    :return:    Return an iterator over the jobs.
+    """
+    step: pd.Timedelta = pd.Timedelta(SLOT_STATS_STEP)
+    time_series: pd.Series = (
+        pd.date_range("00:00:00", freq=step, periods=pd.Timedelta(days=1) // step)
+        .to_series()
+        .apply(lambda x: x.strftime('%H:%M:%S'))
+        .reset_index(drop=True)
+    )
+    for community, all_files in [('CDB', ALL_CDB), ('ECH', ALL_ECH)]:
+        print(f"----------{community}----------")
+        merged: Optional[Dict[str, np.ndarray]] = merge_slot_stats(all_files, step)
+        if merged is None:
+            print(f"----------No statistics per slot for {community}----------")
             continue
-        plot_median_quantile_flukso(
-            df, f"{PLOT_PATH}/ECH/{ech[:6]}", time_series
+        stats: Dict[str, pd.DataFrame] = merged_profile(merged, [0.5, 0.25, 0.75])
+        yield from quantile_flukso_jobs(
+            stats[0.5], stats[0.25].abs(), stats[0.75].abs(), f"{community}ALL",
+            f"{PLOT_PATH}/{community}/community_profile", time_series
         )
 
 
@@ -418,39 +830,7 @@ def compute_mean_wednesday_flukso():
     Compute the mean for a typical wednesday in CDB.
     """
     print("----------Compute mean for wednesday----------")
-    for cdb in ALL_CDB:
-        print(f"----------{cdb}----------")
-        time_series: pd.Series = (
-            pd.date_range("00:00:00", freq='15min', periods=96)
-            .to_series()
-            .apply(lambda x: x.strftime('%H:%M:%S'))
-            .reset_index(drop=True)
-        )
-        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/CDB/{cdb}")
-        df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
-        df: pd.DataFrame = df[(df['ts'].dt.weekday == 2) & (df['ts'].dt.year != 2023)]
-        df: pd.DataFrame = df[df['p_cons'] > 0]
-        if df.empty:
-            print(f"----------{cdb} is empty----------")
-            print("----------There is no cons > 0----------")
-            continue
-        df: pd.DataFrame = (
-            df
-            .resample('15min', on='ts')
-            .mean(numeric_only=True)
-            .reset_index()
-        )
-        not_during_light: pd.DataFrame = (
-            df[~((df['ts'].dt.day == 21) & (df['ts'].dt.month == 12))]
-        )
-        mean: pd.DataFrame = (
-            df
-            .groupby(not_during_light['ts'].dt.time)
-            .mean(numeric_only=True)
-        )
-        flukso_plot(
-            mean, time_series, f"{PLOT_PATH}/CDB/{cdb[:6]}", f"Mean wednesday {cdb[:6]}"
-        )
+    render_figures(mean_wednesday_figures())
 
 
 def all_plots() -> NoReturn:
@@ -466,71 +846,54 @@ def all_plots() -> NoReturn:
 
         if MEAN_WED_FLUKSO:
             compute_mean_wednesday_flukso()
+
+        if COMMUNITY_PROFILE:
+            print("----------Plotting community profiles----------")
+            render_figures(community_profile_figures())
     if RTU:
         plot_rtu()
 
 
 def compute_auto_consumption(
     df: pd.DataFrame,
-    month: int,
-    columns: List[str],
+    months: List[int],
     communal_df: Optional[pd.DataFrame] = None
-) -> pd.DataFrame:
+) -> np.ndarray:
     """
     Function to compute the auto consumption, the total consumption and
-    the total production during a month.
+    the total production of all months in one pass.
 
-    :param df:          DataFrame with data where we need a column 'ts', 'day', 'p_cons', 'p_prod'.
-    :param month:       The number of the month (January is 1 and december is 12).
-    :param columns:     List with the name of columns.
-    :param communal_df:   DataFrame of the common in ECH. If CDB = None.
+    :param df:          DataFrame with data where we need a column 'ts', 'p_cons', 'p_prod'.
+                        The column 'ts' contains datetimes in our timezone.
+    :param months:      List with the number of months (January is 1 and december is 12).
+    :param communal_df: DataFrame of the common in ECH. If CDB = None.
 
-    :return:            Return a DataFrame with the percentage of auto consumption, the total
-                        consumption and the total production.
+    :return:            Return an array (months x 3) with the percentage of auto consumption,
+                        the total consumption and the total production.
     """
-    months_list: List[str] = [
-        'Janvier', 'Février', 'Mars', 'Avril',
-        'Mai', 'Juin', 'Juillet', 'Aout',
-        'Septembre', 'Octobre', 'Novembre', 'Decembre'
-    ]
-    # Convert the ts in datetime to manipulate it.
-    df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
-    # Consider the month that we want to compute
-    work_df: pd.DataFrame = df[(df['ts'].dt.month == month)]
     # Check if we are in the case of the ECH or not
     if communal_df is not None:
-        communal_df['ts']: pd.TimestampSeries = (
-            pd.to_datetime(communal_df['ts'], utc=True)
-            .dt
-            .tz_convert(TZ)
+        df: pd.DataFrame = df[['ts', 'p_cons', 'p_prod']].merge(
+            communal_df[['ts', 'p_cons', 'p_prod']], on='ts', how='outer', suffixes=('', '_com')
         )
-        communal_df: pd.DataFrame = communal_df[communal_df['ts'].dt.month == month]
-        work_df['p_prod']: pd.Series = work_df['p_prod'].add(communal_df['p_prod'], fill_value=0)
-        work_df['p_cons']: pd.Series = work_df['p_cons'].add(communal_df['p_cons'], fill_value=0)
-    # Keep only periods where the production is negative meaning that there is a production.
-    work_df: pd.DataFrame = work_df[work_df["p_prod"] < 0]
-    # Keep only periods where the consumption is positive (remove errors).
-    work_df: pd.DataFrame = work_df[work_df["p_cons"] > 0]
-    # Compute the consumption according to the production. If the production is lower than
-    # the consumption we add the production because we need it for the auto consumption and
-    # we don't care about the extra consumption. Else, we add the consumption. (Conditional sum)
-    p_cons: float = (
-        work_df[work_df['p_cons'] <= -work_df['p_prod']]['p_cons'].sum()
-        + (-1 * work_df[work_df['p_cons'] > -work_df['p_prod']]['p_prod']).sum()
-    )
-    # Compute the sum for the production.
-    p_prod: float = work_df['p_prod'].sum()
+        df['p_prod']: pd.Series = df['p_prod'].add(df['p_prod_com'], fill_value=0)
+        df['p_cons']: pd.Series = df['p_cons'].add(df['p_cons_com'], fill_value=0)
+    month: np.ndarray = df['ts'].dt.month.to_numpy()
+    p_cons: np.ndarray = df['p_cons'].to_numpy(dtype=float)
+    p_prod: np.ndarray = df['p_prod'].to_numpy(dtype=float)
+    # Keep only periods where the production is negative meaning that there is a production
+    # and where the consumption is positive (remove errors).
+    keep: np.ndarray = (p_prod < 0) & (p_cons > 0)
+    # If the production is lower than the consumption we add the production because we need
+    # it for the auto consumption and we don't care about the extra consumption. Else, we add
+    # the consumption.
+    auto: np.ndarray = np.bincount(
+        month[keep], weights=np.minimum(p_cons[keep], -p_prod[keep]), minlength=13
+    )[months]
+    prod: np.ndarray = np.bincount(month[keep], weights=p_prod[keep], minlength=13)[months]
     # Compute the auto consumption.
-    percentage_auto_consumption: float = (p_cons / (p_prod if p_prod != 0 else 1)) * 100
-    percentage_auto_consumption: float = (
-        percentage_auto_consumption * -1
-        if percentage_auto_consumption < 0 else percentage_auto_consumption
-    )
-    # percentage_auto_consumption
-    return pd.DataFrame(
-        [[months_list[month - 1], percentage_auto_consumption, p_cons, p_prod]],
-        columns=columns
-    )
+    percentage: np.ndarray = np.abs(auto / np.where(prod != 0, prod, 1) * 100)
+    return np.column_stack((percentage, auto, prod))
 
 
 def auto_consumption() -> NoReturn:
@@ -558,55 +921,67 @@ def auto_consumption() -> NoReturn:
     December    |        x         |         x         |         X        |
     """
     columns: List[str] = ['Month', 'Autoconsommation', 'consommation totale', 'production totale']
+    months_list: List[str] = [
+        'Janvier', 'Février', 'Mars', 'Avril',
+        'Mai', 'Juin', 'Juillet', 'Aout',
+        'Septembre', 'Octobre', 'Novembre', 'Decembre'
+    ]
+    months: List[int] = [1, 2, 4, 5, 7, 8, 10, 11]
+    names: List[str] = [months_list[month - 1] for month in months]
     print("--------------------Computing autoconsumption...--------------------")
-    res: pd.DataFrame = pd.DataFrame(columns=columns)
+    rows: List[list] = []
     print("--------------------CDB--------------------")
     for house in ALL_CDB:
         print(f"--------------------{house}--------------------")
-        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/CDB/{house}")
-        res: pd.DataFrame = pd.concat(
-            [
-                res,
-                pd.DataFrame(
-                    [[
-                        f"{house}", 'Autoconsommation',
-                        'consommation totale', 'production totale'
-                    ]],
-                    columns=columns
-                )
-            ]
-        )
-        for month in [1, 2, 4, 5, 7, 8, 10, 11]:
-            res = pd.concat([res, compute_auto_consumption(df, month, columns)])
+        with profiled('auto_consumption', house[:6]):
+            df: pd.DataFrame = load_home('CDB', house, parse_ts=True)
+            values: np.ndarray = compute_auto_consumption(df, months)
+        rows.append([f"{house}", 'Autoconsommation', 'consommation totale', 'production totale'])
+        rows.extend([name, *row] for name, row in zip(names, values.tolist()))
     print("--------------------Computing of autoconsumption finished !--------------------")
     print("--------------------Saving file...--------------------")
-    if res.empty:
+    if not rows:
         print("--------------------Save aborted! The file is empty--------------------")
     else:
-        res.to_excel(excel_writer=f"{PLOT_PATH}/CDB_auto_consumption.xlsx", index=False)
+        pd.DataFrame(rows, columns=columns).to_excel(
+            excel_writer=f"{PLOT_PATH}/CDB_auto_consumption.xlsx", index=False
+        )
         print("--------------------Save complete !--------------------")
     print("--------------------ECH--------------------")
-    res: pd.DataFrame = pd.DataFrame(columns=columns)
+    cube: Optional[Dict[str, np.ndarray]] = load_cube(FMT) if CUBE_DATA else None
     communal_df: pd.DataFrame = pd.DataFrame()
-    for communal in ALL_COMMUNAL:
-        communal_df = pd.concat(
-            [communal_df, pd.read_csv(f"{CURRENT_FOLDER}/ECH/{communal}")]
-        )
+    if cube is not None:
+        communal_df: pd.DataFrame = cube_frame(cube, ALL_COMMUNAL, 'sum')
+    else:
+        for communal in ALL_COMMUNAL:
+            communal_df = pd.concat(
+                [communal_df, load_home('ECH', communal, parse_ts=True)]
+            )
     if communal_df.empty:
         print("--------------------Computation aborted! No production data--------------------")
     else:
-        communal_df: pd.DataFrame = communal_df.groupby('ts').sum(numeric_only=True).reset_index()
-        df_echs: pd.DataFrame = pd.DataFrame()
-        for house in ALL_ECH:
-            print(f"--------------------{house}--------------------")
-            df_echs: pd.DataFrame = pd.concat(
-                [df_echs, pd.read_csv(f"{CURRENT_FOLDER}/ECH/{communal}")]
-            )
-        df_echs: pd.DataFrame = df_echs.groupby('ts').sum(numeric_only=True).reset_index()
-        for month in [1, 2, 4, 5, 7, 8, 10, 11]:
-            res: pd.DataFrame = pd.concat(
-                [res, compute_auto_consumption(df_echs, month, columns, communal_df)]
+        if cube is not None:
+            df_echs: pd.DataFrame = cube_frame(cube, ALL_ECH, 'sum')
+        else:
+            communal_df: pd.DataFrame = (
+                communal_df.groupby('ts').sum(numeric_only=True).reset_index()
             )
+            df_echs: pd.DataFrame = pd.DataFrame()
+            for house in ALL_ECH:
+                print(f"--------------------{house}--------------------")
+                with profiled('auto_consumption', house[:6]):
+                    df_echs: pd.DataFrame = pd.concat(
+                        [df_echs, load_home('ECH', house, parse_ts=True)]
+                    )
+            df_echs: pd.DataFrame = df_echs.groupby('ts').sum(numeric_only=True).reset_index()
+        res: pd.DataFrame = pd.DataFrame(
+            [
+                [name, *values] for name, values in zip(
+                    names, compute_auto_consumption(df_echs, months, communal_df).tolist()
+                )
+            ],
+            columns=columns
+        )
         print("--------------------Computing of autoconsumption finished !--------------------")
         print("--------------------Saving file...--------------------")
         if res.empty:
@@ -619,33 +994,13 @@ def auto_consumption() -> NoReturn:
 
 def check_empty_date() -> NoReturn:
     """
-    Function to info which data are used and which aren't used.
+    Function to info which data are used and which aren't used. For each community, we build the
+    coverage index with one bit per slot of 15 minutes for each home.
     """
-    print("--------------------Creating file with state of data...--------------------")
+    print("--------------------Creating the coverage index...--------------------")
     for community in COMMUNITY_NAME:
-        final_df: pd.DataFrame = pd.DataFrame()
-        columns: List = []
         print(f"--------------------{community}--------------------")
-        for home in sorted(os.listdir(f"{CURRENT_FOLDER}/{community}")):
-            if home == '.DS_Store':
-                continue
-            print(f"--------------------{home}--------------------")
-            df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/{community}/{home}")
-            df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
-            df: pd.DataFrame = df.resample('15min', on='ts').mean(numeric_only=True).reset_index()
-            ts: pd.DataFrame = (
-                pd.concat(
-                    [df['ts'].dt.tz_localize(None), ((df['p_cons'] >= 0) & (df['p_prod'] <= 0))],
-                    axis=1
-                )
-            )
-            columns += [home[:6], 'utilisé']
-            final_df: pd.DataFrame = pd.concat([final_df, ts], axis=1, ignore_index=True)
-        final_df.columns = columns
-        final_df.to_excel(
-            excel_writer=f"{PLOT_PATH}/{community}_state.xlsx",
-            index=False
-        )
+        build_coverage(community)
     print("--------------------Done!--------------------")
 
 
@@ -675,36 +1030,68 @@ def manage_concat() -> NoReturn:
             'tension1_2', 'tension2_3', 'tension3_1'
         ]
     # yearly or monthly
-    concat_data(columns_name, "yearly")
+    if STREAM_CONCAT:
+        stream_concat_data(columns_name, "yearly")
+    else:
+        concat_data(columns_name, "yearly")
 
 
 def main() -> NoReturn:
     """
     Main function
     """
+    # Remove the profiles of the previous run
+    if PROFILE:
+        clear_profiles()
+
     # Concat all data in one file
     if CONCAT_DATA:
-        manage_concat()
+        with profiled('stages', 'concat'):
+            manage_concat()
 
     # Manage all data
     if MANAGE_DATA:
-        manage_data()
+        with profiled('stages', 'manage'):
+            manage_data()
+
+    # Convert the CSV files into the Parquet storage
+    if CONVERT_PARQUET:
+        with profiled('stages', 'convert_parquet'):
+            convert_dataset()
+
+    # Build the cube of all homes shared by community aggregations
+    if BUILD_CUBE:
+        with profiled('stages', 'build_cube'):
+            build_cube(FMT)
+
+    # Save the statistics per slot of the day of each home
+    if BUILD_SLOT_STATS:
+        with profiled('stages', 'build_slot_stats'):
+            build_slot_stats(pd.Timedelta(SLOT_STATS_STEP))
 
     # Compute and show the information about the alert
     if REACTION:
-        compute_alert_reaction()
+        with profiled('stages', 'reaction'):
+            compute_alert_reaction()
 
     # Plot
     if PLOT:
-        all_plots()
+        with profiled('stages', 'plot'):
+            all_plots()
 
     # Compute the auto consumption
     if AUTO_CONSUMPTION:
-        auto_consumption()
+        with profiled('stages', 'auto_consumption'):
+            auto_consumption()
 
     # Check if there is empty date
     if CHECK_DATES:
-        check_empty_date()
+        with profiled('stages', 'check_dates'):
+            check_empty_date()
+
+    # Summarize the profiles of the stages and homes
+    if PROFILE:
+        profile_summary()
 
 
 if __name__ == "__main__":
@@ -6,23 +6,32 @@ __license__ = "MIT"
 from config import (
     COMMUNITY_NAME,
     PLOT_PATH,
-    CURRENT_FOLDER,
     ALL_ECH,
     ALL_CDB,
     FMT,
     ALL_COMMUNAL,
     ALL_AGG_CDB,
-    BASIC_DATA
+    BASIC_DATA,
+    CUBE_DATA,
+    PLOT_DECIMATION,
+    MAX_FIGURE_WIDTH,
+    MAX_HOUR_TICKS,
+    MAX_DAY_TICKS
 )
+from cube import CHANNELS, cube_slice, load_cube
+from profiles import profile, slot_step
+from storage import load_home_range
+from utils import decimation_positions
 
 
 import datetime as dt
 import matplotlib.dates as dates
 import matplotlib.pyplot as plt
+import numpy as np
 import os
 import pandas as pd
 import random
-from typing import NoReturn, Optional, List, Tuple
+from typing import NoReturn, Dict, Optional, List, Tuple
 
 
 # ---------------------------------- #
@@ -30,114 +39,179 @@ from typing import NoReturn, Optional, List, Tuple
 # ---------------------------------- #
 
 
-def create_average_df(
+def prefix_averages(
+    ts: pd.Index, data: np.ndarray, house_nbs: List[int]
+) -> Dict[int, pd.DataFrame]:
+    """
+    Compute the average of the first houses for several numbers of houses, thanks to running
+    sums over the houses. Missing values are ignored and timestamps without any value are
+    removed, as a groupby on the timestamps would do.
+
+    :param ts:          Timestamps of the slots.
+    :param data:        Array (houses x slots x channels) where missing values are NaN.
+    :param house_nbs:   List of numbers of houses (at most the number of houses in data).
+
+    :return:            Return a dictionary with the averaged dataframe of each number of houses.
+    """
+    sums: np.ndarray = np.cumsum(np.nan_to_num(data), axis=0)
+    counts: np.ndarray = np.cumsum(~np.isnan(data), axis=0)
+    averages: Dict[int, pd.DataFrame] = {}
+    for house_nb in house_nbs:
+        count: np.ndarray = counts[house_nb - 1]
+        mean: np.ndarray = sums[house_nb - 1] / np.where(count > 0, count, 1)
+        mean[count == 0] = np.nan
+        keep: np.ndarray = count.any(axis=1)
+        new_df: pd.DataFrame = pd.DataFrame(mean[keep], columns=CHANNELS)
+        new_df.insert(0, 'ts', ts[keep])
+        averages[house_nb] = new_df
+    return averages
+
+
+def create_average_dfs(
     starting: dt.datetime,
     ending: dt.datetime,
     all_files: List[str],
-    house_nb: int
-) -> Tuple[pd.DataFrame, List[int]]:
+    house_nbs: List[int]
+) -> Tuple[Dict[int, pd.DataFrame], List[int]]:
     """
-    Function to create an average DataFrame over a period.
+    Function to create average DataFrames over a period for several numbers of houses. We draw
+    one random order of houses, so the average over n houses uses the first n houses of the
+    order. Each house is read once whatever the number of averages.
 
     :param starting:        The starting date.
     :param ending:          The ending date.
     :param all_files:       List of houses.
-    :param house_nb:        Number of house to apply the average.
+    :param house_nbs:       List of numbers of houses to apply the average.
 
-    :return:                Return the averaged dataframe and a list of selected houses.
+    :return:                Return a dictionary with the averaged dataframe of each number of
+                            houses and the order of selected houses.
     """
     # Set a specific seed to reproduce results
     random.seed(29173946721397129379172391)
-    # Create a new dataframe to apply the average
-    new_df: pd.DataFrame = pd.DataFrame(columns=['ts', 'p_cons', 'p_prod', 'p_tot'])
-    # Select randomly a number of files present in the given list of files
-    chosen_house = random.sample(range(0, len(all_files)), house_nb)
+    # Draw a random order of the files present in the given list of files
+    order: List[int] = random.sample(range(0, len(all_files)), len(all_files))
+    chosen_house: List[int] = order[:max(house_nbs, default=0)]
+    if not chosen_house:
+        return {house_nb: pd.DataFrame(columns=['ts'] + CHANNELS) for house_nb in house_nbs}, []
+    # Take the selected houses directly in the cube if it exists
+    cube: Optional[Dict[str, np.ndarray]] = load_cube(FMT) if CUBE_DATA else None
+    if cube is not None:
+        files: List[str] = [all_files[house] for house in chosen_house]
+        ts, data = cube_slice(cube, files, starting, ending)
+        return prefix_averages(ts, data, house_nbs), chosen_house
+    weeks: List[pd.DataFrame] = []
     # For each selected house
     for house in chosen_house:
         print(f"--------------{all_files[house]}--------------")
         # Read the file and create a dataframe
-        df: pd.DataFrame = pd.read_csv(
-            f"{CURRENT_FOLDER}/{all_files[house][:3]}/{all_files[house]}"
+        df: pd.DataFrame = load_home_range(
+            all_files[house][:3], all_files[house], starting, ending, ['ts'] + CHANNELS
         )
         # Query the period on the dataframe.
         week: pd.DataFrame = df.query(f"ts >= '{starting}' and ts <= '{ending}'")
-        # Concat all houses
-        new_df: pd.DataFrame = pd.concat([new_df, week])
-    # Apply the mean
-    new_df: pd.DataFrame = new_df.groupby('ts').mean(numeric_only=True).reset_index()
-    return new_df, chosen_house
+        weeks.append(week.groupby('ts').mean(numeric_only=True))
+    # Align all houses on the same timestamps
+    ts: pd.Index = weeks[0].index
+    for week in weeks[1:]:
+        ts: pd.Index = ts.union(week.index)
+    data: np.ndarray = np.stack(
+        [week.reindex(ts)[CHANNELS].to_numpy(dtype=np.float64) for week in weeks]
+    )
+    return prefix_averages(ts, data, house_nbs), chosen_house
+
+
+def create_average_df(
+    starting: dt.datetime,
+    ending: dt.datetime,
+    all_files: List[str],
+    house_nb: int
+) -> Tuple[pd.DataFrame, List[int]]:
+    """
+    Function to create an average DataFrame over a period.
+
+    :param starting:        The starting date.
+    :param ending:          The ending date.
+    :param all_files:       List of houses.
+    :param house_nb:        Number of house to apply the average.
+
+    :return:                Return the averaged dataframe and a list of selected houses.
+    """
+    averages, chosen_house = create_average_dfs(starting, ending, all_files, [house_nb])
+    return averages[house_nb], chosen_house
 
 
 def plot_average_community(
     starting: dt.datetime,
     ending: dt.datetime,
-    house_nb: int,
+    house_nbs: List[int],
 ) -> NoReturn:
     """
     Function to plot the average consumption from the starting date to the ending date for
-    a given community. The community is ECH or CDB.
+    a given community and for several numbers of houses. The community is ECH or CDB.
 
     :param starting:        The starting date.
     :param ending:          The ending date.
-    :param current_folder:  The folder where we need to consider data.
-    :param house_nb:        Number of house to apply the average.
+    :param house_nbs:       List of numbers of houses to apply the average.
     """
     # For file in the folder resampled folder
     for community in COMMUNITY_NAME:
         # Name of all houses that are taken into consideration
         if community == 'ECH':
-            house_name: str = "ECH_"
             all_files: List[str] = ALL_ECH
         else:
-            house_name: str = "CDB_"
             all_files: List[str] = ALL_CDB
-        if house_nb > len(all_files):
-            house_nb: int = len(all_files)
-        if house_nb == 0:
+        # Check if sizes exceed the number of files.
+        sizes: List[int] = sorted({min(house_nb, len(all_files)) for house_nb in house_nbs} - {0})
+        if not sizes:
             continue
         # Temporary files that we want to use
-        new_df, selected_houses = create_average_df(starting, ending, all_files, house_nb)
-        if new_df.empty:
-            print("----------The DataFrame is empty----------")
-            continue
-        for i in selected_houses:
-            house_name += all_files[i][-3:] + '_'
-        # Plot the results
-        plot_data(
-            new_df, f"{PLOT_PATH}/{community}/average_community", starting, ending,
-            f"average in {community} over {house_nb} houses", 'flukso',
-            f"average_{starting.date()}_{community}_{house_nb}_{house_name}_{FMT}"
-        )
+        averages, selected_houses = create_average_dfs(starting, ending, all_files, sizes)
+        for house_nb in sizes:
+            new_df: pd.DataFrame = averages[house_nb]
+            if new_df.empty:
+                print("----------The DataFrame is empty----------")
+                continue
+            house_name: str = f"{community}_"
+            for i in selected_houses[:house_nb]:
+                house_name += all_files[i][-3:] + '_'
+            # Plot the results
+            plot_data(
+                new_df, f"{PLOT_PATH}/{community}/average_community", starting, ending,
+                f"average in {community} over {house_nb} houses", 'flukso',
+                f"average_{starting.date()}_{community}_{house_nb}_{house_name}_{FMT}"
+            )
 
 
 def average_through_community(
     starting: dt.datetime,
     ending: dt.datetime,
-    house_nb: int
+    house_nbs: List[int]
 ) -> NoReturn:
     """
-    Function to plot the average consumption from the starting date to the ending date.
-    We apply the average over all houses in both communities.
+    Function to plot the average consumption from the starting date to the ending date for
+    several numbers of houses. We apply the average over all houses in both communities.
 
     :param starting:        The starting date.
     :param ending:          The ending date.
-    :param house_nb:        Number of house to apply the average.
+    :param house_nbs:       List of numbers of houses to apply the average.
     """
     # All files in the dataset
     all_files: List[str] = ALL_CDB + ALL_ECH
-    # Check if the size exceed the number of files.
-    if house_nb > len(all_files):
-        house_nb: int = len(all_files)
-    new_df, _ = create_average_df(starting, ending, all_files, house_nb)
-    if new_df.empty:
-        print("----------The DataFrame is empty----------")
-        return
-    # Plot the results
-    plot_data(
-        new_df, f"{PLOT_PATH}/average_community_CDB_ECH", starting, ending,
-        f"{house_nb} selected houses", 'flukso',
-        f"{house_nb}_selected_houses_{starting.date()}_{FMT}"
-    )
+    # Check if sizes exceed the number of files.
+    sizes: List[int] = sorted({min(house_nb, len(all_files)) for house_nb in house_nbs} - {0})
+    averages, _ = create_average_dfs(starting, ending, all_files, sizes)
+    for house_nb in sizes:
+        print(f"--------------{house_nb} selected houses--------------")
+        new_df: pd.DataFrame = averages[house_nb]
+        if new_df.empty:
+            print("----------The DataFrame is empty----------")
+            continue
+        # Plot the results
+        plot_data(
+            new_df, f"{PLOT_PATH}/average_community_CDB_ECH", starting, ending,
+            f"{house_nb} selected houses", 'flukso',
+            f"{house_nb}_selected_houses_{starting.date()}_{FMT}"
+        )
 
 
 def plot_aggregation(
@@ -270,9 +344,8 @@ def rtu_plot(df: pd.DataFrame, ts_series: pd.Series, path_to_save: str, title: s
     ax.set_ylabel('Power (Watt)')
     # Plot a title
     plt.suptitle(title)
-    # Check if the path exists. If it is not the case, we create it
-    if not os.path.exists(path_to_save):
-        os.makedirs(path_to_save)
+    # Create the path if it does not exist. Workers may create it at the same time.
+    os.makedirs(path_to_save, exist_ok=True)
     # Save the fig
     fig.savefig(
         f"{path_to_save}/rtu_mean_wednesday.png"
@@ -309,9 +382,8 @@ def flukso_plot(df: pd.DataFrame, ts_series: pd.Series, path_to_save: str, title
     ax.set_ylabel('Power (Watt)')
     # Plot a title
     plt.suptitle(title)
-    # Check if the path exists. If it is not the case, we create it
-    if not os.path.exists(path_to_save):
-        os.makedirs(path_to_save)
+    # Create the path if it does not exist. Workers may create it at the same time.
+    os.makedirs(path_to_save, exist_ok=True)
     # Save the fig
     fig.savefig(
         f"{path_to_save}/{path_to_save[-6:]}_mean_wednesday.png"
@@ -319,26 +391,50 @@ def flukso_plot(df: pd.DataFrame, ts_series: pd.Series, path_to_save: str, title
     plt.close()
 
 
+def tick_intervals(span: dt.timedelta) -> Tuple[int, int]:
+    """
+    Give the intervals between the ticks of hours and of days for a plotted period, so there are
+    at most MAX_HOUR_TICKS ticks of hours and MAX_DAY_TICKS ticks of days. Creating and drawing
+    one tick per hour on several weeks takes most of the time of a plot.
+
+    :param span:    Duration of the plotted period.
+
+    :return:        Return the interval in hours (dividing one day) and the interval in days.
+    """
+    hours: float = span / dt.timedelta(hours=1)
+    hour_interval: int = next(
+        (interval for interval in [1, 2, 3, 4, 6, 12] if hours / interval <= MAX_HOUR_TICKS), 24
+    )
+    day_interval: int = max(1, -(-(span.days + 1) // MAX_DAY_TICKS))
+    return hour_interval, day_interval
+
+
 def plot_formatter(
     ax: plt.Axes,
     ax2: plt.Axes,
     tz: dt.timezone,
-    i: Optional[int] = None
+    i: Optional[int] = None,
+    span: dt.timedelta = dt.timedelta(days=1)
 ) -> NoReturn:
     """
     Function to format the two axis on the graph.
 
-    :param ax:      1er axis.
-    :param ax2:     2e axis.
-    :param tz:      Timezone.
-    :param i=None:  Optional parameter used in the case where we want to plot 3 subplots.
+    :param ax:                      1er axis.
+    :param ax2:                     2e axis.
+    :param tz:                      Timezone.
+    :param i=None:                  Optional parameter used in the case where we want to plot 3
+                                    subplots.
+    :param span=timedelta(days=1):  Duration of the plotted period, used to space the ticks.
     """
+    hour_interval, day_interval = tick_intervals(span)
     # Create line separation on the plot
     ax.xaxis.grid(True, which="major")
     # Parameter to plot hours on the first axis
-    ax.xaxis.set_major_locator(dates.HourLocator(tz=tz))
+    ax.xaxis.set_major_locator(
+        dates.HourLocator(byhour=range(0, 24, hour_interval), tz=tz)
+    )
     # Parameter to plot days on the 2e axis
-    ax2.xaxis.set_major_locator(dates.DayLocator(tz=tz))
+    ax2.xaxis.set_major_locator(dates.DayLocator(interval=day_interval, tz=tz))
     if i is None:
         # Parameter to plot hours on the first axis
         ax.xaxis.set_major_formatter(dates.DateFormatter('%H', tz=tz))
@@ -390,11 +486,25 @@ def plot_data(
     week: pd.DataFrame = df.query(
         f"ts >= '{str_starting}' and ts <= '{str_ending}'"
     )
+    # Parameter to obtain a large figure, limited with the decimation
+    width: int = 10 * ((ending - starting).days + 1)
+    if PLOT_DECIMATION:
+        width: int = min(width, MAX_FIGURE_WIDTH)
+    plt.rcParams["figure.figsize"] = [width, 8]
+    if PLOT_DECIMATION:
+        # Keep only the samples that can be seen at the width of the figure in pixels
+        columns: List[str] = ['active'] if plot_type == 'rtu' else ['p_cons', 'p_prod', 'p_tot']
+        week: pd.DataFrame = week.iloc[decimation_positions(
+            week[columns].to_numpy(dtype=float),
+            int(plt.rcParams["figure.figsize"][0] * plt.rcParams["figure.dpi"])
+        )]
     # Create time values according to the format for the plot on the x-axis that is
     # on the bottom
     idx: pd.DatetimeIndex = pd.DatetimeIndex(week['ts'])
-    # Parameter to obtain a large figure
-    plt.rcParams["figure.figsize"] = [10 * ((ending - starting).days + 1), 8]
+    if idx.tz is not None:
+        # Same instants in UTC without timezone: matplotlib converts them at once instead of one
+        # datetime at a time. Ticks keep the timezone of the plot thanks to plot_formatter.
+        idx: pd.DatetimeIndex = idx.tz_convert(None)
     # Plot data
     if plot_type == "multiple_flukso":
         # Create the plot
@@ -407,7 +517,7 @@ def plot_data(
             # Plot data
             flukso_basic_plot(idx, week, ax, i)
             # Format axis
-            plot_formatter(ax, ax2, tz, i)
+            plot_formatter(ax, ax2, tz, i, ending - starting)
             # Set a limit for the second axis based on the first axis
             ax2.set_xlim(ax.get_xlim())
     else:
@@ -423,7 +533,7 @@ def plot_data(
             # Plot flukso data
             flukso_basic_plot(idx, week, ax)
         # Format axis
-        plot_formatter(ax, ax2, tz)
+        plot_formatter(ax, ax2, tz, span=ending - starting)
         # Set a limit for the second axis based on the first axis
         ax2.set_xlim(ax.get_xlim())
     # Set the title of the x/y-axis
@@ -431,9 +541,8 @@ def plot_data(
     ax.set_ylabel('Power (Watt)')
     # Plot a title
     plt.suptitle(title + f"\nPeriod: {starting} - {ending}\n")
-    # Check if the path exists. If it is not the case, we create it
-    if not os.path.exists(path):
-        os.makedirs(path)
+    # Create the path if it does not exist. Workers may create it at the same time.
+    os.makedirs(path, exist_ok=True)
     # Save the fig
     fig.savefig(f"{path}/{file_name}.png")
     plt.close()
@@ -492,9 +601,8 @@ def plot_median_quantile(
     #         plt.ylim(bottom=-0.1)
     # Plot a title
     plt.suptitle(title)
-    # Check if the path exists. If it is not the case, we create it
-    if not os.path.exists(path):
-        os.makedirs(path)
+    # Create the path if it does not exist. Workers may create it at the same time.
+    os.makedirs(path, exist_ok=True)
     # Save the fig
     if col_name == 'rtu':
         fig.savefig(
@@ -516,15 +624,51 @@ def plot_median_quantile_rtu(df: pd.DataFrame, plot_path: str, time_series: pd.S
     :param plot_path:   Path to save the plot.
     :param time_series: Series with the time.
     """
-    median: pd.DataFrame = df.groupby(df['ts'].dt.time).median(numeric_only=True)
-    first_q: pd.DataFrame = df.groupby(df['ts'].dt.time).quantile(q=0.25, numeric_only=True)
-    third_q: pd.DataFrame = df.groupby(df['ts'].dt.time).quantile(q=0.75, numeric_only=True)
+    stats: Dict[float, pd.DataFrame] = profile(
+        df, ['active'], slot_step(time_series), [0.5, 0.25, 0.75]
+    )
     title: str = "Low voltage cabin (RTU) - active power"
     plot_median_quantile(
-        median['active'], first_q['active'], third_q['active'], 'rtu', time_series, title, plot_path
+        stats[0.5]['active'], stats[0.25]['active'].abs(), stats[0.75]['active'].abs(), 'rtu',
+        time_series, title, plot_path
     )
 
 
+def median_quantile_flukso(
+    df: pd.DataFrame, time_series: pd.Series
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Function to compute the median, the first and the third quantile of each time of the day for
+    flukso data.
+
+    :param df:          DataFrame where the column 'ts' contains datetimes.
+    :param time_series: Series with the time.
+
+    :return:            Return the median, the first quantile and the third quantile (absolute
+                        values).
+    """
+    stats: Dict[float, pd.DataFrame] = profile(
+        df, ['p_cons', 'p_prod', 'p_tot'], slot_step(time_series), [0.5, 0.25, 0.75]
+    )
+    return stats[0.5], stats[0.25].abs(), stats[0.75].abs()
+
+
+def flukso_title(col: str, home_id: str) -> str:
+    """
+    Give the title of the plot of a power of a house.
+
+    :param col:     The name of the column.
+    :param home_id: The id of the house.
+
+    :return:        Return the title.
+    """
+    if col == 'p_cons':
+        return f"House's consumption: {home_id}"
+    elif col == 'p_prod':
+        return f"House's production: {home_id}"
+    return f"House's total power: {home_id}"
+
+
 def plot_median_quantile_flukso(
     df: pd.DataFrame, plot_path: str, time_series: pd.Series
 ) -> NoReturn:
@@ -535,16 +679,9 @@ def plot_median_quantile_flukso(
     :param plot_path:   Path.
     :param time_series: Series with the time.
     """
-    median: pd.DataFrame = df.groupby(df['ts'].dt.time).median(numeric_only=True)
-    first_q: pd.DataFrame = df.groupby(df['ts'].dt.time).quantile(q=0.25, numeric_only=True).abs()
-    third_q: pd.DataFrame = df.groupby(df['ts'].dt.time).quantile(q=0.75, numeric_only=True).abs()
+    median, first_q, third_q = median_quantile_flukso(df, time_series)
     for col in ['p_cons', 'p_prod', 'p_tot']:
-        if col == 'p_cons':
-            title: str = f"House's consumption: {df['home_id'].iloc[0]}"
-        elif col == 'p_prod':
-            title: str = f"House's production: {df['home_id'].iloc[0]}"
-        else:
-            title: str = f"House's total power: {df['home_id'].iloc[0]}"
         plot_median_quantile(
-            median[col], first_q[col], third_q[col], col, time_series, title, plot_path
+            median[col], first_q[col], third_q[col], col, time_series,
+            flukso_title(col, df['home_id'].iloc[0]), plot_path
         )
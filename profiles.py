@@ -0,0 +1,191 @@
+__title__ = "profiles"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import numpy as np
+import pandas as pd
+import warnings
+from typing import Dict, List, Optional, Tuple, Union
+
+from profiling import profiled
+from storage import load_home
+
+
+# Duration of a day in nanoseconds
+DAY_NS: int = 86400 * 10**9
+
+
+# ------------------------------------- #
+# ----------PROFILE FUNCTIONS---------- #
+# ------------------------------------- #
+
+
+def slot_step(time_series: pd.Series) -> pd.Timedelta:
+    """
+    Give the duration of a slot from the series of all times of a day.
+
+    :param time_series: Series containing all times of a day.
+
+    :return:            Return the duration.
+    """
+    return pd.Timedelta(days=1) / len(time_series)
+
+
+def day_matrix(
+    df: pd.DataFrame, columns: List[str], step: pd.Timedelta
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reshape the series of a home into an array (days x slots x columns). Slots are taken on the
+    local time of the day, so each row is a calendar day. Samples of the same slot are averaged
+    (e.g. the repeated hour of the change to winter time) and slots without any sample are NaN
+    (e.g. the skipped hour of the change to summer time).
+
+    :param df:      DataFrame where the column 'ts' contains datetimes in our timezone.
+    :param columns: List of columns to reshape.
+    :param step:    Duration of a slot. It must divide one day.
+
+    :return:        Return the dates of the rows (datetime64[D]) and the array.
+    """
+    nb_slots: int = DAY_NS // step.value
+    wall: np.ndarray = (
+        df['ts'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    )
+    days, rows = np.unique(wall // DAY_NS, return_inverse=True)
+    cells: np.ndarray = rows * nb_slots + (wall % DAY_NS) // step.value
+    size: int = len(days) * nb_slots
+    matrix: np.ndarray = np.empty((len(days), nb_slots, len(columns)))
+    for k, col in enumerate(columns):
+        values: np.ndarray = df[col].to_numpy(dtype=np.float64)
+        valid: np.ndarray = ~np.isnan(values)
+        sums: np.ndarray = np.bincount(cells[valid], weights=values[valid], minlength=size)
+        counts: np.ndarray = np.bincount(cells[valid], minlength=size)
+        means: np.ndarray = sums / np.where(counts > 0, counts, 1)
+        means[counts == 0] = np.nan
+        matrix[:, :, k] = means.reshape(len(days), nb_slots)
+    return days.astype('datetime64[D]'), matrix
+
+
+def day_filter(
+    dates: np.ndarray,
+    weekdays: Optional[List[int]] = None,
+    excluded_years: Optional[List[int]] = None,
+    excluded_days: Optional[List[Tuple[int, int]]] = None
+) -> np.ndarray:
+    """
+    Give the days to keep in a profile.
+
+    :param dates:               Dates of the rows (datetime64[D]).
+    :param weekdays=None:       List of weekdays to keep (Monday is 0). None to keep all days.
+    :param excluded_years=None: List of years to remove.
+    :param excluded_days=None:  List of (month, day) to remove, whatever the year.
+
+    :return:                    Return a boolean mask of the rows.
+    """
+    idx: pd.DatetimeIndex = pd.DatetimeIndex(dates)
+    keep: np.ndarray = np.ones(len(idx), dtype=bool)
+    if weekdays is not None:
+        keep &= np.isin(idx.weekday, weekdays)
+    if excluded_years is not None:
+        keep &= ~np.isin(idx.year, excluded_years)
+    for month, day in excluded_days or []:
+        keep &= ~((idx.month == month) & (idx.day == day))
+    return keep
+
+
+def profile_stats(
+    matrix: np.ndarray, columns: List[str], stats: List[Union[str, float]]
+) -> Dict[Union[str, float], pd.DataFrame]:
+    """
+    Compute statistics of each slot over the days. NaN values are ignored.
+
+    :param matrix:  Array (days x slots x columns) created by day_matrix.
+    :param columns: List of columns of the array.
+    :param stats:   List of statistics: 'mean' or a quantile between 0 and 1 (e.g. 0.5).
+
+    :return:        Return a dictionary with a DataFrame (slots x columns) for each statistic.
+    """
+    quantiles: List[float] = [stat for stat in stats if stat != 'mean']
+    result: Dict[Union[str, float], pd.DataFrame] = {}
+    with warnings.catch_warnings():
+        # Slots without any value give NaN.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if 'mean' in stats:
+            result['mean'] = pd.DataFrame(np.nanmean(matrix, axis=0), columns=columns)
+        if quantiles:
+            values: np.ndarray = np.nanquantile(matrix, quantiles, axis=0)
+            for q, value in zip(quantiles, values):
+                result[q] = pd.DataFrame(value, columns=columns)
+    return result
+
+
+def profile(
+    df: pd.DataFrame,
+    columns: List[str],
+    step: pd.Timedelta,
+    stats: List[Union[str, float]],
+    weekdays: Optional[List[int]] = None,
+    excluded_years: Optional[List[int]] = None,
+    excluded_days: Optional[List[Tuple[int, int]]] = None
+) -> Dict[Union[str, float], pd.DataFrame]:
+    """
+    Compute the typical day of a home, i.e. statistics of each slot of the day over the selected
+    days.
+
+    :param df:                  DataFrame where the column 'ts' contains datetimes in our
+                                timezone.
+    :param columns:             List of columns.
+    :param step:                Duration of a slot. It must divide one day.
+    :param stats:               List of statistics: 'mean' or a quantile between 0 and 1.
+    :param weekdays=None:       List of weekdays to keep (Monday is 0). None to keep all days.
+    :param excluded_years=None: List of years to remove.
+    :param excluded_days=None:  List of (month, day) to remove, whatever the year.
+
+    :return:                    Return a dictionary with a DataFrame (slots x columns) for each
+                                statistic.
+    """
+    dates, matrix = day_matrix(df, columns, step)
+    keep: np.ndarray = day_filter(dates, weekdays, excluded_years, excluded_days)
+    return profile_stats(matrix[keep], columns, stats)
+
+
+def home_profiles(
+    homes: List[Tuple[str, str]],
+    columns: List[str],
+    step: pd.Timedelta,
+    stats: List[Union[str, float]],
+    query: Optional[str] = None,
+    weekdays: Optional[List[int]] = None,
+    excluded_years: Optional[List[int]] = None,
+    excluded_days: Optional[List[Tuple[int, int]]] = None
+) -> Dict[str, Dict[Union[str, float], pd.DataFrame]]:
+    """
+    Compute the typical day of several homes. Each home is read once.
+
+    :param homes:               List of tuples (community, file).
+    :param columns:             List of columns.
+    :param step:                Duration of a slot. It must divide one day.
+    :param stats:               List of statistics: 'mean' or a quantile between 0 and 1.
+    :param query=None:          Query to select rows before the computation (e.g. 'p_cons > 0').
+    :param weekdays=None:       List of weekdays to keep (Monday is 0). None to keep all days.
+    :param excluded_years=None: List of years to remove.
+    :param excluded_days=None:  List of (month, day) to remove, whatever the year.
+
+    :return:                    Return a dictionary with the statistics of each file. Homes
+                                without any row are not in the dictionary.
+    """
+    profiles: Dict[str, Dict[Union[str, float], pd.DataFrame]] = {}
+    for community, file in homes:
+        print(f"----------{file}----------")
+        with profiled('profiles', file[:6]):
+            df: pd.DataFrame = load_home(community, file, parse_ts=True)
+            if query is not None:
+                df: pd.DataFrame = df.query(query)
+            if df.empty:
+                print(f"----------{file} is empty----------")
+                continue
+            profiles[file] = profile(
+                df, columns, step, stats, weekdays, excluded_years, excluded_days
+            )
+    return profiles
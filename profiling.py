@@ -0,0 +1,165 @@
+__title__ = "profiling"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pandas as pd
+import pstats
+import time
+import tracemalloc
+from typing import NoReturn, Any, Dict, Iterator, List
+
+from config import (
+    PROFILE,
+    PROFILE_CPU,
+    PROFILE_MEMORY,
+    PROFILE_TOP,
+    PROFILE_FOLDER
+)
+
+
+# Measures of the profiled blocks that are running in this process, the innermost last
+ACTIVE: List[Dict[str, Any]] = []
+
+
+# --------------------------------------- #
+# ----------PROFILING FUNCTIONS---------- #
+# --------------------------------------- #
+
+
+def profile_path(group: str, name: str) -> str:
+    """
+    Give the path of the files of a profiled block, without extension.
+
+    :param group:   Group of the block ('stages' or the name of the stage of a home).
+    :param name:    Name of the block (e.g. 'reaction' or 'CDB001').
+
+    :return:        Return the path.
+    """
+    return f"{PROFILE_FOLDER}/{group}/{name}"
+
+
+@contextlib.contextmanager
+def profiled(group: str, name: str) -> Iterator[None]:
+    """
+    Profile a block if PROFILE is True, otherwise do nothing. The wall time, the CPU time and,
+    with PROFILE_MEMORY, the peak of memory allocated by Python are saved in a JSON file. With
+    PROFILE_CPU, cProfile statistics are saved in a pstats file and, with PROFILE_MEMORY, the
+    lines allocating the most memory in a text file. Only one cProfile can run at once, so a
+    nested block (e.g. a home in a stage) pauses the profiler of its parent: the pstats of a
+    stage do not contain its homes. Blocks can run in workers because each one writes its own
+    files.
+
+    :param group:   Group of the block ('stages' or the name of the stage of a home).
+    :param name:    Name of the block (e.g. 'reaction' or 'CDB001').
+    """
+    if not PROFILE:
+        yield
+        return
+    os.makedirs(f"{PROFILE_FOLDER}/{group}", exist_ok=True)
+    if PROFILE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if ACTIVE and ACTIVE[-1]['pid'] != os.getpid():
+        # A forked worker inherits the blocks of its parent, which are not its own.
+        if ACTIVE[-1]['profiler'] is not None:
+            ACTIVE[-1]['profiler'].disable()
+        ACTIVE.clear()
+    parent: Dict[str, Any] = ACTIVE[-1] if ACTIVE else {}
+    if parent.get('profiler') is not None:
+        parent['profiler'].disable()
+    measures: Dict[str, Any] = {'group': group, 'name': name, 'peak': 0, 'pid': os.getpid()}
+    if PROFILE_MEMORY:
+        # The peak is reset for this block, so the parents keep the peak reached so far.
+        peak: int = tracemalloc.get_traced_memory()[1]
+        for block in ACTIVE:
+            block['peak'] = max(block['peak'], peak)
+        tracemalloc.reset_peak()
+        measures['snapshot'] = tracemalloc.take_snapshot()
+    ACTIVE.append(measures)
+    measures['profiler'] = cProfile.Profile() if PROFILE_CPU else None
+    wall: float = time.perf_counter()
+    cpu: float = time.process_time()
+    if measures['profiler'] is not None:
+        measures['profiler'].enable()
+    try:
+        yield
+    finally:
+        if measures['profiler'] is not None:
+            measures['profiler'].disable()
+        record: Dict[str, Any] = {
+            'group': group,
+            'name': name,
+            'wall': time.perf_counter() - wall,
+            'cpu': time.process_time() - cpu
+        }
+        ACTIVE.pop()
+        path: str = profile_path(group, name)
+        if measures['profiler'] is not None:
+            measures['profiler'].dump_stats(f"{path}.pstats")
+        if PROFILE_MEMORY:
+            peak: int = tracemalloc.get_traced_memory()[1]
+            for block in ACTIVE + [measures]:
+                block['peak'] = max(block['peak'], peak)
+            record['peak_mb'] = measures['peak'] / 1024 ** 2
+            top: List[tracemalloc.StatisticDiff] = tracemalloc.take_snapshot().compare_to(
+                measures['snapshot'], 'lineno'
+            )[:PROFILE_TOP]
+            with open(f"{path}.mem.txt", 'w') as f:
+                f.write('\n'.join(str(stat) for stat in top))
+        with open(f"{path}.json", 'w') as f:
+            json.dump(record, f)
+        if parent.get('profiler') is not None:
+            parent['profiler'].enable()
+
+
+def clear_profiles() -> NoReturn:
+    """
+    Remove the profiles of a previous run.
+    """
+    if not os.path.isdir(PROFILE_FOLDER):
+        return
+    for root, _, files in os.walk(PROFILE_FOLDER):
+        for file in files:
+            if file.endswith(('.json', '.pstats', '.mem.txt')) or file == 'summary.txt':
+                os.remove(f"{root}/{file}")
+
+
+def profile_summary() -> pd.DataFrame:
+    """
+    Write the summary of the profiles in PROFILE_FOLDER/summary.txt: the blocks sorted by wall
+    time, with the ratio to the median of their group so an outlier home stands out, and the top
+    PROFILE_TOP functions of all pstats files merged.
+
+    :return:    Return the DataFrame of the blocks.
+    """
+    records: List[Dict[str, Any]] = []
+    pstats_files: List[str] = []
+    for root, _, files in os.walk(PROFILE_FOLDER):
+        for file in sorted(files):
+            if file.endswith('.json'):
+                with open(f"{root}/{file}") as f:
+                    records.append(json.load(f))
+            elif file.endswith('.pstats'):
+                pstats_files.append(f"{root}/{file}")
+    if not records:
+        print("--------------------No profile found--------------------")
+        return pd.DataFrame()
+    df: pd.DataFrame = pd.DataFrame(records)
+    df['median_ratio']: pd.Series = df['wall'] / df.groupby('group')['wall'].transform('median')
+    df: pd.DataFrame = df.sort_values('wall', ascending=False).reset_index(drop=True)
+    stream: io.StringIO = io.StringIO()
+    if pstats_files:
+        stats: pstats.Stats = pstats.Stats(*pstats_files, stream=stream)
+        stats.sort_stats('tottime').print_stats(PROFILE_TOP)
+    with open(f"{PROFILE_FOLDER}/summary.txt", 'w') as f:
+        f.write(df.to_string(index=False, float_format='%.3f'))
+        f.write(f"\n\n{stream.getvalue()}")
+    print("--------------------Profile--------------------")
+    print(df.head(PROFILE_TOP).to_string(index=False, float_format='%.3f'))
+    return df
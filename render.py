@@ -0,0 +1,274 @@
+__title__ = "render"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import datetime as dt
+import matplotlib.pyplot as plt
+import multiprocessing
+import numpy as np
+import pandas as pd
+import traceback
+from typing import NoReturn, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import (
+    NB_SLAVES,
+    MAX_IN_FLIGHT,
+    PARALLEL_PLOT
+)
+from plot_load_curves import (
+    flukso_plot,
+    flukso_title,
+    median_quantile_flukso,
+    plot_data,
+    plot_median_quantile
+)
+from utils import run_bounded
+
+
+# A figure job is the name of the figure, the kind of plot, the arrays of data and the
+# parameters of the plot.
+FigureJob = Tuple[str, str, Dict[str, np.ndarray], Dict[str, Any]]
+
+
+# ------------------------------------ #
+# ----------RENDER FUNCTIONS---------- #
+# ------------------------------------ #
+
+
+def plot_data_job(
+    df: pd.DataFrame,
+    path: str,
+    starting: dt.datetime,
+    ending: dt.datetime,
+    title: str,
+    plot_type: str,
+    file_name: str
+) -> FigureJob:
+    """
+    Create the job of a figure of plot_data. Only the period and the columns of the plot are
+    kept, as arrays, so the whole DataFrame is not sent to the workers.
+
+    :param df:          The dataframe.
+    :param path:        The pave to save the plot.
+    :param starting:    The beginning of the date.
+    :param ending:      The end of the date.
+    :param title:       Title of the fig.
+    :param plot_type:   Type of the plot.
+    :param file_name:   The name of the file.
+
+    :return:            Return the job.
+    """
+    week: pd.DataFrame = df.query(
+        f"ts >= '{starting.isoformat(sep=' ')}' and ts <= '{ending.isoformat(sep=' ')}'"
+    )
+    columns: List[str] = ['active'] if plot_type == 'rtu' else ['p_cons', 'p_prod', 'p_tot']
+    arrays: Dict[str, np.ndarray] = {col: week[col].to_numpy() for col in columns}
+    arrays['ts'] = (
+        pd.to_datetime(week['ts'], utc=True).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    )
+    spec: Dict[str, Any] = {
+        'path': path, 'starting': starting, 'ending': ending, 'title': title,
+        'plot_type': plot_type, 'file_name': file_name
+    }
+    return f"{path}/{file_name}.png", 'plot_data', arrays, spec
+
+
+def flukso_plot_job(
+    df: pd.DataFrame, ts_series: pd.Series, path_to_save: str, title: str
+) -> FigureJob:
+    """
+    Create the job of a figure of flukso_plot.
+
+    :param df:              Dataframe to plot.
+    :param ts_series:       Series for the index.
+    :param path_to_save:    Path to save the plot.
+    :param title:           Title of the plot.
+
+    :return:                Return the job.
+    """
+    arrays: Dict[str, np.ndarray] = {
+        col: df[col].to_numpy() for col in ['p_cons', 'p_prod', 'p_tot']
+    }
+    arrays['ts'] = np.asarray(ts_series)
+    spec: Dict[str, Any] = {'path_to_save': path_to_save, 'title': title}
+    return f"{path_to_save}/{path_to_save[-6:]}_mean_wednesday.png", 'flukso_plot', arrays, spec
+
+
+def plot_median_quantile_job(
+    mean: pd.Series,
+    first_q: pd.Series,
+    third_q: pd.Series,
+    col_name: str,
+    ts_series: pd.Series,
+    title: str,
+    path: str
+) -> FigureJob:
+    """
+    Create the job of a figure of plot_median_quantile.
+
+    :param mean:        Series with the mean.
+    :param first_q:     Series with the first quantile.
+    :param third_q:     Series with the third quantile.
+    :param col_name:    The name of the column.
+    :param ts_series:   Series containing all hours to plot.
+    :param title:       Title of the plot.
+    :param path:        Path to save the file.
+
+    :return:            Return the job.
+    """
+    arrays: Dict[str, np.ndarray] = {
+        'mean': np.asarray(mean),
+        'first_q': np.asarray(first_q),
+        'third_q': np.asarray(third_q),
+        'ts': np.asarray(ts_series)
+    }
+    spec: Dict[str, Any] = {'col_name': col_name, 'title': title, 'path': path}
+    name: str = (
+        f"{path}/{col_name}_median_quantile_.png" if col_name == 'rtu'
+        else f"{path}/{title[-6:]}_median_quantile_{col_name}.png"
+    )
+    return name, 'plot_median_quantile', arrays, spec
+
+
+def median_quantile_flukso_jobs(
+    df: pd.DataFrame, plot_path: str, time_series: pd.Series
+) -> Iterator[FigureJob]:
+    """
+    Create the jobs of the figures of plot_median_quantile_flukso, one for each power.
+
+    :param df:          DataFrame.
+    :param plot_path:   Path.
+    :param time_series: Series with the time.
+
+    :return:            Return an iterator over the jobs.
+    """
+    median, first_q, third_q = median_quantile_flukso(df, time_series)
+    yield from quantile_flukso_jobs(
+        median, first_q, third_q, df['home_id'].iloc[0], plot_path, time_series
+    )
+
+
+def quantile_flukso_jobs(
+    median: pd.DataFrame,
+    first_q: pd.DataFrame,
+    third_q: pd.DataFrame,
+    home_id: str,
+    plot_path: str,
+    time_series: pd.Series
+) -> Iterator[FigureJob]:
+    """
+    Create the jobs of the figures of the median and quantiles of a home, one for each power.
+
+    :param median:      DataFrame with the median of each slot.
+    :param first_q:     DataFrame with the first quantile of each slot.
+    :param third_q:     DataFrame with the third quantile of each slot.
+    :param home_id:     The id of the home.
+    :param plot_path:   Path.
+    :param time_series: Series with the time.
+
+    :return:            Return an iterator over the jobs.
+    """
+    for col in ['p_cons', 'p_prod', 'p_tot']:
+        yield plot_median_quantile_job(
+            median[col], first_q[col], third_q[col], col, time_series,
+            flukso_title(col, home_id), plot_path
+        )
+
+
+def render_job(
+    name: str, kind: str, arrays: Dict[str, np.ndarray], spec: Dict[str, Any]
+) -> Optional[str]:
+    """
+    Render the figure of a job. An error does not stop the other figures, it is returned.
+
+    :param name:    Name of the figure.
+    :param kind:    Kind of plot ('plot_data', 'flukso_plot' or 'plot_median_quantile').
+    :param arrays:  Arrays of data.
+    :param spec:    Parameters of the plot.
+
+    :return:        Return None if the figure is saved, the traceback of the error otherwise.
+    """
+    try:
+        if kind == 'plot_data':
+            df: pd.DataFrame = pd.DataFrame(
+                {col: values for col, values in arrays.items() if col != 'ts'}
+            )
+            df.insert(
+                0, 'ts',
+                pd.DatetimeIndex(arrays['ts'].view('datetime64[ns]'), tz='UTC')
+                .tz_convert(spec['starting'].tzinfo)
+            )
+            plot_data(
+                df, spec['path'], spec['starting'], spec['ending'], spec['title'],
+                spec['plot_type'], spec['file_name']
+            )
+        elif kind == 'flukso_plot':
+            df: pd.DataFrame = pd.DataFrame(
+                {col: values for col, values in arrays.items() if col != 'ts'}
+            )
+            flukso_plot(df, pd.Series(arrays['ts']), spec['path_to_save'], spec['title'])
+        elif kind == 'plot_median_quantile':
+            plot_median_quantile(
+                pd.Series(arrays['mean']), pd.Series(arrays['first_q']),
+                pd.Series(arrays['third_q']), spec['col_name'], pd.Series(arrays['ts']),
+                spec['title'], spec['path']
+            )
+        else:
+            raise ValueError(f"Unknown kind of plot {kind}")
+    except Exception:
+        plt.close('all')
+        return traceback.format_exc()
+    return None
+
+
+def init_render_worker() -> NoReturn:
+    """
+    Initialize a worker rendering figures with the Agg backend, without any display.
+    """
+    plt.switch_backend('Agg')
+
+
+def named_jobs(jobs: Iterable[FigureJob], names: List[str]) -> Iterator[FigureJob]:
+    """
+    Give the jobs one by one and keep their names, so the jobs are created only when they are
+    submitted.
+
+    :param jobs:    Iterable of jobs.
+    :param names:   List where we append the name of each job.
+
+    :return:        Return an iterator over the jobs.
+    """
+    for job in jobs:
+        names.append(job[0])
+        yield job
+
+
+def render_figures(jobs: Iterable[FigureJob]) -> List[Tuple[str, str]]:
+    """
+    Render the figures of jobs. If PARALLEL_PLOT is True, figures are rendered by NB_SLAVES
+    workers while the jobs are created, with at most MAX_IN_FLIGHT jobs waiting. Otherwise, they
+    are rendered one after the other. Failed figures are reported at the end.
+
+    :param jobs:    Iterable of jobs created by plot_data_job, flukso_plot_job or
+                    plot_median_quantile_job.
+
+    :return:        Return the list of failed figures with their error.
+    """
+    names: List[str] = []
+    if PARALLEL_PLOT:
+        with multiprocessing.Pool(NB_SLAVES, initializer=init_render_worker) as p:
+            errors: List[Optional[str]] = list(
+                run_bounded(p, render_job, named_jobs(jobs, names), MAX_IN_FLIGHT)
+            )
+    else:
+        errors: List[Optional[str]] = [render_job(*job) for job in named_jobs(jobs, names)]
+    failures: List[Tuple[str, str]] = [
+        (name, error) for name, error in zip(names, errors) if error is not None
+    ]
+    for name, error in failures:
+        print(f"--------------Failed to render {name}--------------")
+        print(error)
+    print(f"--------------{len(names) - len(failures)}/{len(names)} figures rendered--------------")
+    return failures
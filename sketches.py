@@ -0,0 +1,311 @@
+__title__ = "sketches"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import multiprocessing
+import numpy as np
+import os
+import pandas as pd
+from typing import NoReturn, Dict, List, Optional, Tuple, Union
+
+from config import (
+    NB_SLAVES,
+    MAX_IN_FLIGHT,
+    ALL_CDB,
+    ALL_ECH,
+    SKETCH_ACCURACY,
+    SKETCH_MIN_VALUE,
+    SKETCH_MAX_VALUE,
+    SLOT_STATS_FOLDER
+)
+from profiles import DAY_NS
+from storage import iter_home_chunks
+from utils import run_bounded
+
+
+# Growth of the bounds of two consecutive bins of a sketch
+GAMMA: float = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+# Index of the bins of SKETCH_MIN_VALUE and SKETCH_MAX_VALUE on the logarithmic scale
+MIN_KEY: int = int(np.ceil(np.log(SKETCH_MIN_VALUE) / np.log(GAMMA)))
+MAX_KEY: int = int(np.ceil(np.log(SKETCH_MAX_VALUE) / np.log(GAMMA)))
+
+# Number of bins for the positive values (and for the negative values)
+NB_SIDE_BINS: int = MAX_KEY - MIN_KEY + 1
+
+# Number of bins of a sketch: negative values, values near 0 and positive values
+NB_BINS: int = 2 * NB_SIDE_BINS + 1
+
+
+# ------------------------------------ #
+# ----------SKETCH FUNCTIONS---------- #
+# ------------------------------------ #
+
+
+def sketch_bins(values: np.ndarray) -> np.ndarray:
+    """
+    Give the bin of each value. Bins are sorted by value: first the negative values, then the
+    values in ]-SKETCH_MIN_VALUE, SKETCH_MIN_VALUE[ in the middle bin, then the positive values.
+    A positive value x is in the bin k such that GAMMA^(k-1) < x <= GAMMA^k, so all values of a bin
+    are at a relative distance of at most SKETCH_ACCURACY from its representative value. Values
+    beyond SKETCH_MAX_VALUE (in absolute value) are put in the last bin of their side.
+
+    :param values:  Array of values without NaN.
+
+    :return:        Return the array of bins.
+    """
+    magnitude: np.ndarray = np.abs(values)
+    small: np.ndarray = magnitude < SKETCH_MIN_VALUE
+    keys: np.ndarray = np.ceil(
+        np.log(np.where(small, SKETCH_MIN_VALUE, magnitude)) / np.log(GAMMA)
+    ).astype(np.int64)
+    offsets: np.ndarray = np.clip(keys, MIN_KEY, MAX_KEY) - MIN_KEY + 1
+    bins: np.ndarray = NB_SIDE_BINS + np.where(values < 0, -offsets, offsets)
+    bins[small] = NB_SIDE_BINS
+    return bins
+
+
+def bin_values() -> np.ndarray:
+    """
+    Give the representative value of each bin, i.e. 2 GAMMA^k / (GAMMA + 1) for the bin k of
+    positive values, which is at a relative distance of at most SKETCH_ACCURACY from the bounds
+    of the bin. The middle bin is represented by 0.
+
+    :return:        Return the array of values, sorted as the bins.
+    """
+    keys: np.ndarray = np.arange(MIN_KEY, MAX_KEY + 1)
+    positive: np.ndarray = 2 * GAMMA ** keys / (GAMMA + 1)
+    return np.concatenate([-positive[::-1], [0.0], positive])
+
+
+def empty_sketch(nb_slots: int, nb_columns: int) -> np.ndarray:
+    """
+    Create an empty sketch, i.e. the counts of the bins of each slot of the day and each column.
+    The memory only depends on the number of slots: nb_slots x nb_columns x NB_BINS counts.
+
+    :param nb_slots:    Number of slots of a day.
+    :param nb_columns:  Number of columns.
+
+    :return:            Return the array of counts.
+    """
+    return np.zeros((nb_slots, nb_columns, NB_BINS), dtype=np.int32)
+
+
+def update_sketch(
+    sketch: np.ndarray, df: pd.DataFrame, columns: List[str], step: pd.Timedelta
+) -> np.ndarray:
+    """
+    Add the rows of a DataFrame to a sketch. NaN values are ignored.
+
+    :param sketch:  Sketch created by empty_sketch.
+    :param df:      DataFrame where the column 'ts' contains datetimes in our timezone.
+    :param columns: List of columns of the sketch.
+    :param step:    Duration of a slot. It must divide one day.
+
+    :return:        Return the sketch, updated in place.
+    """
+    nb_slots: int = sketch.shape[0]
+    wall: np.ndarray = (
+        df['ts'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    )
+    slots: np.ndarray = (wall % DAY_NS) // step.value
+    for k, col in enumerate(columns):
+        values: np.ndarray = df[col].to_numpy(dtype=np.float64)
+        valid: np.ndarray = ~np.isnan(values)
+        cells: np.ndarray = slots[valid] * NB_BINS + sketch_bins(values[valid])
+        sketch[:, k, :] += np.bincount(cells, minlength=nb_slots * NB_BINS).reshape(
+            nb_slots, NB_BINS
+        ).astype(np.int32)
+    return sketch
+
+
+def sketch_quantiles(
+    sketch: np.ndarray, columns: List[str], quantiles: List[float]
+) -> List[pd.DataFrame]:
+    """
+    Estimate quantiles of each slot from a sketch. The estimation is the representative value of
+    the bin containing the exact quantile (lower rank), so the relative error is at most
+    SKETCH_ACCURACY when the absolute value of the quantile is in
+    [SKETCH_MIN_VALUE, SKETCH_MAX_VALUE], the absolute error is below SKETCH_MIN_VALUE when it is
+    smaller, and quantiles beyond SKETCH_MAX_VALUE are only known to be beyond it.
+
+    :param sketch:      Sketch created by empty_sketch.
+    :param columns:     List of columns of the sketch.
+    :param quantiles:   List of quantiles between 0 and 1.
+
+    :return:            Return a DataFrame (slots x columns) for each quantile. Slots without
+                        any value are NaN.
+    """
+    cumulative: np.ndarray = np.cumsum(sketch, axis=-1, dtype=np.int32)
+    totals: np.ndarray = cumulative[:, :, -1]
+    values: np.ndarray = bin_values()
+    result: List[pd.DataFrame] = []
+    for q in quantiles:
+        rank: np.ndarray = np.floor(q * (totals - 1))
+        bins: np.ndarray = np.argmax(cumulative > rank[:, :, None], axis=-1)
+        estimate: np.ndarray = np.where(totals > 0, values[bins], np.nan)
+        result.append(pd.DataFrame(estimate, columns=columns))
+    return result
+
+
+def home_sketch(
+    community: str,
+    file: str,
+    columns: List[str],
+    step: pd.Timedelta,
+    query: Optional[str] = None
+) -> np.ndarray:
+    """
+    Build the sketch of a home by reading its file chunk by chunk, so the whole history is never
+    in memory.
+
+    :param community:   The name of the community (CDB, ECH or RTU).
+    :param file:        The name of the CSV file (e.g. CDB001.csv).
+    :param columns:     List of columns of the sketch.
+    :param step:        Duration of a slot. It must divide one day.
+    :param query=None:  Query to select rows (e.g. 'p_cons > 0').
+
+    :return:            Return the sketch.
+    """
+    sketch: np.ndarray = empty_sketch(DAY_NS // step.value, len(columns))
+    for chunk in iter_home_chunks(community, file, ['ts'] + columns):
+        if query is not None:
+            chunk: pd.DataFrame = chunk.query(query)
+        update_sketch(sketch, chunk, columns, step)
+    return sketch
+
+
+def slot_stats_path(file: str, step: pd.Timedelta) -> str:
+    """
+    Give the path of the statistics per slot of a home.
+
+    :param file:    The name of the CSV file (e.g. CDB001.csv).
+    :param step:    Duration of a slot.
+
+    :return:        Return the path.
+    """
+    return f"{SLOT_STATS_FOLDER}/{int(step.total_seconds())}s/{file[:6]}.npz"
+
+
+def build_home_stats(
+    community: str,
+    file: str,
+    columns: List[str],
+    step: pd.Timedelta,
+    query: Optional[str] = None
+) -> str:
+    """
+    Compute the statistics of each slot of the day of a home (count, sum, sum of squares and
+    sketch of each column) by reading its file chunk by chunk, and save them. Statistics are
+    additive, so the statistics of several homes are the sums of their statistics.
+
+    :param community:   The name of the community (CDB, ECH or RTU).
+    :param file:        The name of the CSV file (e.g. CDB001.csv).
+    :param columns:     List of columns.
+    :param step:        Duration of a slot. It must divide one day.
+    :param query=None:  Query to select rows (e.g. 'p_cons > 0').
+
+    :return:            Return the path of the saved statistics.
+    """
+    print(f"--------------------{file[:6]}--------------------")
+    nb_slots: int = DAY_NS // step.value
+    counts: np.ndarray = np.zeros((nb_slots, len(columns)), dtype=np.int64)
+    sums: np.ndarray = np.zeros((nb_slots, len(columns)))
+    squares: np.ndarray = np.zeros((nb_slots, len(columns)))
+    sketch: np.ndarray = empty_sketch(nb_slots, len(columns))
+    for chunk in iter_home_chunks(community, file, ['ts'] + columns):
+        if query is not None:
+            chunk: pd.DataFrame = chunk.query(query)
+        wall: np.ndarray = (
+            chunk['ts'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        )
+        slots: np.ndarray = (wall % DAY_NS) // step.value
+        for k, col in enumerate(columns):
+            values: np.ndarray = chunk[col].to_numpy(dtype=np.float64)
+            valid: np.ndarray = ~np.isnan(values)
+            counts[:, k] += np.bincount(slots[valid], minlength=nb_slots)
+            sums[:, k] += np.bincount(slots[valid], weights=values[valid], minlength=nb_slots)
+            squares[:, k] += np.bincount(
+                slots[valid], weights=values[valid] ** 2, minlength=nb_slots
+            )
+        update_sketch(sketch, chunk, columns, step)
+    path: str = slot_stats_path(file, step)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    np.savez_compressed(
+        path, columns=np.array(columns), counts=counts, sums=sums, squares=squares, sketch=sketch
+    )
+    return path
+
+
+def build_slot_stats(step: pd.Timedelta) -> NoReturn:
+    """
+    Compute and save the statistics per slot of all homes of CDB and ECH with NB_SLAVES workers.
+    As for the quantile plots of each home, only rows with a positive consumption are kept in CDB.
+
+    :param step:    Duration of a slot. It must divide one day.
+    """
+    print("--------------------Computing statistics per slot...--------------------")
+    columns: List[str] = ['p_cons', 'p_prod', 'p_tot']
+    tasks: List[Tuple[str, str, List[str], pd.Timedelta, Optional[str]]] = (
+        [('CDB', file, columns, step, 'p_cons > 0') for file in ALL_CDB]
+        + [('ECH', file, columns, step, None) for file in ALL_ECH]
+    )
+    with multiprocessing.Pool(NB_SLAVES) as p:
+        for _ in run_bounded(p, build_home_stats, tasks, MAX_IN_FLIGHT):
+            pass
+    print("--------------------Statistics per slot saved !--------------------")
+
+
+def merge_slot_stats(files: List[str], step: pd.Timedelta) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Merge the saved statistics per slot of several homes, without reading their data. Homes
+    without saved statistics are ignored.
+
+    :param files:   List of files of homes (e.g. CDB001.csv).
+    :param step:    Duration of a slot.
+
+    :return:        Return a dictionary with the columns, counts, sums, sums of squares and
+                    sketch of all homes, or None if no home has statistics.
+    """
+    merged: Optional[Dict[str, np.ndarray]] = None
+    for file in files:
+        if not os.path.isfile(slot_stats_path(file, step)):
+            continue
+        with np.load(slot_stats_path(file, step)) as stats:
+            if merged is None:
+                merged = {key: stats[key] for key in stats.files}
+            else:
+                for key in ['counts', 'sums', 'squares', 'sketch']:
+                    merged[key] += stats[key]
+    return merged
+
+
+def merged_profile(
+    merged: Dict[str, np.ndarray], quantiles: List[float]
+) -> Dict[Union[str, float], pd.DataFrame]:
+    """
+    Compute the mean, the variance and quantiles of each slot from merged statistics. The
+    accuracy of the quantiles is the one of the sketches (see sketch_quantiles).
+
+    :param merged:      Statistics given by merge_slot_stats.
+    :param quantiles:   List of quantiles between 0 and 1.
+
+    :return:            Return a dictionary with a DataFrame (slots x columns) for 'mean',
+                        'variance' and each quantile. Slots without any value are NaN.
+    """
+    columns: List[str] = merged['columns'].tolist()
+    counts: np.ndarray = np.where(merged['counts'] > 0, merged['counts'], 1)
+    mean: np.ndarray = merged['sums'] / counts
+    variance: np.ndarray = np.maximum(merged['squares'] / counts - mean ** 2, 0)
+    mean[merged['counts'] == 0] = np.nan
+    variance[merged['counts'] == 0] = np.nan
+    result: Dict[Union[str, float], pd.DataFrame] = {
+        'mean': pd.DataFrame(mean, columns=columns),
+        'variance': pd.DataFrame(variance, columns=columns)
+    }
+    for q, estimate in zip(quantiles, sketch_quantiles(merged['sketch'], columns, quantiles)):
+        result[q] = estimate
+    return result
@@ -12,7 +12,7 @@ from config import (
 import datetime as dt
 import numpy as np
 import pandas as pd
-from typing import NoReturn, List, Tuple
+from typing import NoReturn, Dict, List, Optional, Tuple
 
 
 # -------------------------------------- #
@@ -20,23 +20,121 @@ from typing import NoReturn, List, Tuple
 # -------------------------------------- #
 
 
+def nb_slots(start: dt.datetime, end: dt.datetime) -> int:
+    """
+    Give the number of timestamps every 15 minutes from start to end, both included. It is
+    computed from the elapsed time, so a period crossing a change of daylight saving time (where
+    start and end do not have the same offset) is allowed.
+
+    :param start:   Start of the period.
+    :param end:     End of the period.
+
+    :return:        Return the number of timestamps.
+    """
+    return int((end - start) // dt.timedelta(minutes=15)) + 1
+
+
+def time_of_day(moment: dt.datetime) -> float:
+    """
+    Give the wall clock time of a datetime expressed in seconds since midnight.
+
+    :param moment:  The datetime.
+
+    :return:        Return the number of seconds.
+    """
+    return (
+        moment.hour * 3600 + moment.minute * 60 + moment.second + moment.microsecond / 1e6
+    )
+
+
+def build_week_index(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Build an index of the consumption of a home to answer window queries without filtering the
+    dataframe. Rows are sorted by weekday, day and time of the day. Each pair (weekday, day) is a
+    segment and the key of a row is segment * 86400 + time of the day in seconds, so that a
+    window of a segment is found with a binary search and summed with the cumulative sum.
+
+    :param df:  Dataframe with the columns 'ts' (with timezone), 'day' and 'p_cons'.
+
+    :return:    Return a dictionary with the keys, the cumulative sum of the consumption, the
+                weekday and the day of each segment.
+    """
+    tod: np.ndarray = (
+        df['ts'].dt.hour * 3600 + df['ts'].dt.minute * 60
+        + df['ts'].dt.second + df['ts'].dt.microsecond / 1e6
+    ).to_numpy(dtype=np.float64)
+    weekday: np.ndarray = df['ts'].dt.weekday.to_numpy()
+    day: np.ndarray = df['day'].to_numpy().astype('datetime64[D]')
+    p_cons: np.ndarray = np.nan_to_num(df['p_cons'].to_numpy(dtype=np.float64))
+    # Sort by weekday, then day, then time of the day.
+    order: np.ndarray = np.lexsort((tod, day, weekday))
+    weekday, day, tod, p_cons = weekday[order], day[order], tod[order], p_cons[order]
+    # Find where a new segment (weekday, day) begins.
+    new_segment: np.ndarray = np.ones(len(order), dtype=bool)
+    new_segment[1:] = (weekday[1:] != weekday[:-1]) | (day[1:] != day[:-1])
+    segment: np.ndarray = np.cumsum(new_segment) - 1
+    starts: np.ndarray = np.flatnonzero(new_segment)
+    return {
+        'key': segment * 86400 + tod,
+        'cum': np.concatenate(([0.], np.cumsum(p_cons))),
+        'weekday': weekday[starts],
+        'day': day[starts]
+    }
+
+
+def window_sums(
+    week_index: Dict[str, np.ndarray],
+    weekday: int,
+    start_tod: float,
+    end_tod: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute, for each day of a given weekday, the number of rows and the sum of the consumption
+    where start_tod <= time of the day < end_tod.
+
+    :param week_index:  Index created by build_week_index.
+    :param weekday:     The weekday, 0 is Monday.
+    :param start_tod:   Start of the window in seconds since midnight (included).
+    :param end_tod:     End of the window in seconds since midnight (excluded).
+
+    :return:            Return the days, the number of rows and the sums.
+    """
+    segments: np.ndarray = np.flatnonzero(week_index['weekday'] == weekday)
+    low: np.ndarray = np.searchsorted(week_index['key'], segments * 86400 + start_tod)
+    high: np.ndarray = np.searchsorted(week_index['key'], segments * 86400 + end_tod)
+    high: np.ndarray = np.maximum(high, low)
+    return (
+        week_index['day'][segments],
+        high - low,
+        week_index['cum'][high] - week_index['cum'][low]
+    )
+
+
 def find_reaction_report(
     df: pd.DataFrame,
     alerts: pd.DataFrame,
     matrix: np.ndarray[np.float64],
     sum_alerts: np.ndarray[np.float64],
-    index: int
+    index: int,
+    alerts_mask: Optional[np.ndarray] = None
 ) -> NoReturn:
     """
-    Function to compute the reaction and the report.
+    Function to compute the reaction and the report. The index of the home is built once and
+    each alert is then answered with binary searches on it.
 
-    :param df:          Dataframe.
-    :param alerts:      Dataframe with alerts.
-    :param matrix:      Matrix with the result of report and reaction.
-    :param sum_alerts:  Matrix with the sum during alerts and not.
-    :param index:       The index of the home.
+    :param df:                  Dataframe.
+    :param alerts:              Dataframe with alerts.
+    :param matrix:              Matrix with the result of report and reaction.
+    :param sum_alerts:          Matrix with the sum during alerts and not.
+    :param index:               The index of the home.
+    :param alerts_mask=None:    Boolean array with one value per alert, False to skip the alert
+                                (e.g. without data according to the coverage index). None to
+                                compute all alerts.
     """
+    week_index: Dict[str, np.ndarray] = build_week_index(df)
     for i in range(len(alerts.index)):
+        if alerts_mask is not None and not alerts_mask[i]:
+            continue
         start_alert: dt.datetime = (
             dt.datetime.fromtimestamp(dt.datetime.timestamp(alerts.iloc[i][1])).astimezone()
         )
@@ -46,33 +144,25 @@ def find_reaction_report(
         nb_hours: int = ((end_alert - start_alert) / 3600).seconds
         nb_delta_alert: int = len(REPORTS_HOURS)
         alert_idx: int = (i * 2 * nb_delta_alert) + (i + nb_delta_alert)
-        # Group according to day of the week, 0 is Monday.
-        grouped_df: pd._DataFrameGroupByNonScalar = df.groupby(df['ts'].dt.weekday)
-        # Take the correct group according to the day of the alert.
-        days_df: pd.DataFrame = grouped_df.get_group(start_alert.weekday())
-        # Keep only the period of the alert.
-        days_df: pd.DataFrame = (
-            days_df[
-                (start_alert.time() <= days_df['ts'].dt.time)
-                & (days_df['ts'].dt.time < end_alert.time())
-            ]
+        # Number of rows and sum of the consumption during the period of the alert for each day
+        # with the same weekday as the alert, 0 is Monday.
+        days, counts, sums = window_sums(
+            week_index, start_alert.weekday(), time_of_day(start_alert), time_of_day(end_alert)
         )
         # Take the day of the alert and keep others
-        alert_df: pd.DataFrame = days_df[days_df['day'].dt.date == start_alert.date()]
-        # Remove the day of the alert and keep others
-        not_alert: pd.DataFrame = days_df[days_df['day'].dt.date != start_alert.date()]
-        ts_size = len(pd.date_range(start_alert, end_alert, freq='15min'))
-        if len(alert_df.index) > (ts_size / 2) and len(alert_df.index) <= ts_size:
+        is_alert: np.ndarray = days == np.datetime64(start_alert.date())
+        nb_alert: int = int(counts[is_alert].sum())
+        nb_not_alert: int = int(counts[~is_alert].sum())
+        ts_size: int = nb_slots(start_alert, end_alert)
+        if nb_alert > (ts_size / 2) and nb_alert <= ts_size:
             # Sum for alert and non alert data
-            sum_alert: float = alert_df['p_cons'].sum()
-            sum_not_alert: float = not_alert['p_cons'].sum()
+            sum_alert: float = sums[is_alert].sum()
+            sum_not_alert: float = sums[~is_alert].sum()
             # Mean for alert and non alert data
-            mean_alert: float = alert_df['p_cons'].mean()
-            mean_not_alert: float = not_alert['p_cons'].mean()
+            mean_alert: float = sum_alert / nb_alert
+            mean_not_alert: float = sum_not_alert / nb_not_alert if nb_not_alert else np.nan
             # Combined mean
-            global_mean: float = (
-                (sum_alert + sum_not_alert) / (len(alert_df.index) + len(not_alert.index))
-            )
+            global_mean: float = (sum_alert + sum_not_alert) / (nb_alert + nb_not_alert)
             # Compute the percentages
             matrix[index][alert_idx] = (
                 ((mean_alert - mean_not_alert) / global_mean)
@@ -81,17 +171,33 @@ def find_reaction_report(
             # Register the total sum of energy consumption in kWh
             if sum_alert > 0 and sum_not_alert > 0:
                 sum_alerts[alert_idx] += (
-                    (sum_alert - (sum_not_alert * len(alert_df.index) / len(not_alert.index)))
+                    (sum_alert - (sum_not_alert * nb_alert / nb_not_alert))
                     / nb_hours
                 )
             # Find report
             find_report(
-                df, matrix, sum_alerts, index, start_alert, end_alert, nb_delta_alert, alert_idx
+                week_index, matrix, sum_alerts, index, start_alert, end_alert,
+                nb_delta_alert, alert_idx
             )
 
 
+def masked_sums(
+    counts: np.ndarray, sums: np.ndarray, mask: np.ndarray
+) -> Tuple[int, np.float64]:
+    """
+    Give the number of rows and the sum of the consumption of the days selected by a mask.
+
+    :param counts:  Number of rows for each day returned by window_sums.
+    :param sums:    Sum of the consumption for each day returned by window_sums.
+    :param mask:    Boolean mask of the selected days.
+
+    :return:        Return the number of rows and the sum.
+    """
+    return int(counts[mask].sum()), sums[mask].sum()
+
+
 def find_report(
-    df: pd.DataFrame,
+    week_index: Dict[str, np.ndarray],
     matrix: np.ndarray[np.float64],
     sum_alerts: np.ndarray[np.float64],
     index_i: int,
@@ -101,9 +207,10 @@ def find_report(
     alert_idx: int
 ) -> NoReturn:
     """
-    Function to compute the report.
+    Function to compute the report. Each window before/after the alert is answered with the index
+    of the home, a window crossing midnight being split in two windows of the index.
 
-    :param df:              Dataframe.
+    :param week_index:      Index of the home created by build_week_index.
     :param matrix:          Matrix with the result of report and reaction.
     :param sum_alerts:      Matrix with the sum during alerts and not.
     :param index_i:         The index of the home.
@@ -122,61 +229,55 @@ def find_report(
             else:
                 start_alert_report: dt.datetime = end_alert
                 end_alert_report: dt.datetime = end_alert + REPORTS_HOURS[j]
-            # Group according to day of the week, 0 is Monday.
-            grouped_df: pd.DataFrame = df.groupby(df['ts'].dt.weekday)
-            # Take the correct group according to the day of the alert.
+            start_day: np.datetime64 = np.datetime64(start_alert_report.date())
+            end_day: np.datetime64 = np.datetime64(end_alert_report.date())
             if start_alert_report.weekday() != end_alert_report.weekday():
-                day1: pd.DataFrame = (
-                    df[
-                        (df["ts"].dt.weekday == start_alert_report.weekday())
-                        & (df["ts"].dt.hour >= start_alert_report.hour)
-                        & (df["ts"].dt.hour <= 23)
-                    ]
+                # End of the first day, from the hour of the start.
+                days1, counts1, sums1 = window_sums(
+                    week_index, start_alert_report.weekday(), start_alert_report.hour * 3600, 86400
                 )
-                day2: pd.DataFrame = (
-                    df[
-                        (df["ts"].dt.weekday == end_alert_report.weekday())
-                        & (df["ts"].dt.hour >= 0)
-                        & (df["ts"].dt.hour < end_alert_report.hour)
-                    ]
+                # Beginning of the second day, until the hour of the end.
+                days2, counts2, sums2 = window_sums(
+                    week_index, end_alert_report.weekday(), 0, end_alert_report.hour * 3600
                 )
-                days_df: pd.DataFrame = pd.concat([day1, day2]).sort_values(by='ts')
                 # Take the day of the alert and keep others
-                alert_df: pd.DataFrame = days_df[
-                    (days_df['day'].dt.date == start_alert_report.date())
-                    | (days_df['day'].dt.date == end_alert_report.date())
-                ]
+                nb_alert1, sum_alert1 = masked_sums(
+                    counts1, sums1, (days1 == start_day) | (days1 == end_day)
+                )
+                nb_alert2, sum_alert2 = masked_sums(
+                    counts2, sums2, (days2 == start_day) | (days2 == end_day)
+                )
                 # Remove the day of the alert and keep others
-                not_alert: pd.DataFrame = days_df[
-                    (days_df['day'].dt.date != start_alert_report.date())
-                    | (days_df['day'].dt.date != end_alert_report.date())
-                ]
+                nb_not_alert1, sum_not_alert1 = masked_sums(
+                    counts1, sums1, (days1 != start_day) | (days1 != end_day)
+                )
+                nb_not_alert2, sum_not_alert2 = masked_sums(
+                    counts2, sums2, (days2 != start_day) | (days2 != end_day)
+                )
+                nb_alert: int = nb_alert1 + nb_alert2
+                sum_alert: float = sum_alert1 + sum_alert2
+                nb_not_alert: int = nb_not_alert1 + nb_not_alert2
+                sum_not_alert: float = sum_not_alert1 + sum_not_alert2
             else:
-                days_df: pd.DataFrame = grouped_df.get_group(start_alert_report.weekday())
                 # Keep only the period of the alert.
-                days_df: pd.DataFrame = (
-                    days_df[
-                        (start_alert_report.time() <= days_df['ts'].dt.time)
-                        & (days_df['ts'].dt.time < end_alert_report.time())
-                    ]
+                days, counts, sums = window_sums(
+                    week_index,
+                    start_alert_report.weekday(),
+                    time_of_day(start_alert_report),
+                    time_of_day(end_alert_report)
                 )
                 # Take the day of the alert and keep others
-                alert_df: pd.DataFrame = days_df[days_df['day'].dt.date == start_alert_report.date()]
+                nb_alert, sum_alert = masked_sums(counts, sums, days == start_day)
                 # Remove the day of the alert and keep others
-                not_alert: pd.DataFrame = days_df[days_df['day'].dt.date != start_alert_report.date()]
+                nb_not_alert, sum_not_alert = masked_sums(counts, sums, days != start_day)
 
-            ts_size: int = len(pd.date_range(start_alert_report, end_alert_report, freq='15min'))
-            if len(alert_df.index) > (ts_size / 2) and len(alert_df.index) <= ts_size:
-                # Sum for the alert and outside the alert
-                sum_not_alert: float = not_alert['p_cons'].sum()
-                sum_alert: float = alert_df['p_cons'].sum()
+            ts_size: int = nb_slots(start_alert_report, end_alert_report)
+            if nb_alert > (ts_size / 2) and nb_alert <= ts_size:
                 # Mean during the alert and outside the alert
-                mean_not_alert: float = not_alert['p_cons'].mean()
-                mean_alert: float = alert_df['p_cons'].mean()
+                mean_not_alert: float = sum_not_alert / nb_not_alert if nb_not_alert else np.nan
+                mean_alert: float = sum_alert / nb_alert
                 # Compute global mean
-                global_mean: float = (
-                    (sum_alert + sum_not_alert) / (len(alert_df.index) + len(not_alert.index))
-                )
+                global_mean: float = (sum_alert + sum_not_alert) / (nb_alert + nb_not_alert)
                 # Register the percentage of reduction
                 matrix[index_i][alert_idx + (i * (j + 1))] = (
                     ((mean_alert - mean_not_alert) / global_mean)
@@ -184,7 +285,7 @@ def find_report(
                 )
                 # Register the total sum of energy consumption in kWh
                 sum_alerts[alert_idx + (i * (j + 1))] += (
-                    (sum_alert - (sum_not_alert * len(alert_df) / len(not_alert.index)))
+                    (sum_alert - (sum_not_alert * nb_alert / nb_not_alert))
                     / (REPORTS_HOURS[j].total_seconds() / 3600)
                 )
 
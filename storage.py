@@ -0,0 +1,577 @@
+__title__ = "storage"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import datetime as dt
+import glob
+import hashlib
+import io
+import multiprocessing
+import numpy as np
+import os
+import pandas as pd
+import shutil
+from collections import OrderedDict
+from typing import NoReturn, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    TZ,
+    NB_SLAVES,
+    COMMUNITY_NAME,
+    CURRENT_FOLDER,
+    PARQUET_DATA,
+    PARQUET_FOLDER,
+    TS_CACHE,
+    TS_CACHE_FOLDER,
+    DAY_INDEX,
+    DAY_INDEX_FOLDER,
+    FRAME_CACHE_BUDGET,
+    PYRAMID_DATA,
+    PYRAMID_FOLDER,
+    FLUKSO_AGG,
+    RTU_AGG
+)
+from utils import (
+    coarsen_stats,
+    means_to_stats,
+    pyramid_level,
+    stats_frame,
+    stats_to_means
+)
+
+
+# Columns of flukso files
+FLUKSO_COLUMNS: List[str] = ['home_id', 'day', 'ts', 'p_cons', 'p_prod', 'p_tot']
+
+# Columns of the RTU file
+RTU_COLUMNS: List[str] = [
+    'ip', 'day', 'ts', 'active', 'apparent', 'cos_phi', 'reactive',
+    'tension1_2', 'tension2_3', 'tension3_1'
+]
+
+# Frames kept by the cached loaders with their size in bytes, from the least recently used to the
+# most recently used.
+FRAME_CACHE: 'OrderedDict[tuple, Tuple[pd.DataFrame, int]]' = OrderedDict()
+
+# Total size in bytes of the frames of FRAME_CACHE
+FRAME_CACHE_USED: int = 0
+
+
+# ------------------------------------- #
+# ----------STORAGE FUNCTIONS---------- #
+# ------------------------------------- #
+
+
+def parquet_path(community: str, file: str) -> str:
+    """
+    Give the folder of the Parquet storage corresponding to a CSV file. Each CSV file becomes a
+    folder with one sub-folder per month, e.g. CDB/CDB001.csv -> CDB/CDB001/2022-05/.
+
+    :param community:   The name of the community (CDB, ECH or RTU).
+    :param file:        The name of the CSV file.
+
+    :return:            Return the path of the folder.
+    """
+    return f"{PARQUET_FOLDER}/{community}/{os.path.splitext(file)[0]}"
+
+
+def convert_csv_to_parquet(
+    file_path: str, path: str, chunksize: int = 1_000_000
+) -> NoReturn:
+    """
+    Convert a CSV file into Parquet files partitioned by month. The CSV is read by chunks to
+    keep the memory bounded. Each chunk writes one part per month that it contains. Parts of a
+    previous conversion are removed first, so rows are never read twice.
+
+    :param file_path:           Path of the CSV file.
+    :param path:                Path of the folder where we save the Parquet files.
+    :param chunksize=1_000_000: Number of rows read at once.
+    """
+    print(f"--------------------Converting file {file_path}--------------------")
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    part: int = 0
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        # Store typed timestamps in UTC instead of strings.
+        chunk['ts']: pd.TimestampSeries = pd.to_datetime(chunk['ts'], utc=True)
+        # Partition according to the local month.
+        months: pd.Series = chunk['ts'].dt.tz_convert(TZ).dt.strftime('%Y-%m')
+        for month, month_df in chunk.groupby(months, sort=True):
+            month_path: str = f"{path}/{month}"
+            if not os.path.isdir(month_path):
+                os.makedirs(month_path)
+            month_df.to_parquet(
+                f"{month_path}/part-{part:05d}.parquet", index=False, compression='zstd'
+            )
+        part += 1
+    print(f"--------------------{file_path} converted--------------------")
+
+
+def convert_dataset() -> NoReturn:
+    """
+    Convert the whole selected folder (CDB, ECH and RTU) into the Parquet storage.
+    """
+    print("--------------------Converting dataset to Parquet...--------------------")
+    files: List[Tuple[str, str]] = []
+    for community in COMMUNITY_NAME + ['RTU']:
+        folder_path: str = f"{CURRENT_FOLDER}/{community}"
+        if not os.path.isdir(folder_path):
+            continue
+        files += [
+            (community, file)
+            for file in sorted(os.listdir(folder_path))
+            if file.endswith('.csv')
+        ]
+    # Open a pool of processes to parallelize the conversion.
+    with multiprocessing.Pool(NB_SLAVES) as p:
+        convert_map = {
+            file: p.apply_async(
+                convert_csv_to_parquet,
+                (f"{CURRENT_FOLDER}/{community}/{file}", parquet_path(community, file))
+            )
+            for community, file in files
+        }
+        # For each process, we wait the end of the execution
+        for _, convert in convert_map.items():
+            convert.get()
+    print("--------------------Conversion done!--------------------")
+
+
+def ts_cache_path(file_path: str) -> str:
+    """
+    Give the path of the cache of parsed timestamps for a CSV file. The name depends on the path
+    and on the modification time of the file, so a modified file never uses an old cache.
+
+    :param file_path:   Path of the CSV file.
+
+    :return:            Return the path of the cache.
+    """
+    key: str = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()
+    return f"{TS_CACHE_FOLDER}/{key}_{os.stat(file_path).st_mtime_ns}.npy"
+
+
+def load_timestamps(file_path: str, ts: Optional[pd.Series] = None) -> Optional[np.ndarray]:
+    """
+    Give the timestamps of a CSV file as int64 nanoseconds since epoch in UTC. If the cache
+    exists, it is memory mapped without parsing anything. Otherwise, the given series of strings
+    is parsed and saved in the cache, removing the caches of older versions of the file.
+
+    :param file_path:   Path of the CSV file.
+    :param ts=None:     Column 'ts' of the file. None to only look in the cache.
+
+    :return:            Return the timestamps or None if there is no cache and no series.
+    """
+    cache_path: str = ts_cache_path(file_path)
+    if os.path.isfile(cache_path):
+        return np.load(cache_path, mmap_mode='r')
+    if ts is None:
+        return None
+    epochs: np.ndarray = (
+        pd.to_datetime(ts, utc=True).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    )
+    if not os.path.isdir(TS_CACHE_FOLDER):
+        os.makedirs(TS_CACHE_FOLDER)
+    for old_cache in glob.glob(f"{cache_path.rsplit('_', 1)[0]}_*.npy"):
+        os.remove(old_cache)
+    np.save(cache_path, epochs)
+    return epochs
+
+
+def local_timestamps(epochs: np.ndarray) -> pd.DatetimeIndex:
+    """
+    Convert int64 nanoseconds since epoch in UTC into datetimes in our timezone.
+
+    :param epochs:  Array of timestamps.
+
+    :return:        Return the datetimes.
+    """
+    return pd.DatetimeIndex(np.asarray(epochs).view('datetime64[ns]'), tz='UTC').tz_convert(TZ)
+
+
+def read_csv_cached_ts(file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a CSV file where the column 'ts' comes from the cache of parsed timestamps. If the cache
+    exists, the column 'ts' is not read at all. Otherwise, it is parsed once and saved.
+
+    :param file_path:       Path of the CSV file.
+    :param columns=None:    List of columns to read (with 'ts'). None to read all columns.
+
+    :return:                Return the DataFrame with 'ts' as datetimes in our timezone. Columns
+                            are in the order of the file, with or without the cache, like
+                            pd.read_csv with usecols.
+    """
+    epochs: Optional[np.ndarray] = load_timestamps(file_path)
+    if epochs is None:
+        df: pd.DataFrame = pd.read_csv(file_path, usecols=columns)
+        df['ts']: pd.TimestampSeries = local_timestamps(load_timestamps(file_path, df['ts']))
+        return df
+    # Columns to read in the order of the file
+    all_columns: List[str] = [
+        col for col in pd.read_csv(file_path, nrows=0).columns if columns is None or col in columns
+    ]
+    df: pd.DataFrame = pd.read_csv(file_path, usecols=[col for col in all_columns if col != 'ts'])
+    df.insert(all_columns.index('ts'), 'ts', local_timestamps(epochs))
+    return df
+
+
+def empty_home(community: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Create an empty DataFrame with the columns of a file, so callers can select columns of a home
+    without any data.
+
+    :param community:       The name of the community (CDB, ECH or RTU).
+    :param columns=None:    List of columns. None for all columns of the files of the community.
+
+    :return:                Return the DataFrame.
+    """
+    if columns is None:
+        columns: List[str] = RTU_COLUMNS if community == 'RTU' else FLUKSO_COLUMNS
+    text: List[str] = ['home_id', 'ip', 'day', 'ts']
+    return pd.DataFrame({
+        col: pd.Series(dtype=object if col in text else np.float64) for col in columns
+    })
+
+
+def read_home(
+    community: str, file: str, columns: Optional[List[str]] = None, parse_ts: bool = False
+) -> pd.DataFrame:
+    """
+    Read the data of a file of the selected folder. If PARQUET_DATA is True, we read the Parquet
+    storage, where the column 'ts' is already a datetime in UTC. Otherwise, we read the CSV file.
+
+    :param community:       The name of the community (CDB, ECH or RTU).
+    :param file:            The name of the CSV file (e.g. CDB001.csv).
+    :param columns=None:    List of columns to read. None to read all columns.
+    :param parse_ts=False:  True to return the column 'ts' as datetimes in our timezone. With
+                            TS_CACHE, the timestamps of CSV files come from the cache.
+
+    :return:                Return the DataFrame.
+    """
+    if PARQUET_DATA:
+        parts: List[str] = sorted(
+            glob.glob(f"{parquet_path(community, file)}/*/part-*.parquet")
+        )
+        if parts:
+            df: pd.DataFrame = pd.concat(
+                [pd.read_parquet(part, columns=columns) for part in parts], ignore_index=True
+            )
+        else:
+            df: pd.DataFrame = empty_home(community, columns)
+    elif parse_ts and TS_CACHE:
+        return read_csv_cached_ts(f"{CURRENT_FOLDER}/{community}/{file}", columns)
+    else:
+        df: pd.DataFrame = pd.read_csv(f"{CURRENT_FOLDER}/{community}/{file}", usecols=columns)
+    if parse_ts:
+        df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
+    return df
+
+
+def iter_home_chunks(
+    community: str, file: str, columns: Optional[List[str]] = None, chunksize: int = 1_000_000
+) -> Iterator[pd.DataFrame]:
+    """
+    Read the data of a file chunk by chunk, so the memory does not depend on the length of the
+    file. With PARQUET_DATA, each part of the Parquet storage is a chunk.
+
+    :param community:           The name of the community (CDB, ECH or RTU).
+    :param file:                The name of the CSV file (e.g. CDB001.csv).
+    :param columns=None:        List of columns to read (with 'ts'). None to read all columns.
+    :param chunksize=1_000_000: Number of rows of a chunk of the CSV file.
+
+    :return:                    Return an iterator over the chunks where 'ts' contains datetimes
+                                in our timezone.
+    """
+    if PARQUET_DATA:
+        chunks: Iterator[pd.DataFrame] = (
+            pd.read_parquet(part, columns=columns) for part in sorted(
+                glob.glob(f"{parquet_path(community, file)}/*/part-*.parquet")
+            )
+        )
+    else:
+        chunks: Iterator[pd.DataFrame] = pd.read_csv(
+            f"{CURRENT_FOLDER}/{community}/{file}", usecols=columns, chunksize=chunksize
+        )
+    for chunk in chunks:
+        chunk['ts']: pd.TimestampSeries = pd.to_datetime(chunk['ts'], utc=True).dt.tz_convert(TZ)
+        yield chunk
+
+
+def day_index_path(file_path: str) -> str:
+    """
+    Give the path of the day index of a CSV file. As for the cache of timestamps, the name
+    depends on the path and on the modification time of the file.
+
+    :param file_path:   Path of the CSV file.
+
+    :return:            Return the path of the index.
+    """
+    key: str = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()
+    return f"{DAY_INDEX_FOLDER}/{key}_{os.stat(file_path).st_mtime_ns}.npz"
+
+
+def build_day_index(file_path: str) -> Dict[str, np.ndarray]:
+    """
+    Build the day index of a CSV file. Each run of consecutive rows of the same day, as written
+    in the column 'ts', gives the day, the byte offset of its first row and its number of rows.
+    The file is only scanned line by line, without parsing the timestamps.
+
+    :param file_path:   Path of the CSV file.
+
+    :return:            Return a dictionary with the days, the offsets (with the end of the last
+                        run as last element) and the number of rows of each run.
+    """
+    days: List[bytes] = []
+    offsets: List[int] = []
+    counts: List[int] = []
+    with open(file_path, 'rb') as f:
+        header: bytes = f.readline()
+        ts_col: int = header.decode().strip().replace('"', '').split(',').index('ts')
+        offset: int = len(header)
+        for line in f:
+            if line.strip():
+                day: bytes = line.split(b',', ts_col + 1)[ts_col].strip(b'"')[:10]
+                if not days or day != days[-1]:
+                    days.append(day)
+                    offsets.append(offset)
+                    counts.append(0)
+                counts[-1] += 1
+            offset += len(line)
+    offsets.append(offset)
+    return {
+        'days': np.array([day.decode() for day in days], dtype='<U10'),
+        'offsets': np.array(offsets, dtype=np.int64),
+        'counts': np.array(counts, dtype=np.int64)
+    }
+
+
+def load_day_index(file_path: str) -> Dict[str, np.ndarray]:
+    """
+    Give the day index of a CSV file. The index is built and saved the first time, removing the
+    indexes of older versions of the file.
+
+    :param file_path:   Path of the CSV file.
+
+    :return:            Return the index (see build_day_index).
+    """
+    index_path: str = day_index_path(file_path)
+    if os.path.isfile(index_path):
+        with np.load(index_path) as index:
+            return {key: index[key] for key in index.files}
+    index: Dict[str, np.ndarray] = build_day_index(file_path)
+    if not os.path.isdir(DAY_INDEX_FOLDER):
+        os.makedirs(DAY_INDEX_FOLDER)
+    for old_index in glob.glob(f"{index_path.rsplit('_', 1)[0]}_*.npz"):
+        os.remove(old_index)
+    np.savez(index_path, **index)
+    return index
+
+
+def read_home_range(
+    community: str,
+    file: str,
+    starting: dt.datetime,
+    ending: dt.datetime,
+    columns: Optional[List[str]] = None,
+    parse_ts: bool = False
+) -> pd.DataFrame:
+    """
+    Read the data of a file around a period. With PARQUET_DATA, only the months of the period are
+    read. With DAY_INDEX, only the rows of the days of the period are read from the CSV file,
+    thanks to the day index. Otherwise, the whole file is read. One more day is kept on each
+    side, because the day written in the file may be in another timezone, so the caller still
+    needs to select the exact period.
+
+    :param community:       The name of the community (CDB, ECH or RTU).
+    :param file:            The name of the CSV file (e.g. CDB001.csv).
+    :param starting:        The starting date.
+    :param ending:          The ending date.
+    :param columns=None:    List of columns to read. None to read all columns.
+    :param parse_ts=False:  True to return the column 'ts' as datetimes in our timezone.
+
+    :return:                Return the DataFrame.
+    """
+    first_day: str = (starting - dt.timedelta(days=1)).strftime('%Y-%m-%d')
+    last_day: str = (ending + dt.timedelta(days=1)).strftime('%Y-%m-%d')
+    if PARQUET_DATA:
+        parts: List[str] = [
+            part for part in sorted(
+                glob.glob(f"{parquet_path(community, file)}/*/part-*.parquet")
+            )
+            if first_day[:7] <= os.path.basename(os.path.dirname(part)) <= last_day[:7]
+        ]
+        if parts:
+            df: pd.DataFrame = pd.concat(
+                [pd.read_parquet(part, columns=columns) for part in parts], ignore_index=True
+            )
+        else:
+            df: pd.DataFrame = empty_home(community, columns)
+    elif DAY_INDEX:
+        file_path: str = f"{CURRENT_FOLDER}/{community}/{file}"
+        index: Dict[str, np.ndarray] = load_day_index(file_path)
+        runs: np.ndarray = np.flatnonzero(
+            (index['days'] >= first_day) & (index['days'] <= last_day)
+        )
+        with open(file_path, 'rb') as f:
+            chunks: List[bytes] = [f.readline()]
+            for run in runs:
+                f.seek(index['offsets'][run])
+                chunk: bytes = f.read(index['offsets'][run + 1] - index['offsets'][run])
+                chunks.append(chunk if chunk.endswith(b'\n') else chunk + b'\n')
+        df: pd.DataFrame = pd.read_csv(io.BytesIO(b''.join(chunks)), usecols=columns)
+    else:
+        return read_home(community, file, columns, parse_ts)
+    if parse_ts:
+        df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
+    return df
+
+
+def read_resolution(community: str, file: str, resolution: str) -> pd.DataFrame:
+    """
+    Read the data of a file resampled at a given resolution, with the mean, the min, the max and
+    the count of each power. If PYRAMID_DATA is True, we read the coarsest level of the pyramid
+    that answers the resolution and only coarsen it if needed. Otherwise, we resample raw data.
+
+    :param community:   The name of the community (CDB, ECH or RTU).
+    :param file:        The name of the CSV file (e.g. CDB001.csv).
+    :param resolution:  The resolution (e.g. '15min').
+
+    :return:            Return the DataFrame where 'ts' is in our timezone.
+    """
+    agg: Dict[str, str] = RTU_AGG if community == 'RTU' else FLUKSO_AGG
+    if not PYRAMID_DATA:
+        df: pd.DataFrame = read_home(community, file, parse_ts=True)
+        return stats_to_means(stats_frame(df, agg, resolution), agg)
+    level: str = pyramid_level(resolution)
+    df: pd.DataFrame = pd.read_csv(f"{PYRAMID_FOLDER}/{community}/{level}/{file[:6]}_{level}.csv")
+    df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
+    if pd.to_timedelta(level) != pd.to_timedelta(resolution):
+        df: pd.DataFrame = stats_to_means(
+            coarsen_stats(means_to_stats(df, agg), agg, resolution), agg
+        )
+    return df
+
+
+def source_version(community: str, file: str) -> Optional[int]:
+    """
+    Give the modification time of the data of a file, i.e. the CSV file or the folder of the
+    Parquet storage, so a cached frame of a modified file is never used.
+
+    :param community:   The name of the community (CDB, ECH or RTU).
+    :param file:        The name of the CSV file (e.g. CDB001.csv).
+
+    :return:            Return the modification time in nanoseconds or None if there is no data.
+    """
+    path: str = (
+        parquet_path(community, file) if PARQUET_DATA else f"{CURRENT_FOLDER}/{community}/{file}"
+    )
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def cached_frame(key: tuple, loader: Callable[..., pd.DataFrame], *args) -> pd.DataFrame:
+    """
+    Give the frame of a key from the cache of the process, or load it and keep it in the cache.
+    When the size of the cache exceeds FRAME_CACHE_BUDGET bytes, the least recently used frames
+    are removed. A cached frame is returned as a copy, so the caller can modify it without
+    changing the cache. Frames larger than the budget are not cached and returned as they are.
+    Workers of a pool never cache frames: each one only reads a home once and would keep its
+    own copy of the budget.
+
+    :param key:     Key of the frame (file, period, columns, resolution, ...).
+    :param loader:  Function loading the frame.
+    :param args:    Arguments of the loader.
+
+    :return:        Return the frame.
+    """
+    global FRAME_CACHE_USED
+    if FRAME_CACHE_BUDGET <= 0 or multiprocessing.parent_process() is not None:
+        return loader(*args)
+    if key in FRAME_CACHE:
+        FRAME_CACHE.move_to_end(key)
+        return FRAME_CACHE[key][0].copy()
+    df: pd.DataFrame = loader(*args)
+    # The shallow size is enough for the budget and does not scan strings.
+    size: int = int(df.memory_usage(index=True, deep=False).sum())
+    if size > FRAME_CACHE_BUDGET:
+        return df
+    FRAME_CACHE[key] = (df, size)
+    FRAME_CACHE_USED += size
+    while FRAME_CACHE_USED > FRAME_CACHE_BUDGET:
+        _, (_, old_size) = FRAME_CACHE.popitem(last=False)
+        FRAME_CACHE_USED -= old_size
+    return df.copy()
+
+
+def clear_frame_cache() -> NoReturn:
+    """
+    Remove all frames of the cache of the process.
+    """
+    global FRAME_CACHE_USED
+    FRAME_CACHE.clear()
+    FRAME_CACHE_USED = 0
+
+
+def load_home(
+    community: str, file: str, columns: Optional[List[str]] = None, parse_ts: bool = False
+) -> pd.DataFrame:
+    """
+    Cached version of read_home.
+
+    :param community:       The name of the community (CDB, ECH or RTU).
+    :param file:            The name of the CSV file (e.g. CDB001.csv).
+    :param columns=None:    List of columns to read. None to read all columns.
+    :param parse_ts=False:  True to return the column 'ts' as datetimes in our timezone.
+
+    :return:                Return the DataFrame.
+    """
+    key: tuple = (
+        community, file, source_version(community, file), None, None,
+        None if columns is None else tuple(columns), None, parse_ts
+    )
+    return cached_frame(key, read_home, community, file, columns, parse_ts)
+
+
+def load_home_range(
+    community: str,
+    file: str,
+    starting: dt.datetime,
+    ending: dt.datetime,
+    columns: Optional[List[str]] = None,
+    parse_ts: bool = False
+) -> pd.DataFrame:
+    """
+    Cached version of read_home_range.
+
+    :param community:       The name of the community (CDB, ECH or RTU).
+    :param file:            The name of the CSV file (e.g. CDB001.csv).
+    :param starting:        The starting date.
+    :param ending:          The ending date.
+    :param columns=None:    List of columns to read. None to read all columns.
+    :param parse_ts=False:  True to return the column 'ts' as datetimes in our timezone.
+
+    :return:                Return the DataFrame.
+    """
+    key: tuple = (
+        community, file, source_version(community, file), starting, ending,
+        None if columns is None else tuple(columns), None, parse_ts
+    )
+    return cached_frame(
+        key, read_home_range, community, file, starting, ending, columns, parse_ts
+    )
+
+
+def load_resolution(community: str, file: str, resolution: str) -> pd.DataFrame:
+    """
+    Cached version of read_resolution.
+
+    :param community:   The name of the community (CDB, ECH or RTU).
+    :param file:        The name of the CSV file (e.g. CDB001.csv).
+    :param resolution:  The resolution (e.g. '15min').
+
+    :return:            Return the DataFrame where 'ts' is in our timezone.
+    """
+    key: tuple = (
+        community, file, source_version(community, file), None, None, None, resolution, True
+    )
+    return cached_frame(key, read_resolution, community, file, resolution)
@@ -0,0 +1,390 @@
+__title__ = "synthetic"
+__version__ = "1.0.0"
+__author__ = "Brice Petit"
+__license__ = "MIT"
+
+
+import argparse
+import datetime as dt
+import numpy as np
+import os
+import pandas as pd
+from typing import NoReturn, Dict, List, Optional, Tuple
+
+
+# Our timezone. It is not imported from config because config needs an existing dataset.
+TZ: str = 'Europe/Brussels'
+
+# Latitude and longitude of Brussels in degrees, used for the position of the sun
+LATITUDE: float = 50.85
+LONGITUDE: float = 4.35
+
+# Columns of flukso files
+FLUKSO_COLUMNS: List[str] = ['home_id', 'day', 'ts', 'p_cons', 'p_prod', 'p_tot']
+
+# Columns of the RTU file
+RTU_COLUMNS: List[str] = [
+    'ip', 'day', 'ts', 'active', 'apparent', 'cos_phi', 'reactive',
+    'tension1_2', 'tension2_3', 'tension3_1'
+]
+
+# Communal files of ECH that are not aggregations, with their kind of consumption
+ECH_COMMUNAL: Dict[str, str] = {'ECHASC': 'elevator', 'ECHBUA': 'laundry', 'ECHCOM': 'commons'}
+
+
+# --------------------------------------- #
+# ----------SYNTHETIC FUNCTIONS---------- #
+# --------------------------------------- #
+
+
+def home_params(rng: np.random.Generator, kind: str = 'home') -> Dict[str, float]:
+    """
+    Draw the parameters of the load and the production of a home.
+
+    :param rng:         Random generator of the home.
+    :param kind='home': 'home', 'elevator', 'laundry' or 'commons'.
+
+    :return:            Return a dictionary of parameters.
+    """
+    params: Dict[str, float] = {
+        'base': rng.uniform(80, 350),
+        'morning': rng.uniform(200, 1200),
+        'morning_hour': rng.uniform(6.5, 8.5),
+        'evening': rng.uniform(500, 2500),
+        'evening_hour': rng.uniform(18, 20.5),
+        'noise': rng.uniform(0.1, 0.4),
+        'spike_rate': rng.uniform(0.002, 0.01),
+        'kwp': rng.uniform(2, 8) if rng.random() < 0.7 else 0.0
+    }
+    if kind == 'elevator':
+        params.update(base=50, morning=300, evening=400, spike_rate=0.05, kwp=0.0)
+    elif kind == 'laundry':
+        params.update(base=20, morning=100, evening=1500, evening_hour=10, kwp=0.0)
+    elif kind == 'commons':
+        params.update(base=300, morning=200, evening=600, kwp=rng.uniform(10, 20))
+    return params
+
+
+def load_curve(
+    idx: pd.DatetimeIndex, params: Dict[str, float], rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Give the consumption of a home in Watt: a base load, a morning and an evening peak following
+    the local time, more consumption in winter and during weekends, noise and short spikes of
+    appliances.
+
+    :param idx:     Datetimes in our timezone.
+    :param params:  Parameters of the home.
+    :param rng:     Random generator of the home.
+
+    :return:        Return the consumption.
+    """
+    hours: np.ndarray = np.asarray(idx.hour + idx.minute / 60 + idx.second / 3600)
+    day_of_year: np.ndarray = np.asarray(idx.dayofyear)
+    weekend: np.ndarray = np.asarray(idx.weekday >= 5)
+    season: np.ndarray = 1 + 0.35 * np.cos(2 * np.pi * (day_of_year - 15) / 365)
+    morning_hour: np.ndarray = params['morning_hour'] + weekend * 1.5
+    load: np.ndarray = (
+        params['base']
+        + params['morning'] * np.exp(-0.5 * ((hours - morning_hour) / 0.8) ** 2)
+        + params['evening'] * np.exp(-0.5 * ((hours - params['evening_hour']) / 1.5) ** 2)
+        + weekend * 0.3 * params['morning'] * np.exp(-0.5 * ((hours - 13) / 2) ** 2)
+    ) * season
+    load *= 1 + params['noise'] * rng.standard_normal(len(idx)).clip(-2, 2) / 2
+    spikes: np.ndarray = rng.random(len(idx)) < params['spike_rate']
+    load[spikes] += rng.uniform(1000, 3000, spikes.sum())
+    return np.maximum(load, 0)
+
+
+def pv_curve(
+    idx: pd.DatetimeIndex, kwp: float, clearness: np.ndarray
+) -> np.ndarray:
+    """
+    Give the production of a home in Watt (negative values) from the elevation of the sun, which
+    follows the solar time, so the change of hour does not move it.
+
+    :param idx:         Datetimes in our timezone.
+    :param kwp:         Peak power of the panels in kWp. 0 if there is no panel.
+    :param clearness:   Clearness of the sky (between 0 and 1) of each datetime.
+
+    :return:            Return the production.
+    """
+    if kwp == 0:
+        return np.zeros(len(idx))
+    utc: pd.DatetimeIndex = idx.tz_convert('UTC')
+    solar_hours: np.ndarray = np.asarray(
+        utc.hour + utc.minute / 60 + utc.second / 3600 + LONGITUDE / 15
+    )
+    declination: np.ndarray = np.radians(23.44) * np.sin(
+        2 * np.pi * (284 + np.asarray(utc.dayofyear)) / 365
+    )
+    latitude: float = np.radians(LATITUDE)
+    elevation: np.ndarray = (
+        np.sin(latitude) * np.sin(declination)
+        + np.cos(latitude) * np.cos(declination) * np.cos(np.radians(15 * (solar_hours - 12)))
+    )
+    return -kwp * 1000 * 0.8 * np.maximum(elevation, 0) * clearness
+
+
+def day_clearness(idx: pd.DatetimeIndex, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draw the clearness of the sky of each day and give it for each datetime, with some clouds
+    passing during the day.
+
+    :param idx: Datetimes in our timezone.
+    :param rng: Random generator of the home.
+
+    :return:    Return the clearness of each datetime.
+    """
+    days, inverse = np.unique(idx.normalize().asi8, return_inverse=True)
+    clearness: np.ndarray = rng.beta(2, 1.2, len(days))[inverse]
+    clouds: np.ndarray = 1 - 0.5 * (rng.random(len(idx)) < 0.05)
+    return clearness * clouds
+
+
+def faults(
+    keep: np.ndarray, p_cons: np.ndarray, step: pd.Timedelta, rng: np.random.Generator,
+    gap_rate: float, fault_rate: float
+) -> NoReturn:
+    """
+    Add gaps (removed rows, from one hour to three days) and faults (negative consumption, from
+    ten minutes to two hours) in the data of a month. Arrays are modified in place.
+
+    :param keep:        Boolean mask of the rows to write.
+    :param p_cons:      Consumption.
+    :param step:        Duration between two rows.
+    :param rng:         Random generator of the home.
+    :param gap_rate:    Probability to have a gap during the month.
+    :param fault_rate:  Probability to have a fault during the month.
+    """
+    nb_rows: int = len(keep)
+    if rng.random() < gap_rate:
+        length: int = int(pd.Timedelta(hours=rng.uniform(1, 72)) / step)
+        start: int = rng.integers(0, max(nb_rows - length, 1))
+        keep[start:start + length] = False
+    if rng.random() < fault_rate:
+        length: int = int(pd.Timedelta(minutes=rng.uniform(10, 120)) / step)
+        start: int = rng.integers(0, max(nb_rows - length, 1))
+        p_cons[start:start + length] = -np.abs(p_cons[start:start + length])
+
+
+def write_rows(df: pd.DataFrame, path: str) -> NoReturn:
+    """
+    Append rows to a CSV file, with the header if the file does not exist.
+
+    :param df:      Rows to write.
+    :param path:    Path of the file.
+    """
+    df.to_csv(
+        path, mode='a', header=not os.path.isfile(path), index=False, float_format='%.1f'
+    )
+
+
+def flukso_frame(
+    home_id: str, idx: pd.DatetimeIndex, p_cons: np.ndarray, p_prod: np.ndarray
+) -> pd.DataFrame:
+    """
+    Create the rows of a flukso file.
+
+    :param home_id: The id of the home.
+    :param idx:     Datetimes in our timezone.
+    :param p_cons:  Consumption.
+    :param p_prod:  Production.
+
+    :return:        Return the DataFrame.
+    """
+    return pd.DataFrame({
+        'home_id': home_id,
+        'day': idx.strftime('%Y-%m-%d'),
+        'ts': idx,
+        'p_cons': p_cons,
+        'p_prod': p_prod,
+        'p_tot': p_cons + p_prod
+    }, columns=FLUKSO_COLUMNS)
+
+
+def rtu_frame(idx: pd.DatetimeIndex, active: np.ndarray, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Create the rows of the RTU file from the active power of the low voltage cabin.
+
+    :param idx:     Datetimes in our timezone.
+    :param active:  Active power.
+    :param rng:     Random generator of the RTU.
+
+    :return:        Return the DataFrame.
+    """
+    cos_phi: np.ndarray = rng.uniform(0.9, 0.99, len(idx))
+    apparent: np.ndarray = np.abs(active) / cos_phi
+    tension: np.ndarray = 400 - active / 2000
+    return pd.DataFrame({
+        'ip': '10.0.0.1',
+        'day': idx.strftime('%Y-%m-%d'),
+        'ts': idx,
+        'active': active,
+        'apparent': apparent,
+        'cos_phi': cos_phi,
+        'reactive': np.sqrt(np.maximum(apparent ** 2 - active ** 2, 0)),
+        'tension1_2': tension + rng.normal(0, 1, len(idx)),
+        'tension2_3': tension + rng.normal(0, 1, len(idx)),
+        'tension3_1': tension + rng.normal(0, 1, len(idx))
+    }, columns=RTU_COLUMNS)
+
+
+def planning(
+    months: List[pd.Timestamp], alerts_per_month: int, rng: np.random.Generator
+) -> pd.DataFrame:
+    """
+    Create the planning of alerts of both communities, in the format of final_planning.xlsx.
+
+    :param months:              First day of each month.
+    :param alerts_per_month:    Number of alerts of each community during a month.
+    :param rng:                 Random generator of the planning.
+
+    :return:                    Return the DataFrame of alerts.
+    """
+    rows: List[list] = []
+    for month in months:
+        for community in ['Coin du Balai', 'Echappée']:
+            days: np.ndarray = rng.choice(
+                np.arange(1, month.days_in_month + 1), alerts_per_month, replace=False
+            )
+            for day in np.sort(days):
+                hour: int = int(rng.choice([10, 11, 13, 17, 18, 19]))
+                start: dt.datetime = dt.datetime(month.year, month.month, int(day), hour)
+                end: dt.datetime = start + dt.timedelta(hours=int(rng.integers(1, 4)))
+                rows.append([community, start, end, 'Oui'])
+    return pd.DataFrame(rows, columns=['Echappée/Coin du Balai', 'Début', 'Fin', 'Envoyée'])
+
+
+def generate_dataset(
+    output: str,
+    nb_cdb: int,
+    nb_ech: int,
+    start: str,
+    nb_months: int,
+    fmt: str,
+    seed: int = 0,
+    alerts_per_month: int = 2,
+    gap_rate: float = 0.3,
+    fault_rate: float = 0.1
+) -> NoReturn:
+    """
+    Generate a synthetic dataset with the layout of DATASET_FOLDER: CDB/ (homes and the
+    aggregations CDBA01, CDBA02), ECH/ (homes ECHL*, the aggregation ECHA01 and the communal
+    files), RTU/rtu.csv (every 5 minutes) and final_planning.xlsx. Timestamps are written in our
+    timezone with their offset, so the changes of hour are unambiguous. Months are generated one
+    after the other and appended to the files, so the memory only depends on the number of homes
+    and the length of a month. The output only depends on the parameters: each home has its own
+    random generator seeded with (seed, number of the home).
+
+    :param output:                  Path of the folder of the dataset.
+    :param nb_cdb:                  Number of homes in CDB.
+    :param nb_ech:                  Number of homes in ECH.
+    :param start:                   First month (e.g. '2022-05').
+    :param nb_months:               Number of months.
+    :param fmt:                     Duration between two rows of flukso files ('8S' or '15min').
+    :param seed=0:                  Seed of the random generators.
+    :param alerts_per_month=2:      Number of alerts of each community during a month.
+    :param gap_rate=0.3:            Probability for a home to have a gap during a month.
+    :param fault_rate=0.1:          Probability for a home to have a negative consumption during
+                                    a month.
+    """
+    step: pd.Timedelta = pd.Timedelta(fmt)
+    months: List[pd.Timestamp] = list(pd.date_range(start, periods=nb_months, freq='MS'))
+    homes: List[Tuple[str, str, str]] = (
+        [('CDB', f"CDB{i + 1:03d}", 'home') for i in range(nb_cdb)]
+        + [('ECH', f"ECHL{i + 1:02d}", 'home') for i in range(nb_ech)]
+        + [('ECH', home_id, kind) for home_id, kind in ECH_COMMUNAL.items()]
+    )
+    rngs: List[np.random.Generator] = [
+        np.random.default_rng([seed, i]) for i in range(len(homes))
+    ]
+    params: List[Dict[str, float]] = [
+        home_params(rng, kind) for rng, (_, _, kind) in zip(rngs, homes)
+    ]
+    rtu_rng: np.random.Generator = np.random.default_rng([seed, len(homes)])
+    for community in ['CDB', 'ECH', 'RTU']:
+        os.makedirs(f"{output}/{community}", exist_ok=True)
+        # Files are appended month by month, so the previous ones are removed.
+        for file in os.listdir(f"{output}/{community}"):
+            if file.endswith('.csv'):
+                os.remove(f"{output}/{community}/{file}")
+    for month in months:
+        print(f"--------------------Generating {month.strftime('%Y-%m')}--------------------")
+        # Rows are generated in UTC and converted, so a change of hour gives a repeated or a
+        # missing local hour, as in real data.
+        idx: pd.DatetimeIndex = pd.date_range(
+            month.tz_localize(TZ), (month + pd.offsets.MonthBegin()).tz_localize(TZ),
+            freq=step, inclusive='left'
+        ).tz_convert('UTC').tz_convert(TZ)
+        aggregations: Dict[str, np.ndarray] = {
+            name: np.zeros((2, len(idx))) for name in ['CDBA01', 'CDBA02', 'ECHA01']
+        }
+        for i, (community, home_id, kind) in enumerate(homes):
+            rng: np.random.Generator = rngs[i]
+            p_cons: np.ndarray = load_curve(idx, params[i], rng)
+            p_prod: np.ndarray = pv_curve(idx, params[i]['kwp'], day_clearness(idx, rng))
+            if community == 'CDB':
+                aggregation: Optional[str] = 'CDBA01' if i < (nb_cdb + 1) // 2 else 'CDBA02'
+            else:
+                aggregation: Optional[str] = 'ECHA01' if kind == 'home' else None
+            if aggregation is not None:
+                aggregations[aggregation] += [p_cons, p_prod]
+            keep: np.ndarray = np.ones(len(idx), dtype=bool)
+            faults(keep, p_cons, step, rng, gap_rate, fault_rate)
+            write_rows(
+                flukso_frame(home_id, idx[keep], p_cons[keep], p_prod[keep]),
+                f"{output}/{community}/{home_id}.csv"
+            )
+        for name, (p_cons, p_prod) in aggregations.items():
+            write_rows(flukso_frame(name, idx, p_cons, p_prod), f"{output}/{name[:3]}/{name}.csv")
+        # The low voltage cabin sees all homes of ECH every 5 minutes.
+        total: pd.Series = pd.Series(
+            aggregations['ECHA01'].sum(axis=0), index=idx
+        ).resample('5min').mean()
+        write_rows(
+            rtu_frame(total.index, total.to_numpy(), rtu_rng), f"{output}/RTU/rtu.csv"
+        )
+    planning(months, alerts_per_month, np.random.default_rng([seed, len(homes) + 1])).to_excel(
+        f"{output}/final_planning.xlsx", index=False
+    )
+    print("--------------------Synthetic dataset generated !--------------------")
+
+
+def write_daily_files(output: str, download: str) -> NoReturn:
+    """
+    Split the flukso files of a dataset into daily files ({home}_{YYYY}_{MM}_{DD}.csv), as they
+    are downloaded, so the concatenation can be run on them.
+
+    :param output:      Path of the folder of the dataset.
+    :param download:    Path of the folder of daily files.
+    """
+    os.makedirs(download, exist_ok=True)
+    for file in os.listdir(download):
+        if file.endswith('.csv'):
+            os.remove(f"{download}/{file}")
+    for community in ['CDB', 'ECH']:
+        for file in sorted(os.listdir(f"{output}/{community}")):
+            if file != f"{file[:6]}.csv":
+                continue
+            for chunk in pd.read_csv(f"{output}/{community}/{file}", chunksize=1_000_000):
+                for day, rows in chunk.groupby('day', sort=False):
+                    write_rows(rows, f"{download}/{file[:6]}_{day.replace('-', '_')}.csv")
+
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Generate a deterministic synthetic dataset with the layout of DATASET_FOLDER."
+    )
+    parser.add_argument('output', help="Folder of the dataset.")
+    parser.add_argument('--cdb', type=int, default=41, help="Number of homes in CDB.")
+    parser.add_argument('--ech', type=int, default=15, help="Number of homes in ECH.")
+    parser.add_argument('--start', default='2022-05', help="First month (YYYY-MM).")
+    parser.add_argument('--months', type=int, default=12, help="Number of months.")
+    parser.add_argument('--fmt', default='8S', choices=['8S', '15min'], help="Resolution.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random generators.")
+    parser.add_argument('--alerts', type=int, default=2, help="Alerts per month and community.")
+    args: argparse.Namespace = parser.parse_args()
+    generate_dataset(
+        args.output, args.cdb, args.ech, args.start, args.months, args.fmt, args.seed, args.alerts
+    )
@@ -4,34 +4,104 @@ __author__ = "Brice Petit"
 __license__ = "MIT"
 
 
+from collections import deque
 import datetime as dt
+import hashlib
+import json
+import multiprocessing.pool
 import numpy as np
 import os
 import pandas as pd
-from typing import NoReturn, List, Dict
+from typing import NoReturn, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 from config import (
     TZ,
-    REPORTS_HOURS
+    REPORTS_HOURS,
+    PYRAMID_LEVELS
 )
 
 
-def check_negative_consumption(df: pd.DataFrame, home_id: str) -> NoReturn:
+def run_length_intervals(ts: pd.Series, mask: np.ndarray) -> pd.DataFrame:
     """
-    Check if there is negative consumption in the dataframe. It will print the home_id and indexes
-    of the dataframe.
+    Collapse consecutive rows selected by a mask into intervals.
 
-    :param df:      Dataframe.
-    :param home_id: The id of the home.
+    :param ts:      Series of timestamps sorted in time.
+    :param mask:    Boolean mask of the selected rows.
+
+    :return:        Return a dataframe with the first timestamp, the last timestamp and the number
+                    of rows of each interval.
+    """
+    padded: np.ndarray = np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0]))
+    changes: np.ndarray = np.diff(padded)
+    starts: np.ndarray = np.flatnonzero(changes == 1)
+    ends: np.ndarray = np.flatnonzero(changes == -1)
+    return pd.DataFrame({
+        'start': ts.iloc[starts].to_numpy(),
+        'end': ts.iloc[ends - 1].to_numpy(),
+        'nb_rows': ends - starts
+    })
+
+
+def find_anomalies(df: pd.DataFrame, step: pd.Timedelta, tolerance: float) -> pd.DataFrame:
+    """
+    Find anomalies of a home: negative consumption, positive production, total power different
+    from the consumption plus the production, duplicated timestamps and gaps larger than twice
+    the step. Consecutive anomalous rows are collapsed into intervals.
+
+    :param df:          Dataframe with the columns 'ts' (datetimes), 'p_cons', 'p_prod', 'p_tot'.
+    :param step:        Expected time between two rows.
+    :param tolerance:   Tolerance in Watt between 'p_tot' and 'p_cons' + 'p_prod'.
+
+    :return:            Return a dataframe with the anomaly, the start, the end and the number of
+                        rows of each interval. For a gap, it is the number of missing rows.
     """
-    if (df['p_cons'] < 0).any().any():
-        print()
-        print("/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\")
-        print("Home: " + home_id)
-        print(df.index[df['p_cons'] < 0])
-        print("/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\/!\\")
-        print()
+    df: pd.DataFrame = df.sort_values('ts', kind='stable').reset_index(drop=True)
+    ts: pd.Series = df['ts']
+    known: pd.Series = df[['p_cons', 'p_prod', 'p_tot']].notna().all(axis=1)
+    masks: Dict[str, pd.Series] = {
+        'negative p_cons': df['p_cons'] < 0,
+        'positive p_prod': df['p_prod'] > 0,
+        'p_tot != p_cons + p_prod': known & ~np.isclose(
+            df['p_tot'], df['p_cons'] + df['p_prod'], rtol=0, atol=tolerance
+        ),
+        'duplicated ts': ts.duplicated(keep=False)
+    }
+    reports: List[pd.DataFrame] = [
+        run_length_intervals(ts, mask.to_numpy()).assign(anomaly=anomaly)
+        for anomaly, mask in masks.items()
+    ]
+    # Each gap is one interval from the last row before it to the first row after it.
+    delta: pd.Series = ts.diff()
+    gaps: np.ndarray = np.flatnonzero((delta > 2 * step).to_numpy())
+    reports.append(pd.DataFrame({
+        'start': ts.iloc[gaps - 1].to_numpy(),
+        'end': ts.iloc[gaps].to_numpy(),
+        'nb_rows': (delta.iloc[gaps] / step).round().astype(int).to_numpy() - 1,
+        'anomaly': 'gap'
+    }))
+    return pd.concat(reports, ignore_index=True)[['anomaly', 'start', 'end', 'nb_rows']]
+
+
+def resample_frame(df: pd.DataFrame, agg: Dict[str, str], fmt='15min') -> pd.DataFrame:
+    """
+    Resample a dataframe where the column 'ts' contains strings or datetimes.
+
+    :param df:          Dataframe.
+    :param agg:         Aggregation to apply for the resample.
+    :param fmt='15min': Format of the dataset.
+
+    :return:            Return the resampled dataframe with 'ts' in our timezone.
+    """
+    df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True)
+    df: pd.DataFrame = (
+        df
+        .resample(fmt, on='ts')
+        .agg(agg)
+        .reset_index()
+    )
+    df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts']).dt.tz_convert(TZ)
+    return df
 
 
 def resample_dataset(
@@ -49,18 +119,468 @@ def resample_dataset(
     print(f"--------------------Processing file {filename}--------------------")
     if not os.path.isdir(path):
         os.makedirs(path)
-    df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True)
-    df: pd.DataFrame = (
-        df
-        .resample(fmt, on='ts')
-        .agg(agg)
-        .reset_index()
-    )
-    df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts']).dt.tz_convert(TZ)
+    df: pd.DataFrame = resample_frame(df, agg, fmt)
     df.to_csv(f"{path}/{filename[:6]}_15min.csv", index=False)
     print(f"--------------------{filename[:6]} saved--------------------")
 
 
+def resample_file(
+    file_path: str, path: str, filename: str, agg: Dict[str, str], fmt='15min'
+) -> NoReturn:
+    """
+    Read a file and resample it. It is used by workers so that only the path of the file is sent
+    to them and each worker keeps only one file in memory.
+
+    :param file_path:   Path of the source file.
+    :param path:        Path to save the file.
+    :param filename:    Filename.
+    :param agg:         Aggregation to apply for the resample.
+    :param fmt='15min': Format of the dataset.
+    """
+    resample_dataset(pd.read_csv(file_path), path, filename, agg, fmt)
+
+
+def write_buckets(
+    df: pd.DataFrame,
+    output_path: str,
+    agg: Dict[str, str],
+    fmt: str,
+    origin: pd.Timestamp,
+    first_bucket: pd.Timestamp,
+    last_bucket: pd.Timestamp,
+    header: bool
+) -> NoReturn:
+    """
+    Resample rows and write the buckets from first_bucket to last_bucket, including empty ones.
+
+    :param df:              Dataframe where 'ts' contains datetimes in UTC.
+    :param output_path:     Path of the output file.
+    :param agg:             Aggregation to apply for the resample.
+    :param fmt:             Format of the dataset.
+    :param origin:          Origin of the buckets.
+    :param first_bucket:    First bucket to write.
+    :param last_bucket:     Last bucket to write.
+    :param header:          True to create the file with a header, False to append buckets.
+    """
+    out: pd.DataFrame = df.resample(fmt, on='ts', origin=origin).agg(agg)
+    out: pd.DataFrame = out.reindex(
+        pd.date_range(first_bucket, last_bucket, freq=fmt, name='ts')
+    ).reset_index()
+    out['ts']: pd.TimestampSeries = out['ts'].dt.tz_convert(TZ)
+    out.to_csv(output_path, index=False, header=header, mode='w' if header else 'a')
+
+
+def resample_streaming(
+    file_path: str,
+    path: str,
+    filename: str,
+    agg: Dict[str, str],
+    fmt='15min',
+    chunksize: int = 1_000_000
+) -> NoReturn:
+    """
+    Resample a file by chunks and write the output as we go, so the memory does not depend on the
+    length of the file. The rows of the last bucket of a chunk may continue in the next chunk, so
+    they are carried over and resampled with the next chunk. Buckets are aligned as with
+    resample_dataset and empty buckets between two chunks are written, so the output is the same.
+    Rows are expected to be sorted by 'ts'.
+
+    :param file_path:           Path of the source file.
+    :param path:                Path to save the file.
+    :param filename:            Filename.
+    :param agg:                 Aggregation to apply for the resample.
+    :param fmt='15min':         Format of the dataset.
+    :param chunksize=1_000_000: Number of rows read at once.
+    """
+    print(f"--------------------Processing file {filename} by chunks--------------------")
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    output_path: str = f"{path}/{filename[:6]}_15min.csv"
+    step: pd.Timedelta = pd.to_timedelta(fmt)
+    origin: Optional[pd.Timestamp] = None
+    next_bucket: Optional[pd.Timestamp] = None
+    carry: Optional[pd.DataFrame] = None
+    header: bool = True
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        chunk['ts']: pd.TimestampSeries = pd.to_datetime(chunk['ts'], utc=True)
+        if origin is None:
+            # Same origin as resample_dataset: the midnight of the first day.
+            origin: pd.Timestamp = chunk['ts'].iloc[0].floor('D')
+            next_bucket: pd.Timestamp = origin + ((chunk['ts'].iloc[0] - origin) // step) * step
+        if carry is not None:
+            chunk: pd.DataFrame = pd.concat([carry, chunk], ignore_index=True)
+        # Start of the last bucket, which may continue in the next chunk.
+        last: pd.Timestamp = origin + ((chunk['ts'].iloc[-1] - origin) // step) * step
+        complete: pd.Series = chunk['ts'] < last
+        carry: pd.DataFrame = chunk[~complete]
+        if complete.any():
+            write_buckets(
+                chunk[complete], output_path, agg, fmt, origin, next_bucket, last - step, header
+            )
+            next_bucket: pd.Timestamp = last
+            header: bool = False
+    if carry is not None and not carry.empty:
+        write_buckets(
+            carry, output_path, agg, fmt, origin, next_bucket,
+            origin + ((carry['ts'].iloc[-1] - origin) // step) * step, header
+        )
+    print(f"--------------------{filename[:6]} saved--------------------")
+
+
+def concat_files(files: List[str], output_path: str, columns_name: List[str]) -> str:
+    """
+    Concatenate files into one file by appending them one after the other, so only one file is
+    in memory at once. Files with the expected header are copied as text. Other files are read
+    and their columns are reordered according to columns_name.
+
+    :param files:           List of paths of the files to concatenate, in order.
+    :param output_path:     Path of the output file.
+    :param columns_name:    List of string with the name of each column.
+
+    :return:                Return the path of the output file.
+    """
+    print(f"----------{output_path}----------")
+    header: str = ','.join(columns_name)
+    with open(output_path, 'w') as out:
+        out.write(f"{header}\n")
+        for file in files:
+            with open(file) as f:
+                file_header: str = f.readline().rstrip('\r\n')
+                if file_header == header:
+                    data: str = f.read()
+                    out.write(data)
+                    if data and not data.endswith('\n'):
+                        out.write('\n')
+                else:
+                    (
+                        pd.read_csv(f, header=None, names=file_header.split(','))
+                        .reindex(columns=columns_name)
+                        .to_csv(out, index=False, header=False)
+                    )
+    return output_path
+
+
+def run_bounded(
+    pool: multiprocessing.pool.Pool,
+    func: Callable,
+    tasks: Iterable[Tuple],
+    max_in_flight: int
+) -> Iterator:
+    """
+    Submit tasks to a pool of processes while keeping at most max_in_flight tasks submitted and
+    not finished. Results are given in the order of the tasks and exceptions of the workers are
+    raised in the parent.
+
+    :param pool:            The pool of processes.
+    :param func:            The function to apply.
+    :param tasks:           The arguments of each task.
+    :param max_in_flight:   Maximum number of tasks submitted and not finished.
+
+    :return:                Return an iterator over the results.
+    """
+    in_flight: Deque[multiprocessing.pool.AsyncResult] = deque()
+    for args in tasks:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().get()
+        in_flight.append(pool.apply_async(func, args))
+    while in_flight:
+        yield in_flight.popleft().get()
+
+
+def tail_offset(file_path: str, nb_lines: int, block_size: int = 65536) -> int:
+    """
+    Give the byte offset where the last lines of a file begin. The file is read backward by
+    blocks, so the cost depends on the number of lines and not on the size of the file.
+
+    :param file_path:           Path of the file.
+    :param nb_lines:            Number of lines at the end of the file.
+    :param block_size=65536:    Number of bytes read at once.
+
+    :return:                    Return the offset.
+    """
+    with open(file_path, 'rb') as f:
+        end: int = f.seek(0, os.SEEK_END)
+        position: int = end
+        nb_newlines: int = 0
+        while position > 0:
+            size: int = min(block_size, position)
+            position -= size
+            f.seek(position)
+            block: bytes = f.read(size)
+            # The new line ending the last line does not begin a line.
+            if position + size == end and block.endswith(b'\n'):
+                block = block[:-1]
+            idx: int = len(block)
+            while True:
+                idx = block.rfind(b'\n', 0, idx)
+                if idx == -1:
+                    break
+                nb_newlines += 1
+                if nb_newlines == nb_lines:
+                    return position + idx + 1
+    return 0
+
+
+def tail_hash(file_path: str, size: int, nb_bytes: int = 4096) -> str:
+    """
+    Give the hash of the bytes preceding a given size of a file. It is used to check that a file
+    has only been appended since the last time we read it.
+
+    :param file_path:       Path of the file.
+    :param size:            The size of the file at the moment of the previous read.
+    :param nb_bytes=4096:   Number of bytes to hash.
+
+    :return:                Return the hash.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(max(size - nb_bytes, 0))
+        return hashlib.sha1(f.read(min(size, nb_bytes))).hexdigest()
+
+
+def resample_incremental(
+    file_path: str, path: str, filename: str, agg: Dict[str, str], fmt='15min'
+) -> NoReturn:
+    """
+    Resample a file incrementally. A manifest next to the output keeps the size, the modification
+    time and the end of the source file, the offset of the first row of the last bucket in the
+    source and the offset of the last bucket in the output. If the source did not change, nothing
+    is done. If rows were appended, only the rows from the last bucket are read and resampled, the
+    last bucket of the output is replaced and new buckets are appended. Otherwise, the whole file
+    is resampled. Rows are expected to be appended in chronological order.
+
+    :param file_path:   Path of the source file.
+    :param path:        Path to save the file.
+    :param filename:    Filename.
+    :param agg:         Aggregation to apply for the resample.
+    :param fmt='15min': Format of the dataset.
+    """
+    output_path: str = f"{path}/{filename[:6]}_15min.csv"
+    manifest_path: str = f"{path}/{filename[:6]}_15min.json"
+    stat: os.stat_result = os.stat(file_path)
+    manifest: Dict = {}
+    if os.path.isfile(manifest_path) and os.path.isfile(output_path):
+        with open(manifest_path) as f:
+            manifest: Dict = json.load(f)
+    if manifest.get('size') == stat.st_size and manifest.get('mtime') == stat.st_mtime_ns:
+        print(f"--------------------{filename[:6]} is up to date--------------------")
+        return
+    append: bool = (
+        bool(manifest)
+        and stat.st_size > manifest['size']
+        and tail_hash(file_path, manifest['size']) == manifest['tail_hash']
+    )
+    print(f"--------------------Processing file {filename}--------------------")
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    if append:
+        columns: List[str] = list(pd.read_csv(file_path, nrows=0).columns)
+        # Read the rows of the last bucket and the new rows
+        with open(file_path, 'rb') as f:
+            f.seek(manifest['bucket_offset'])
+            df: pd.DataFrame = pd.read_csv(f, header=None, names=columns)
+    else:
+        df: pd.DataFrame = pd.read_csv(file_path)
+    # Source timestamps in UTC, kept to find the rows of the last bucket after the resample
+    source_ts: pd.Series = pd.to_datetime(df['ts'], utc=True)
+    df['ts']: pd.TimestampSeries = source_ts
+    df: pd.DataFrame = resample_frame(df, agg, fmt)
+    if df.empty:
+        return
+    if append:
+        # Replace the last bucket of the output and append new buckets
+        with open(output_path, 'rb+') as f:
+            f.truncate(manifest['output_offset'])
+        df.to_csv(output_path, index=False, header=False, mode='a')
+    else:
+        df.to_csv(output_path, index=False)
+    # Number of source rows in the last bucket, which is not complete yet
+    nb_rows: int = int((source_ts >= df['ts'].iloc[-1]).sum())
+    if nb_rows < 1:
+        # Without the offset of the last bucket, the next run resamples the whole file.
+        if os.path.isfile(manifest_path):
+            os.remove(manifest_path)
+        print(f"--------------------{filename[:6]} saved--------------------")
+        return
+    manifest: Dict = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'tail_hash': tail_hash(file_path, stat.st_size),
+        'bucket_offset': tail_offset(file_path, nb_rows),
+        'output_offset': tail_offset(output_path, 1),
+        'last_ts': str(df['ts'].iloc[-1])
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    print(f"--------------------{filename[:6]} saved--------------------")
+
+
+def stats_frame(df: pd.DataFrame, agg: Dict[str, str], fmt: str) -> pd.DataFrame:
+    """
+    Resample raw data into statistics. For each column aggregated with 'mean', we keep the sum,
+    the count, the min and the max, so that coarser resolutions can be computed from the result
+    without the raw data. Other columns use their own aggregation.
+
+    :param df:      Dataframe where the column 'ts' contains datetimes.
+    :param agg:     Aggregation to apply for the resample.
+    :param fmt:     Format of the resampling.
+
+    :return:        Return the dataframe of statistics.
+    """
+    named: Dict[str, Tuple[str, str]] = {}
+    for col, how in agg.items():
+        if how == 'mean':
+            named[f"{col}_sum"] = (col, 'sum')
+            named[f"{col}_count"] = (col, 'count')
+            named[f"{col}_min"] = (col, 'min')
+            named[f"{col}_max"] = (col, 'max')
+        else:
+            named[col] = (col, how)
+    return df.groupby(pd.Grouper(key='ts', freq=fmt)).agg(**named).reset_index()
+
+
+def coarsen_stats(df: pd.DataFrame, agg: Dict[str, str], fmt: str) -> pd.DataFrame:
+    """
+    Resample a dataframe of statistics created by stats_frame into a coarser format.
+
+    :param df:      Dataframe of statistics.
+    :param agg:     Aggregation used to create the statistics.
+    :param fmt:     Format of the resampling. It must be a multiple of the format of df.
+
+    :return:        Return the dataframe of statistics.
+    """
+    named: Dict[str, Tuple[str, str]] = {}
+    for col, how in agg.items():
+        if how == 'mean':
+            named[f"{col}_sum"] = (f"{col}_sum", 'sum')
+            named[f"{col}_count"] = (f"{col}_count", 'sum')
+            named[f"{col}_min"] = (f"{col}_min", 'min')
+            named[f"{col}_max"] = (f"{col}_max", 'max')
+        else:
+            named[col] = (col, how)
+    return df.groupby(pd.Grouper(key='ts', freq=fmt)).agg(**named).reset_index()
+
+
+def stats_to_means(df: pd.DataFrame, agg: Dict[str, str]) -> pd.DataFrame:
+    """
+    Replace the sums of a dataframe of statistics by the means. The mean keeps the name of the
+    column, so the result can be used as a resampled dataset.
+
+    :param df:      Dataframe of statistics.
+    :param agg:     Aggregation used to create the statistics.
+
+    :return:        Return the dataframe with the means, the counts, the mins and the maxs.
+    """
+    df: pd.DataFrame = df.copy()
+    for col, how in agg.items():
+        if how == 'mean':
+            df.insert(
+                df.columns.get_loc(f"{col}_sum"), col,
+                df[f"{col}_sum"] / df[f"{col}_count"].where(df[f"{col}_count"] > 0)
+            )
+            df: pd.DataFrame = df.drop(columns=f"{col}_sum")
+    return df
+
+
+def means_to_stats(df: pd.DataFrame, agg: Dict[str, str]) -> pd.DataFrame:
+    """
+    Replace the means of a level of the pyramid by the sums, the inverse of stats_to_means.
+
+    :param df:      Dataframe with the means, the counts, the mins and the maxs.
+    :param agg:     Aggregation used to create the statistics.
+
+    :return:        Return the dataframe of statistics.
+    """
+    df: pd.DataFrame = df.copy()
+    for col, how in agg.items():
+        if how == 'mean':
+            df.insert(
+                df.columns.get_loc(col), f"{col}_sum",
+                (df[col] * df[f"{col}_count"]).fillna(0)
+            )
+            df: pd.DataFrame = df.drop(columns=col)
+    return df
+
+
+def resample_pyramid(
+    file_path: str, path: str, filename: str, agg: Dict[str, str]
+) -> NoReturn:
+    """
+    Resample a file into all levels of PYRAMID_LEVELS with one read of the raw data. The finest
+    level is computed from the raw data and each other level from the previous one. Each level
+    is saved in {path}/{level}/{filename}_{level}.csv with the mean, the min, the max and the
+    count of each column aggregated with 'mean'.
+
+    :param file_path:   Path of the source file.
+    :param path:        Path of the pyramid for the community.
+    :param filename:    Filename.
+    :param agg:         Aggregation to apply for the resample.
+    """
+    print(f"--------------------Processing pyramid of {filename}--------------------")
+    df: pd.DataFrame = pd.read_csv(file_path)
+    # Buckets are computed in local time, so a day goes from midnight to midnight.
+    df['ts']: pd.TimestampSeries = pd.to_datetime(df['ts'], utc=True).dt.tz_convert(TZ)
+    stats: Optional[pd.DataFrame] = None
+    for level in PYRAMID_LEVELS:
+        stats: pd.DataFrame = (
+            stats_frame(df, agg, level) if stats is None else coarsen_stats(stats, agg, level)
+        )
+        if not os.path.isdir(f"{path}/{level}"):
+            os.makedirs(f"{path}/{level}")
+        stats_to_means(stats, agg).to_csv(
+            f"{path}/{level}/{filename[:6]}_{level}.csv", index=False
+        )
+    print(f"--------------------{filename[:6]} pyramid saved--------------------")
+
+
+def pyramid_level(resolution: str) -> str:
+    """
+    Give the coarsest level of the pyramid that answers a query at a given resolution, i.e. the
+    coarsest level dividing the resolution.
+
+    :param resolution:  The resolution of the query (e.g. '15min', '30min', '1D').
+
+    :return:            Return the level.
+    """
+    delta: pd.Timedelta = pd.to_timedelta(resolution)
+    levels: List[str] = [
+        level for level in PYRAMID_LEVELS
+        if delta % pd.to_timedelta(level) == pd.Timedelta(0)
+    ]
+    if not levels:
+        raise ValueError(f"No level of the pyramid answers the resolution {resolution}")
+    return levels[-1]
+
+
+def decimation_positions(values: np.ndarray, nb_bins: int) -> np.ndarray:
+    """
+    Give the positions of the samples to keep to draw series on nb_bins pixels. Samples are split
+    into nb_bins bins of consecutive samples and, for each bin, we keep the first and the last
+    sample and the samples with the min and the max of each series (M4 decimation), so peaks are
+    kept and the drawing is the same at this width.
+
+    :param values:  Array (samples x series) of values. NaN values are ignored.
+    :param nb_bins: Number of bins, i.e. the width in pixels.
+
+    :return:        Return the sorted positions of the kept samples.
+    """
+    nb_samples: int = values.shape[0]
+    if nb_samples <= 4 * nb_bins:
+        return np.arange(nb_samples)
+    bins: np.ndarray = np.arange(nb_samples) * nb_bins // nb_samples
+    starts: np.ndarray = np.flatnonzero(np.diff(bins, prepend=-1))
+    ends: np.ndarray = np.append(starts[1:], nb_samples) - 1
+    positions: List[np.ndarray] = [starts, ends]
+    with np.errstate(invalid='ignore'):
+        for series in values.T:
+            # The first sample of each bin equal to its min and the last one equal to its max. A
+            # bin with only NaN values has no min and no max.
+            is_min: np.ndarray = np.flatnonzero(series == np.fmin.reduceat(series, starts)[bins])
+            is_max: np.ndarray = np.flatnonzero(series == np.fmax.reduceat(series, starts)[bins])
+            positions.append(is_min[np.flatnonzero(np.diff(bins[is_min], prepend=-1))])
+            positions.append(is_max[np.flatnonzero(np.diff(bins[is_max], append=nb_bins))])
+    return np.unique(np.concatenate(positions))
+
+
 def export_to_XLSX(
     matrix: np.ndarray[np.float64],
     home_ids: List[str],